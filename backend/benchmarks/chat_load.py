@@ -0,0 +1,133 @@
+"""
+Load test for POST /api/agents/chat.
+
+Keeps CONCURRENCY chat requests in flight against a running backend and, at
+the same time, probes a cheap route (GET /api/hello by default) every
+PROBE_INTERVAL seconds. If agent execution blocks the event loop the probe
+latency climbs to the length of an LLM round trip; with async execution it
+should stay in the low milliseconds.
+
+Pass --model fake to run against the in-process fake model (see
+controller/modelRegistry.py) and load-test the pipeline without OpenAI;
+set FAKE_LLM_LATENCY_MS on the server to simulate model latency. To test
+the retry/circuit-breaker policy (controller/resilience.py), also set
+FAKE_LLM_FAILURE_RATE, FAKE_LLM_HANG_RATE and FAKE_SEARCH_FAILURE_RATE on
+the server; failed requests are counted by status code.
+
+Usage:
+    python benchmarks/chat_load.py --token <bearer> --session-id <uuid> \
+        --concurrency 20 --duration 60 [--model fake]
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+
+def _request(url, token=None, payload=None, timeout=300):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers=headers)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    return status, time.perf_counter() - start
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def _summary(name, latencies, statuses):
+    ok = sum(1 for s in statuses if s == 200)
+    print(f"{name}: {len(latencies)} requests, {ok} ok")
+    failed = Counter(s for s in statuses if s != 200)
+    if failed:
+        print("  failed: " + ", ".join(f"{status}={count}" for status, count in sorted(failed.items(), key=str)))
+    if latencies:
+        print(f"  p50={_percentile(latencies, 50) * 1000:.1f}ms "
+              f"p95={_percentile(latencies, 95) * 1000:.1f}ms "
+              f"max={max(latencies) * 1000:.1f}ms "
+              f"mean={statistics.mean(latencies) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--session-id", required=True)
+    parser.add_argument("--agent-type", default="general")
+    parser.add_argument("--message", default="Explain photosynthesis briefly")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--probe-path", default="/api/hello")
+    parser.add_argument("--probe-interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    deadline = time.monotonic() + args.duration
+    lock = threading.Lock()
+    chat_latencies, chat_statuses = [], []
+    probe_latencies, probe_statuses = [], []
+
+    def chat_worker():
+        payload = {
+            "session_id": args.session_id,
+            "message": args.message,
+            "agent_type": args.agent_type,
+            "file_ids": [],
+        }
+        if args.model:
+            payload["model"] = args.model
+        while time.monotonic() < deadline:
+            status, elapsed = _request(
+                f"{args.base_url}/api/agents/chat", args.token, payload)
+            with lock:
+                chat_latencies.append(elapsed)
+                chat_statuses.append(status)
+
+    def probe_worker():
+        while time.monotonic() < deadline:
+            status, elapsed = _request(
+                f"{args.base_url}{args.probe_path}", args.token, timeout=60)
+            with lock:
+                probe_latencies.append(elapsed)
+                probe_statuses.append(status)
+            time.sleep(args.probe_interval)
+
+    # Baseline probe latency with no chat traffic
+    idle = [_request(f"{args.base_url}{args.probe_path}", args.token)
+            for _ in range(20)]
+
+    threads = [threading.Thread(target=chat_worker, daemon=True)
+               for _ in range(args.concurrency)]
+    threads.append(threading.Thread(target=probe_worker, daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    _summary(f"{args.probe_path} (idle)",
+             [elapsed for _, elapsed in idle], [status for status, _ in idle])
+    _summary(f"{args.probe_path} (under load)", probe_latencies, probe_statuses)
+    _summary("/api/agents/chat", chat_latencies, chat_statuses)
+
+
+if __name__ == "__main__":
+    main()
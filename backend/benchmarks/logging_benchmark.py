@@ -0,0 +1,93 @@
+"""
+Logging cost per chat turn: print-based payload logging vs structured logging.
+
+Simulates the logging one /chat turn used to do (printing the whole chat
+history and the cleaned agent result) against the structured records that
+replaced it (controller/jsonLogging.py: size-only fields, JSON lines
+written by a background thread). Both write to the same sink, a file by
+default, so the print numbers include the synchronous write the event loop
+used to wait for.
+
+Reports turns per second and the time the calling thread spends logging
+per turn, at LOG_LEVEL=INFO (the default, debug records dropped) and
+LOG_LEVEL=DEBUG (every record formatted and queued).
+
+Usage:
+    python benchmarks/logging_benchmark.py --turns 500 --messages 200 --message-chars 2000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import get_settings  # noqa: E402
+from controller import jsonLogging  # noqa: E402
+
+
+def _payloads(messages, message_chars):
+    text = "lorem ipsum " * (message_chars // 12 + 1)
+    chat_history = [{"type": "human" if i % 2 == 0 else "ai", "content": text[:message_chars]}
+                    for i in range(messages)]
+    result = {"planning_process": text[:message_chars], "answer": text[:message_chars * 2],
+              "key_concepts": [text[:200]] * 10}
+    return chat_history, result
+
+
+def print_turn(chat_history, result):
+    print("chat_history: ", chat_history)
+    print("Got initial data")
+    print("Cleaned result: ", result)
+
+
+def structured_turn(logger, chat_history, result):
+    logger.debug("Loaded chat history", extra={"session_id": "s", "messages": len(chat_history)})
+    logger.debug("Cleaned agent result", extra={"agent_type": "note", "keys": sorted(result)})
+    logger.info("Saved chat turn", extra={"session_id": "s", "agent_type": "note"})
+
+
+def _run(label, turns, fn):
+    start = time.perf_counter()
+    for _ in range(turns):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {turns / elapsed:.0f} turns/s, {elapsed / turns * 1e6:.0f}us per turn",
+          file=sys.__stderr__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--message-chars", type=int, default=2000)
+    parser.add_argument("--sink", default=None, help="File the output goes to (default: a temp file)")
+    args = parser.parse_args()
+
+    chat_history, result = _payloads(args.messages, args.message_chars)
+    sink_path = args.sink or tempfile.mkstemp(suffix=".log")[1]
+
+    with open(sink_path, "w") as sink:
+        sys.stdout = sink
+        try:
+            _run("print payloads", args.turns, lambda: print_turn(chat_history, result))
+
+            for level in ("INFO", "DEBUG"):
+                os.environ["LOG_LEVEL"] = level
+                get_settings.cache_clear()
+                jsonLogging.configure_logging()
+                logger = logging.getLogger("benchmark")
+                _run(f"structured, LOG_LEVEL={level}", args.turns,
+                     lambda: structured_turn(logger, chat_history, result))
+                # Time to drain the queue is paid by the writer thread, not the turn
+                jsonLogging.shutdown_logging()
+        finally:
+            sys.stdout = sys.__stdout__
+
+    print(f"sink: {sink_path} ({os.path.getsize(sink_path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
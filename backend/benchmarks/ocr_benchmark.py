@@ -0,0 +1,85 @@
+"""
+Benchmark for the OCR stage of controller.utilities.extract_text_from_pdf.
+
+Builds a synthetic scanned PDF (every page is an image of text, with no text
+layer) and times ocr_pdf_pages with different worker counts.
+
+Needs the tesseract binary and the backend's .env (importing the controller
+package loads it).
+
+Usage:
+    python benchmarks/ocr_benchmark.py --pages 40 --workers 1 2 4 8 --dpi 200
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from controller.utilities import OCRTimeout, ocr_pdf_pages, shutdown_ocr_pool  # noqa: E402
+
+LINE = "The mitochondria is the powerhouse of the cell. Page {page}, line {line}."
+
+
+def scanned_page_png(page: int, lines: int = 40) -> bytes:
+    """A letter-size page at 150 DPI with lines of text drawn as pixels."""
+    image = Image.new("L", (1275, 1650), color=255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=24)
+    for line in range(lines):
+        draw.text((80, 80 + line * 36), LINE.format(page=page + 1, line=line + 1),
+                  fill=0, font=font)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def synthetic_scanned_pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page(width=612, height=792)
+        page.insert_image(page.rect, stream=scanned_page_png(page_number))
+    return doc.tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Per-document timeout; shows partial results when hit")
+    args = parser.parse_args()
+
+    pdf_bytes = synthetic_scanned_pdf(args.pages)
+    print(f"{args.pages} scanned pages, {len(pdf_bytes) / 1e6:.1f} MB, dpi={args.dpi}")
+
+    # Start the shared pool's worker processes before timing anything
+    ocr_pdf_pages(pdf_bytes, [0, 1], workers=2, dpi=args.dpi)
+
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        try:
+            results = ocr_pdf_pages(pdf_bytes, list(range(args.pages)),
+                                    workers=workers, dpi=args.dpi, timeout=args.timeout)
+        except OCRTimeout as e:
+            results = e.results
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        in_order = all(f"Page {i + 1}," in results[i] for i in results)
+        print(f"workers={workers:<3} {elapsed:7.2f}s  {args.pages / elapsed:6.2f} pages/s  "
+              f"speedup={baseline / elapsed:4.2f}x  pages={len(results)}/{args.pages}  "
+              f"order_ok={in_order}")
+    shutdown_ocr_pool()
+
+
+if __name__ == "__main__":
+    main()
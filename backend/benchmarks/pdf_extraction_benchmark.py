@@ -0,0 +1,93 @@
+"""
+Benchmark for controller.utilities.extract_text_from_pdf on mixed PDFs.
+
+Builds PDFs where a share of the pages are scanned images and the rest have a
+text layer, then compares the per-page pipeline against the previous strategy
+(parse everything, re-parse everything with PyMuPDF if any page is empty, then
+OCR every page). Both use the same parallel OCR stage, so the difference is
+the number of pages OCR'd. The old PyPDF2 pass is left out of the legacy
+timing, which makes its numbers a lower bound.
+
+Needs the tesseract binary and the backend's .env (importing the controller
+package loads it).
+
+Usage:
+    python benchmarks/pdf_extraction_benchmark.py --pages 40 --scanned 0 0.1 0.5 1
+"""
+import argparse
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import controller.utilities as utilities  # noqa: E402
+from ocr_benchmark import LINE, scanned_page_png  # noqa: E402
+
+ocr_calls = {"pages": 0}
+_ocr_pdf_pages = utilities.ocr_pdf_pages
+
+
+def counting_ocr_pdf_pages(pdf_bytes, page_indices, *args, **kwargs):
+    ocr_calls["pages"] += len(page_indices)
+    return _ocr_pdf_pages(pdf_bytes, page_indices, *args, **kwargs)
+
+
+utilities.ocr_pdf_pages = counting_ocr_pdf_pages
+
+
+def mixed_pdf(pages: int, scanned_share: float) -> bytes:
+    scanned = set(range(0, pages, max(1, round(1 / scanned_share)))
+                  ) if scanned_share > 0 else set()
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page(width=612, height=792)
+        if page_number in scanned:
+            page.insert_image(page.rect, stream=scanned_page_png(page_number))
+        else:
+            body = "\n".join(LINE.format(page=page_number + 1, line=line + 1)
+                             for line in range(40))
+            page.insert_text((50, 50), body, fontsize=9)
+    return doc.tobytes()
+
+
+def legacy_extract(pdf_bytes: bytes) -> str:
+    """The previous strategy, minus its PyPDF2 pass."""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_doc:
+        text = [page.get_text() for page in pdf_doc]
+        if all(page_text.strip() for page_text in text):
+            return "\n\n".join(text)
+        page_count = len(pdf_doc)
+    ocr_results = utilities.ocr_pdf_pages(pdf_bytes, list(range(page_count)))
+    return "\n\n".join(ocr_results.get(i, "") for i in range(page_count))
+
+
+def run(name, extract, pdf_bytes):
+    ocr_calls["pages"] = 0
+    start = time.perf_counter()
+    text = extract(pdf_bytes)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<9} {elapsed:7.2f}s  pages_ocrd={ocr_calls['pages']:<4} chars={len(text)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--scanned", type=float, nargs="+",
+                        default=[0.0, 0.1, 0.5, 1.0],
+                        help="Share of scanned pages in each test document")
+    args = parser.parse_args()
+
+    for share in args.scanned:
+        pdf_bytes = mixed_pdf(args.pages, share)
+        print(f"{args.pages} pages, {share:.0%} scanned:")
+        run("legacy", legacy_extract, pdf_bytes)
+        run("per-page", utilities.extract_text_from_pdf, pdf_bytes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Serialization cost of a chat session: the old clean_dict vs controller/serializer.py.
+
+Builds a session of --turns human/AI message pairs plus the agent result
+dict each turn stored (structured fields and the LangChain messages the
+executor returns), then times turning it into JSON-ready data with the
+recursive clean_dict the router used to call and with to_jsonable (orjson,
+schema-aware for messages and pydantic models), alone and followed by the
+JSONB write (json.dumps before, orjson through the engine's json_serializer
+now). Also checks that every message survives to_jsonable and
+message_from_dict unchanged, which clean_dict did not guarantee (it
+rewrote message dicts lacking a "type").
+
+Usage:
+    python benchmarks/serializer_benchmark.py --turns 500 --message-chars 1500 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import orjson  # noqa: E402
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+
+from controller.serializer import dumps, message_from_dict, to_jsonable  # noqa: E402
+
+
+def clean_dict(data: Any) -> Any:
+    """The recursive cleaner routes/agentsRouter.py used before serializer.py, kept as the baseline."""
+    if isinstance(data, dict):
+        cleaned = {}
+        for key, value in data.items():
+            if hasattr(value, '__dict__'):
+                cleaned[key] = clean_dict(value.__dict__)
+            elif isinstance(value, (dict, list)):
+                cleaned[key] = clean_dict(value)
+            elif isinstance(value, (str, int, float, bool)) or value is None:
+                cleaned[key] = value
+            else:
+                cleaned[key] = str(value)
+        if 'content' in cleaned and 'type' not in cleaned:
+            cleaned.update({
+                "type": "human",
+                "additional_kwargs": cleaned.get("additional_kwargs", {}),
+                "response_metadata": cleaned.get("response_metadata", {}),
+                "name": None,
+                "id": None,
+                "example": False
+            })
+        return cleaned
+    elif isinstance(data, list):
+        return [clean_dict(item) for item in data]
+    elif hasattr(data, '__dict__'):
+        return clean_dict(data.__dict__)
+    elif isinstance(data, (str, int, float, bool)) or data is None:
+        return data
+    else:
+        return str(data)
+
+
+def _session(turns, message_chars):
+    text = ("lorem ipsum dolor sit amet " * (message_chars // 27 + 1))[:message_chars]
+    messages, results = [], []
+    for i in range(turns):
+        human = HumanMessage(content=f"question {i}: {text[:200]}", id=f"h{i}")
+        ai = AIMessage(content=text, id=f"a{i}",
+                       additional_kwargs={"function_call": {"name": "NoteOutput", "arguments": "{}"}},
+                       response_metadata={"token_usage": {"prompt_tokens": 900 + i, "completion_tokens": 300},
+                                          "model_name": "gpt-4o"})
+        messages += [human, ai]
+        results.append({
+            "input": human.content,
+            "planning_process": text[:400],
+            "answer": text,
+            "key_concepts": [f"concept {j}" for j in range(10)],
+            "sources": [{"title": f"source {j}", "url": f"https://example.com/{i}/{j}"} for j in range(5)],
+            "messages": [human, ai],
+        })
+    return {"messages": messages, "results": results}
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--message-chars", type=int, default=1500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    session = _session(args.turns, args.message_chars)
+
+    baseline = _time(lambda: clean_dict(session), args.repeat)
+    jsonable = _time(lambda: to_jsonable(session), args.repeat)
+    baseline_stored = _time(lambda: json.dumps(clean_dict(session)), args.repeat)
+    stored = _time(lambda: orjson.dumps(to_jsonable(session)), args.repeat)
+    raw = _time(lambda: dumps(session), args.repeat)
+    print(f"{args.turns}-turn session, best of {args.repeat}:")
+    print(f"  clean_dict:                {baseline * 1e3:8.1f} ms")
+    print(f"  to_jsonable:               {jsonable * 1e3:8.1f} ms ({baseline / jsonable:.1f}x)")
+    print(f"  clean_dict + json.dumps:   {baseline_stored * 1e3:8.1f} ms")
+    print(f"  to_jsonable + orjson:      {stored * 1e3:8.1f} ms ({baseline_stored / stored:.1f}x)")
+    print(f"  dumps (straight to bytes): {raw * 1e3:8.1f} ms ({baseline_stored / raw:.1f}x)")
+
+    restored = [message_from_dict(m) for m in to_jsonable(session)["messages"]]
+    lossless = restored == session["messages"]
+    print(f"messages round-trip losslessly: {lossless}")
+    if not lossless:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
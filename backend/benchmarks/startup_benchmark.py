@@ -0,0 +1,89 @@
+"""
+Startup-time benchmark for the backend.
+
+Measures, over several cold starts in fresh processes:
+  - import: wall time of `import main` (what a new worker pays before it can
+    bind its socket)
+  - first request: time from spawning uvicorn to the first 200 from
+    GET /api/hello
+
+Agents are built on first use, so neither number includes constructing
+them. --agent-type additionally times building one agent in a fresh process
+(needs OPENAI_API_KEY and TAVILY_API_KEY).
+
+Usage:
+    python benchmarks/startup_benchmark.py --runs 5 --port 8765
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _timed_python(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, check=True)
+    return time.perf_counter() - start
+
+
+def time_import():
+    # Subtract interpreter startup so only the application's imports count
+    return _timed_python("import main") - _timed_python("pass")
+
+
+def time_agent_build(agent_type):
+    code = ("from controller.agents import _get_agent; "
+            f"_get_agent({agent_type!r})")
+    return _timed_python(code) - _timed_python("import controller.agents")
+
+
+def time_first_request(port, timeout=120.0):
+    url = f"http://127.0.0.1:{port}/api/hello"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f"No response from {url} after {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _summary(name, values):
+    print(f"{name}: median={statistics.median(values) * 1000:.0f}ms "
+          f"min={min(values) * 1000:.0f}ms max={max(values) * 1000:.0f}ms "
+          f"({len(values)} runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--agent-type", default=None)
+    args = parser.parse_args()
+
+    _summary("import main", [time_import() for _ in range(args.runs)])
+    _summary("spawn -> first request", [time_first_request(args.port) for _ in range(args.runs)])
+    if args.agent_type:
+        _summary(f"build {args.agent_type} agent",
+                 [time_agent_build(args.agent_type) for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Memory benchmark for POST /upload_file request handling.
+
+Feeds a synthetic multipart body through a Starlette Request in chunks, the
+way uvicorn delivers it, and reports the peak Python heap (tracemalloc) of:
+
+    legacy     request.form(), await file.read(), base64 copy, decoded text
+               copy and a BytesIO copy, as the route used to do
+    streaming  controller.uploads.spool_multipart_upload
+
+Needs the backend's .env (importing the controller package loads it).
+
+Usage:
+    python benchmarks/upload_memory_benchmark.py --sizes 10 50 100
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from starlette.requests import Request
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from controller.uploads import spool_multipart_upload  # noqa: E402
+
+BOUNDARY = "----benchmarkboundary"
+CHUNK = 64 * 1024
+
+
+def multipart_request(size: int) -> Request:
+    """A Request whose body is generated chunk by chunk, never held whole."""
+    head = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="session_id"\r\n\r\n'
+        "00000000-0000-0000-0000-000000000000\r\n"
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="lecture.txt"\r\n'
+        "Content-Type: text/plain\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+    line = b"The mitochondria is the powerhouse of the cell.\n"
+    block = (line * (CHUNK // len(line) + 1))[:CHUNK]
+
+    def chunks():
+        yield head
+        remaining = size
+        while remaining > 0:
+            yield block[:min(CHUNK, remaining)]
+            remaining -= CHUNK
+        yield tail
+
+    body = chunks()
+
+    async def receive():
+        chunk = next(body, None)
+        if chunk is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    length = len(head) + size + len(tail)
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/agents/upload_file",
+        "headers": [
+            (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+            (b"content-length", str(length).encode()),
+        ],
+    }
+    return Request(scope, receive)
+
+
+async def legacy(request: Request):
+    form = await request.form()
+    file = form.get("file")
+    file_content = await file.read()
+    base64_data = base64.b64encode(file_content).decode("utf-8")
+    text = file_content.decode("utf-8")
+    copy = BytesIO(file_content)
+    await form.close()
+    return len(base64_data) + len(text) + len(copy.getvalue())
+
+
+async def streaming(request: Request):
+    upload = await spool_multipart_upload(request, max_bytes=1 << 40)
+    upload.cleanup()
+    return upload.size
+
+
+def measure(handler, size: int):
+    request = multipart_request(size)
+    tracemalloc.start()
+    start = time.perf_counter()
+    asyncio.run(handler(request))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100],
+                        help="Upload sizes in MB")
+    args = parser.parse_args()
+
+    for size_mb in args.sizes:
+        size = size_mb * 1024 * 1024
+        print(f"{size_mb} MB upload:")
+        for name, handler in (("legacy", legacy), ("streaming", streaming)):
+            peak, elapsed = measure(handler, size)
+            print(f"  {name:<10} peak={peak / 1e6:8.1f} MB  "
+                  f"({peak / size:5.2f}x file size)  {elapsed:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
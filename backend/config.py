@@ -0,0 +1,144 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Application settings, read once from the environment (and .env).
+
+    Nothing is validated when the settings are loaded, so modules can be
+    imported without credentials; code that needs a value calls require()
+    at the point of use.
+    """
+    openai_api_key: Optional[str]
+    tavily_api_key: Optional[str]
+    jwt_secret: Optional[str]
+    database_url: Optional[str]
+
+    # Connection pool settings. Each request checks out its own connection, so
+    # db_pool_size + db_max_overflow bounds how many requests can hit Postgres at once.
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout: int
+    db_pool_recycle: int
+    db_pool_pre_ping: bool
+    # Worker processes sharing the database (uvicorn/gunicorn WEB_CONCURRENCY).
+    # Each opens up to connection_budget() connections, which must fit in the
+    # server's max_connections (checked at startup, db.check_connection_budget)
+    web_concurrency: int
+
+    # Registry name of the model every agent type uses, unset to use the
+    # per-type routes in controller/modelRegistry.py
+    agent_model: Optional[str]
+    # JSON object of extra model registry entries, name -> ModelSpec fields
+    model_registry: Optional[str]
+    # Upper bound on agent loops in flight at once, so a burst of chats cannot
+    # open an unbounded number of concurrent OpenAI/Tavily requests
+    agent_max_concurrency: int
+    # Admission control in front of agent runs (controller/admission.py):
+    # per-user token bucket, and the queue requests over the cap wait in
+    user_rate_per_minute: float
+    user_burst: int
+    admission_max_queue: int
+    admission_max_queue_per_user: int
+    admission_queue_timeout: float
+    # Outbound call policy (controller/resilience.py). llm_timeout applies to
+    # models whose registry entry sets no timeout; chat_deadline_seconds bounds
+    # a whole chat turn, retries included
+    llm_timeout: float
+    search_timeout: float
+    embedding_timeout: float
+    upstream_max_retries: int
+    upstream_backoff_base: float
+    upstream_backoff_max: float
+    breaker_failure_threshold: int
+    breaker_reset_seconds: float
+    chat_deadline_seconds: float
+
+    # Logging (controller/jsonLogging.py). log_format is "json" or "text";
+    # log_sample_rates is a JSON object of route prefix -> share of requests
+    # whose info/debug records are kept, log_sample_rate the default share
+    log_level: str
+    log_format: str
+    log_field_max_chars: int
+    log_sample_rate: float
+    log_sample_rates: Optional[str]
+    log_queue_size: int
+    # Print every AgentExecutor step to stdout (LangChain verbose mode)
+    agent_verbose: bool
+    # Run chat turns as a LangGraph graph checkpointed in Postgres per session
+    # (controller/agentGraph.py), so an interrupted turn resumes where it
+    # stopped; graph_checkpoints_kept is how many checkpoints a session keeps
+    graph_checkpoints: bool
+    graph_checkpoints_kept: int
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            tavily_api_key=os.getenv("TAVILY_API_KEY"),
+            jwt_secret=os.getenv("JWT_SECRET"),
+            database_url=os.getenv("DATABASE_URL"),
+            db_pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            db_pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+            db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            db_pool_pre_ping=_env_bool("DB_POOL_PRE_PING", "true"),
+            web_concurrency=int(os.getenv("WEB_CONCURRENCY", "1")),
+            agent_model=os.getenv("AGENT_MODEL") or None,
+            model_registry=os.getenv("MODEL_REGISTRY") or None,
+            agent_max_concurrency=int(os.getenv("AGENT_MAX_CONCURRENCY", "16")),
+            user_rate_per_minute=float(os.getenv("USER_RATE_PER_MINUTE", "10")),
+            user_burst=int(os.getenv("USER_BURST", "5")),
+            admission_max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "100")),
+            admission_max_queue_per_user=int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "3")),
+            admission_queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "60")),
+            llm_timeout=float(os.getenv("LLM_TIMEOUT", "120")),
+            search_timeout=float(os.getenv("SEARCH_TIMEOUT", "20")),
+            embedding_timeout=float(os.getenv("EMBEDDING_TIMEOUT", "20")),
+            upstream_max_retries=int(os.getenv("UPSTREAM_MAX_RETRIES", "2")),
+            upstream_backoff_base=float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5")),
+            upstream_backoff_max=float(os.getenv("UPSTREAM_BACKOFF_MAX", "8")),
+            breaker_failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+            breaker_reset_seconds=float(os.getenv("BREAKER_RESET_SECONDS", "30")),
+            chat_deadline_seconds=float(os.getenv("CHAT_DEADLINE_SECONDS", "240")),
+            log_level=os.getenv("LOG_LEVEL", "INFO"),
+            log_format=os.getenv("LOG_FORMAT", "json"),
+            log_field_max_chars=int(os.getenv("LOG_FIELD_MAX_CHARS", "512")),
+            log_sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1")),
+            log_sample_rates=os.getenv("LOG_SAMPLE_RATES") or None,
+            log_queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+            agent_verbose=_env_bool("AGENT_VERBOSE", "false"),
+            graph_checkpoints=_env_bool("GRAPH_CHECKPOINTS", "true"),
+            graph_checkpoints_kept=int(os.getenv("GRAPH_CHECKPOINTS_KEPT", "8")),
+        )
+
+    def connection_budget(self) -> int:
+        """
+        Most database connections one process opens: the app pool, plus one
+        session lock per agent run when chat turns run as checkpointed graphs
+        (db.get_lock_engine).
+        """
+        locks = self.agent_max_concurrency if self.graph_checkpoints else 0
+        return self.db_pool_size + self.db_max_overflow + locks
+
+    def require(self, *names: str) -> None:
+        """Raise ValueError naming every setting in names that is not set."""
+        missing = [name.upper() for name in names if not getattr(self, name)]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)} in .env")
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    load_dotenv()
+    return Settings.from_env()
@@ -1,6 +1,6 @@
 from .validateJWT import validateBearer, validateCookie
 from .utilities import process_file
-from .agents import run_agent_file_content
+from .agents import run_agent_file_content, arun_agent_file_content, astream_agent_file_content
 
 # Import other modules as needed - uncomment when agent functionality is ready
 # from .agents import llm, tavily
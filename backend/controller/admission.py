@@ -0,0 +1,240 @@
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Deque, Dict
+
+from config import get_settings
+
+# Admitted requests whose queue wait is kept for the wait-time percentiles
+WAIT_SAMPLE_SIZE = 1000
+# Weight of the latest run in the moving average of agent run time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """
+    A request was turned away. reason is "rate_limited", "queue_full" or
+    "queue_timeout"; retry_after is the suggested wait in seconds.
+    """
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to burst; each request takes one."""
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token. Returns 0 on success, else seconds until one is available."""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def refund(self) -> None:
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class AdmissionTicket:
+    """A granted slot. release() is idempotent."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self._controller._release(time.monotonic() - self.started)
+
+
+class AdmissionController:
+    """
+    Admission control for agent runs, in front of every LLM call a chat makes.
+
+    - At most max_concurrency runs are in flight in this process.
+    - Each user has a token bucket of user_burst requests refilled at
+      user_rate_per_minute; an empty bucket is rejected as rate_limited.
+    - Over the cap, requests wait in per-user FIFO queues. Freed slots go
+      to the users with waiting requests in round-robin order, so one user's
+      backlog cannot starve the others.
+    - A full queue (max_queue in total or max_queue_per_user for the user)
+      is rejected as queue_full, and a request still queued after
+      queue_timeout seconds as queue_timeout.
+
+    State is per process and must be used from one event loop.
+    """
+
+    def __init__(self, max_concurrency: int, user_rate_per_minute: float, user_burst: int,
+                 max_queue: int, max_queue_per_user: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.queue_full = 0
+        self.queue_timeouts = 0
+        self.avg_service_time = 0.0
+        # Users with waiting requests, in the order they are served next
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLE_SIZE)
+
+    def _bucket(self, user: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            # Buckets that have refilled carry no state; drop them now and then
+            if len(self._buckets) >= 10000:
+                self._buckets = {key: b for key, b in self._buckets.items() if not b.full(now)}
+            bucket = self._buckets[user] = TokenBucket(self.user_rate, self.user_burst, now)
+        return bucket
+
+    def _retry_after(self) -> float:
+        # Time for the runs ahead of a new request to drain, at least a second
+        service = self.avg_service_time or 10.0
+        return max(1.0, service * (self._queued + 1) / self.max_concurrency)
+
+    async def acquire(self, user: str) -> AdmissionTicket:
+        """
+        Wait for a slot for one of user's agent runs.
+
+        Raises:
+            AdmissionRejected: The user is over their rate, the queue is
+                full, or no slot freed up within queue_timeout
+        """
+        now = time.monotonic()
+        bucket = self._bucket(user, now)
+        wait = bucket.take(now)
+        if wait > 0:
+            self.rate_limited += 1
+            raise AdmissionRejected("rate_limited", wait)
+
+        if self.in_flight < self.max_concurrency and not self._queued:
+            return self._admit(0.0)
+
+        queue = self._queues.get(user)
+        if self._queued >= self.max_queue or (queue and len(queue) >= self.max_queue_per_user):
+            bucket.refund()
+            self.queue_full += 1
+            raise AdmissionRejected("queue_full", self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[user] = deque()
+        queue.append(future)
+        self._queued += 1
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if future.done():
+                # Granted as the caller went away; hand the slot on
+                self._release(0.0)
+            else:
+                self._dequeue(user, future)
+            raise
+
+        if not future.done():
+            self._dequeue(user, future)
+            bucket.refund()
+            self.queue_timeouts += 1
+            raise AdmissionRejected("queue_timeout", self._retry_after())
+        return self._admit(time.monotonic() - now, counted=True)
+
+    def _admit(self, waited: float, counted: bool = False) -> AdmissionTicket:
+        # counted: the slot was already taken when the request was granted
+        if not counted:
+            self.in_flight += 1
+        self.admitted += 1
+        self._waits.append(waited)
+        return AdmissionTicket(self)
+
+    def _dequeue(self, user: str, future: asyncio.Future) -> None:
+        queue = self._queues.get(user)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self._queued -= 1
+            if not queue:
+                del self._queues[user]
+        future.cancel()
+
+    def _release(self, service_time: float) -> None:
+        self.in_flight -= 1
+        if service_time:
+            self.avg_service_time += SERVICE_TIME_SMOOTHING * (service_time - self.avg_service_time)
+        self._grant()
+
+    def _grant(self) -> None:
+        while self.in_flight < self.max_concurrency and self._queues:
+            user, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def percentile(pct):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(round(pct / 100 * (len(waits) - 1))))] * 1000
+
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": self._queued,
+            "queued_users": len(self._queues),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "queue_full": self.queue_full,
+            "queue_timeouts": self.queue_timeouts,
+            "wait_ms_p50": percentile(50),
+            "wait_ms_p95": percentile(95),
+            "wait_ms_max": waits[-1] * 1000 if waits else 0.0,
+            "avg_service_seconds": self.avg_service_time,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_admission() -> AdmissionController:
+    settings = get_settings()
+    return AdmissionController(
+        max_concurrency=settings.agent_max_concurrency,
+        user_rate_per_minute=settings.user_rate_per_minute,
+        user_burst=settings.user_burst,
+        max_queue=settings.admission_max_queue,
+        max_queue_per_user=settings.admission_max_queue_per_user,
+        queue_timeout=settings.admission_queue_timeout,
+    )
@@ -0,0 +1,232 @@
+import time
+import logging
+from dataclasses import asdict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, TypedDict
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, START, StateGraph
+
+from config import get_settings
+from .agents import (
+    StreamEventTranslator,
+    _build_messages,
+    _get_agent,
+    _update_chat_history,
+    arun_agent_file_content,
+    astream_agent_file_content,
+)
+from .checkpointer import get_checkpointer
+from .memory import MemoryState, aprepare_history
+from .modelRegistry import ModelSpec
+from .resilience import deadline, iterate_within_deadline, within_deadline
+from .telemetry import AgentMetricsHandler, observe_stage, span
+
+logger = logging.getLogger(__name__)
+
+
+class ChatTurnState(TypedDict, total=False):
+    """
+    State of a session's chat graph, checkpointed per session after every
+    node (controller/checkpointer.py).
+
+    The history itself is not part of it: session_messages is its only
+    store, and a run reads it from config["configurable"]["chat_history"],
+    which is not checkpointed. A checkpoint holds the rolling summary and
+    the turn in progress, so its size does not grow with the session.
+    """
+    # Rolling summary of the history's older part (see memory.MemoryState)
+    summary: Optional[str]
+    summary_seq: int
+    # The turn in progress; history_len is the number of history entries it
+    # was started with, model holds ModelSpec fields
+    history_len: int
+    topic_request: str
+    file_content: Optional[str]
+    agent_type: str
+    model: Optional[Dict[str, Any]]
+    history_messages: List[BaseMessage]
+    result: Any
+
+
+async def _prepare_history_node(state: ChatTurnState, config: RunnableConfig):
+    memory = MemoryState(state.get("summary"), state.get("summary_seq") or 0)
+    with span("agent.prepare_history", state["agent_type"]):
+        history_messages = await aprepare_history(
+            config["configurable"].get("chat_history") or [], state["agent_type"], memory)
+    return {"history_messages": history_messages, "summary": memory.summary,
+            "summary_seq": memory.summary_seq}
+
+
+async def _run_agent_node(state: ChatTurnState, config: RunnableConfig):
+    model = ModelSpec(**state["model"]) if state.get("model") else None
+    messages, _ = _build_messages(
+        state["topic_request"], state.get("file_content"), state.get("history_messages"))
+    # The graph's config carries the run's callbacks down to the executor
+    result = await _get_agent(state["agent_type"], model).ainvoke({"messages": messages}, config=config)
+    return {"result": result}
+
+
+def _record_node(state: ChatTurnState):
+    # Retrieved file text and prompt messages are only needed within the turn
+    return {"history_messages": [], "file_content": None}
+
+
+@lru_cache(maxsize=1)
+def get_chat_graph():
+    """
+    The chat turn as a graph, prepare_history -> run_agent -> record, with
+    the Postgres checkpointer. Each session is a thread, keyed by session id.
+    """
+    builder = StateGraph(ChatTurnState)
+    builder.add_node("prepare_history", _prepare_history_node)
+    builder.add_node("run_agent", _run_agent_node)
+    builder.add_node("record", _record_node)
+    builder.add_edge(START, "prepare_history")
+    builder.add_edge("prepare_history", "run_agent")
+    builder.add_edge("run_agent", "record")
+    builder.add_edge("record", END)
+    return builder.compile(checkpointer=get_checkpointer())
+
+
+def graph_enabled(session_id) -> bool:
+    return bool(session_id) and get_settings().graph_checkpoints
+
+
+async def _turn_input(graph, config: RunnableConfig, topic_request, file_content, agent_type,
+                      chat_history: List[dict], memory: MemoryState, model: Optional[ModelSpec]):
+    """
+    The graph input for a turn, or None to resume the session's interrupted
+    turn when it was for the same message on the same history.
+
+    session_messages is append-only, so a history of the same length is the
+    one the interrupted turn started from. The summary stored with the
+    session is sent with every new turn; turns saved without the graph
+    (batch and cached answers) may have moved it on.
+    """
+    snapshot = await graph.aget_state(config)
+    values = snapshot.values or {}
+
+    if snapshot.next:
+        if (values.get("history_len") == len(chat_history)
+                and values.get("topic_request") == topic_request
+                and values.get("agent_type") == agent_type):
+            logger.info("Resuming interrupted chat turn", extra={
+                "session_id": config["configurable"]["thread_id"], "next": list(snapshot.next)})
+            return None
+        # Steps left from a turn for another message must not run in this one
+        await get_checkpointer().adelete_thread(config["configurable"]["thread_id"])
+
+    return {
+        "summary": memory.summary,
+        "summary_seq": memory.summary_seq,
+        "history_len": len(chat_history),
+        "topic_request": topic_request,
+        "file_content": file_content,
+        "agent_type": agent_type,
+        "model": asdict(model) if model else None,
+        "result": None,
+    }
+
+
+def _turn_output(state: ChatTurnState, topic_request, chat_history: List[dict], memory: MemoryState):
+    """The run's (result, updated chat history), updating memory from its final state."""
+    memory.summary, memory.summary_seq = state.get("summary"), state.get("summary_seq") or 0
+    _, message_content = _build_messages(topic_request)
+    updated = _update_chat_history(list(chat_history), message_content, state["result"])
+    return state["result"], updated
+
+
+async def arun_graph_turn(topic_request, file_content=None, agent_type="note", session_id=None, chat_history=None, memory=None, model=None):
+    """
+    arun_agent_file_content as a checkpointed graph run on the session's
+    thread. Same arguments and return value.
+
+    The turn in progress and the rolling summary are checkpointed in
+    Postgres after every step (the history stays in session_messages), so a
+    turn that failed or was cut off part way resumes after its last
+    finished step when the same message is sent again, on any worker.
+
+    Turns on one session run one at a time, in every worker (see
+    checkpointer.ThreadLock); waiting for the lock counts against the chat
+    deadline.
+
+    Falls back to arun_agent_file_content without a session_id or with
+    GRAPH_CHECKPOINTS=false.
+    """
+    if not graph_enabled(session_id):
+        return await arun_agent_file_content(
+            topic_request, file_content, agent_type, session_id, chat_history, memory, model)
+    # Unknown agent types fail here, before anything is checkpointed
+    _get_agent(agent_type, model)
+    chat_history = chat_history if chat_history is not None else []
+    memory = memory if memory is not None else MemoryState()
+
+    graph = get_chat_graph()
+    metrics = AgentMetricsHandler(agent_type)
+    config = {"configurable": {"thread_id": str(session_id), "chat_history": chat_history},
+              "callbacks": [metrics]}
+    lock = get_checkpointer().thread_lock(session_id)
+    with span("agent.run", agent_type) as run_span, deadline(get_settings().chat_deadline_seconds):
+        await within_deadline(lock.acquire())
+        try:
+            turn = await within_deadline(_turn_input(
+                graph, config, topic_request, file_content, agent_type, chat_history, memory, model))
+            state = await within_deadline(graph.ainvoke(turn, config))
+        finally:
+            await lock.release()
+        run_span.set(**metrics.summary())
+
+    return _turn_output(state, topic_request, chat_history, memory)
+
+
+async def astream_graph_turn(topic_request, file_content=None, agent_type="note", session_id=None, chat_history=None, memory=None, model=None):
+    """
+    astream_agent_file_content as a checkpointed graph run, see
+    arun_graph_turn. Yields the same events.
+    """
+    if not graph_enabled(session_id):
+        async for event in astream_agent_file_content(
+                topic_request, file_content, agent_type, session_id, chat_history, memory, model):
+            yield event
+        return
+    _get_agent(agent_type, model)
+    chat_history = chat_history if chat_history is not None else []
+    memory = memory if memory is not None else MemoryState()
+
+    graph = get_chat_graph()
+    metrics = AgentMetricsHandler(agent_type)
+    config = {"configurable": {"thread_id": str(session_id), "chat_history": chat_history},
+              "callbacks": [metrics]}
+    translator = StreamEventTranslator(agent_type)
+    lock = get_checkpointer().thread_lock(session_id)
+    state = None
+    # Timed by hand: span() cannot be held across this generator's yields
+    started = time.perf_counter()
+    with deadline(get_settings().chat_deadline_seconds):
+        await within_deadline(lock.acquire())
+        try:
+            turn = await within_deadline(_turn_input(
+                graph, config, topic_request, file_content, agent_type, chat_history, memory, model))
+            async for event in iterate_within_deadline(graph.astream_events(turn, config, version="v2")):
+                # The graph's own end event carries this run's final state
+                if event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                    state = event["data"]["output"]
+                    continue
+                # Leaves out the summary model's tokens from prepare_history
+                if (event.get("metadata") or {}).get("langgraph_node") != "run_agent":
+                    continue
+                for translated in translator.translate(event):
+                    yield translated
+        finally:
+            await lock.release()
+    if state is None:
+        raise RuntimeError("Chat graph run ended without a final state")
+
+    observe_stage("agent.run", agent_type, time.perf_counter() - started)
+    result, updated_history = _turn_output(state, topic_request, chat_history, memory)
+    yield {"event": "result", "data": {
+        "result": result,
+        "chat_history": updated_history,
+    }}
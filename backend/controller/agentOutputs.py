@@ -72,3 +72,15 @@ class FeynmanResponse(BaseModel):
     examples: str = Field(
         description="Analogies, examples, and visual descriptions")
     summary: str = Field(description="Brief summary of the key takeaways")
+
+
+# Output model for each agent type, keyed like the agent_type request field
+AGENT_OUTPUT_MODELS = {
+    "general": GeneralResponse,
+    "note": NoteResponse,
+    "research": ResearchResponse,
+    "step": StepResponse,
+    "diagram": DiagramResponse,
+    "flashcard": FlashcardResponse,
+    "feynman": FeynmanResponse,
+}
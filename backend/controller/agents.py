@@ -1,44 +1,62 @@
-from langchain.agents import create_react_agent, AgentExecutor
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_tavily import TavilySearch
-from langchain.chat_models import init_chat_model
-from langgraph.prebuilt import create_react_agent
+from langchain.agents import AgentExecutor
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage, FunctionMessage
-from langchain_tavily import TavilySearch
-from .utilities import process_file
+from langchain_core.messages import HumanMessage
+from .agentOutputs import AGENT_OUTPUT_MODELS
+from .memory import prepare_history, aprepare_history
+from .searchCache import CachedSearchTool
+from .modelRegistry import ModelSpec, resolve_model, get_chat_model
+from .resilience import guard_model, guard_tool, deadline, within_deadline, iterate_within_deadline
+from .telemetry import AgentMetricsHandler, span, observe_stage
 import json
+import time
+import asyncio
+import hashlib
 from typing import List, Dict, Any, Optional
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain.agents.format_scratchpad import format_to_openai_function_messages
 from langchain_core.agents import AgentActionMessageLog, AgentFinish
+from langchain_core.utils.json import parse_partial_json
 import os
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import START, MessagesState, StateGraph
+from functools import lru_cache
 
-from dotenv import load_dotenv
-from functools import partial
+from config import get_settings
 
-load_dotenv()
 
-TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-os.environ["TAVILY_API_KEY"] = TAVILY_API_KEY
-if not TAVILY_API_KEY or not OPENAI_API_KEY:
-    raise ValueError("Missing TAVILY_API_KEY or OPENAI_API_KEY in .env")
+# Share of offline (FakeSearchTool) searches that fail, for fault injection
+FAKE_SEARCH_FAILURE_RATE = float(os.getenv("FAKE_SEARCH_FAILURE_RATE", "0"))
 
-tool = TavilySearch(
-    max_results=5,
-    include_images=True,
-    search_depth="advanced",
-)
 
-llm = init_chat_model("gpt-4o", api_key=OPENAI_API_KEY,
-                      temperature=.7, max_tokens=7500)
+@lru_cache(maxsize=2)
+def get_search_tool(offline=False):
+    """
+    The search tool shared by all agents, built on first use. Identical
+    queries are served from the search cache and concurrent ones share a
+    single Tavily request; Tavily calls run under the retry policy and
+    circuit breaker in resilience.py. offline gives the deterministic
+    FakeSearchTool, used with the fake model so load tests need no API keys.
+    """
+    if offline:
+        from .fakeLLM import FakeSearchTool
+        return guard_tool(FakeSearchTool(failure_rate=FAKE_SEARCH_FAILURE_RATE), "fake")
+
+    from langchain_tavily import TavilySearch
+
+    settings = get_settings()
+    settings.require("tavily_api_key")
+    # The Tavily client reads its key from the environment
+    os.environ["TAVILY_API_KEY"] = settings.tavily_api_key
+    return CachedSearchTool(
+        guard_tool(
+            TavilySearch(
+                max_results=5,
+                include_images=True,
+                search_depth="advanced",
+            ),
+            "tavily",
+        ),
+        namespace="tavily:advanced:5:images",
+    )
 
-tools = [tool]
 
 cot_planning_template = """
 Before answering, I will take these planning steps:
@@ -203,7 +221,7 @@ def parse_general_output(output):
     return parse_output(output, GeneralResponse)
 
 
-def create_note_taking_agent():
+def create_note_taking_agent(model: Optional[ModelSpec] = None):
     system_prompt = f"""You are an expert note-taking assistant that creates clear, concise, and well-structured notes.
 
 
@@ -229,8 +247,12 @@ When returning your notes, use the structured output format with these fields:
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
+    model = model or resolve_model("note")
+    tool = get_search_tool(offline=model.provider == "fake")
+    llm = get_chat_model(model)
     llm_with_tools = llm.bind_functions([tool, NoteResponse])
-    llm_with_tools = llm_with_tools.with_structured_output(NoteResponse)
+    llm_with_tools = guard_model(
+        llm_with_tools.with_structured_output(NoteResponse), model)
 
     agent = (
         {
@@ -244,10 +266,10 @@ When returning your notes, use the structured output format with these fields:
         | parse_general_output
     )
 
-    return AgentExecutor(tools=[tool], agent=agent, verbose=True)
+    return AgentExecutor(tools=[tool], agent=agent, verbose=get_settings().agent_verbose)
 
 
-def create_research_agent():
+def create_research_agent(model: Optional[ModelSpec] = None):
     system_prompt = f"""You are an expert research-based note-taking assistant that creates comprehensive notes with proper citations.
 
 {cot_planning_template}
@@ -272,8 +294,12 @@ When returning your notes, use the structured output format with these fields:
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
+    model = model or resolve_model("research")
+    tool = get_search_tool(offline=model.provider == "fake")
+    llm = get_chat_model(model)
     llm_with_tools = llm.bind_functions([tool, ResearchResponse])
-    llm_with_tools = llm_with_tools.with_structured_output(ResearchResponse)
+    llm_with_tools = guard_model(
+        llm_with_tools.with_structured_output(ResearchResponse), model)
 
     agent = (
         {
@@ -287,10 +313,10 @@ When returning your notes, use the structured output format with these fields:
         | parse_research_output
     )
 
-    return AgentExecutor(tools=[tool], agent=agent, verbose=True)
+    return AgentExecutor(tools=[tool], agent=agent, verbose=get_settings().agent_verbose)
 
 
-def create_step_agent():
+def create_step_agent(model: Optional[ModelSpec] = None):
     system_prompt = f"""You are an expert step-by-step problem-solving assistant that breaks down complex problems.
 
 {cot_planning_template}
@@ -316,8 +342,12 @@ When returning your solution, use the structured output format with these fields
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
+    model = model or resolve_model("step")
+    tool = get_search_tool(offline=model.provider == "fake")
+    llm = get_chat_model(model)
     llm_with_tools = llm.bind_functions([tool, StepResponse])
-    llm_with_tools = llm_with_tools.with_structured_output(StepResponse)
+    llm_with_tools = guard_model(
+        llm_with_tools.with_structured_output(StepResponse), model)
 
     agent = (
         {
@@ -331,10 +361,10 @@ When returning your solution, use the structured output format with these fields
         | parse_step_output
     )
 
-    return AgentExecutor(tools=[tool], agent=agent, verbose=True)
+    return AgentExecutor(tools=[tool], agent=agent, verbose=get_settings().agent_verbose)
 
 
-def create_diagram_agent():
+def create_diagram_agent(model: Optional[ModelSpec] = None):
     system_prompt = f"""You are an expert diagram-generating assistant that creates clear, informative diagrams.
 
 {cot_planning_template}
@@ -370,8 +400,12 @@ When returning your diagram, use the structured output format with these fields:
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
+    model = model or resolve_model("diagram")
+    tool = get_search_tool(offline=model.provider == "fake")
+    llm = get_chat_model(model)
     llm_with_tools = llm.bind_functions([tool, DiagramResponse])
-    llm_with_tools = llm_with_tools.with_structured_output(DiagramResponse)
+    llm_with_tools = guard_model(
+        llm_with_tools.with_structured_output(DiagramResponse), model)
     agent = (
         {
             "messages": lambda x: x["messages"],
@@ -384,10 +418,10 @@ When returning your diagram, use the structured output format with these fields:
         | parse_diagram_output
     )
 
-    return AgentExecutor(tools=[tool], agent=agent, verbose=True)
+    return AgentExecutor(tools=[tool], agent=agent, verbose=get_settings().agent_verbose)
 
 
-def create_flashcard_agent():
+def create_flashcard_agent(model: Optional[ModelSpec] = None):
     system_prompt = f"""You are an expert flashcard-generating assistant that creates effective study materials.
 
 {cot_planning_template}
@@ -413,8 +447,12 @@ When returning your flashcards, use the structured output format with these fiel
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
+    model = model or resolve_model("flashcard")
+    tool = get_search_tool(offline=model.provider == "fake")
+    llm = get_chat_model(model)
     llm_with_tools = llm.bind_functions([tool, FlashcardResponse])
-    llm_with_tools = llm_with_tools.with_structured_output(FlashcardResponse)
+    llm_with_tools = guard_model(
+        llm_with_tools.with_structured_output(FlashcardResponse), model)
 
     agent = (
         {
@@ -428,10 +466,10 @@ When returning your flashcards, use the structured output format with these fiel
         | parse_flashcard_output
     )
 
-    return AgentExecutor(tools=[tool], agent=agent, verbose=True)
+    return AgentExecutor(tools=[tool], agent=agent, verbose=get_settings().agent_verbose)
 
 
-def create_feynman_agent():
+def create_feynman_agent(model: Optional[ModelSpec] = None):
     system_prompt = f"""You are an expert Feynman technique assistant that simplifies complex concepts.
 
 {cot_planning_template}
@@ -459,8 +497,12 @@ When returning your explanation, use the structured output format with these fie
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
+    model = model or resolve_model("feynman")
+    tool = get_search_tool(offline=model.provider == "fake")
+    llm = get_chat_model(model)
     llm_with_tools = llm.bind_functions([tool, FeynmanResponse])
-    llm_with_tools = llm_with_tools.with_structured_output(FeynmanResponse)
+    llm_with_tools = guard_model(
+        llm_with_tools.with_structured_output(FeynmanResponse), model)
     agent = (
         {
             "messages": lambda x: x["messages"],
@@ -473,10 +515,10 @@ When returning your explanation, use the structured output format with these fie
         | parse_feynman_output
     )
 
-    return AgentExecutor(tools=[tool], agent=agent, verbose=True)
+    return AgentExecutor(tools=[tool], agent=agent, verbose=get_settings().agent_verbose)
 
 
-def create_general_agent():
+def create_general_agent(model: Optional[ModelSpec] = None):
     system_prompt = f"""You are an expert assistant that answers the User's query in detail, and can search the web if needed
     {cot_planning_template}
     
@@ -492,8 +534,12 @@ def create_general_agent():
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
+    model = model or resolve_model("general")
+    tool = get_search_tool(offline=model.provider == "fake")
+    llm = get_chat_model(model)
     llm_with_tools = llm.bind_functions([tool, GeneralResponse])
-    llm_with_tools = llm_with_tools.with_structured_output(GeneralResponse)
+    llm_with_tools = guard_model(
+        llm_with_tools.with_structured_output(GeneralResponse), model)
     agent = (
         {
             "messages": lambda x: x["messages"],
@@ -506,73 +552,98 @@ def create_general_agent():
         | parse_general_output
     )
 
-    return AgentExecutor(tools=[tool], agent=agent, verbose=True)
+    return AgentExecutor(tools=[tool], agent=agent, verbose=get_settings().agent_verbose)
 
 
-general_agent = create_general_agent()
-note_agent = create_note_taking_agent()
-research_agent = create_research_agent()
-step_agent = create_step_agent()
-diagram_agent = create_diagram_agent()
-flashcard_agent = create_flashcard_agent()
-feynman_agent = create_feynman_agent()
+AGENT_FACTORIES = {
+    "note": create_note_taking_agent,
+    "research": create_research_agent,
+    "step": create_step_agent,
+    "diagram": create_diagram_agent,
+    "flashcard": create_flashcard_agent,
+    "feynman": create_feynman_agent,
+    "general": create_general_agent,
+}
 
 
-def run_agent_file_content(topic_request, file_content=None, agent_type="note", session_id=None, chat_history=None):
-    """
-    Run the specified agent with the given topic and optional files, maintaining conversation history.
+@lru_cache(maxsize=64)
+def _build_agent(agent_type, model):
+    return AGENT_FACTORIES[agent_type](model)
 
-    Args:
-        topic_request (str): The topic to process
-        file_contaent (list): Optional list of file content after uploading
-        agent_type (str): Type of agent to use 
-        session_id (str): Optional session ID for persistence
-        chat_history (list): Optional list of previous messages
 
-    Returns:
-        dict: Structured output from the agent
+def _get_agent(agent_type, model=None):
+    """
+    Return the AgentExecutor for agent_type running on model (the agent
+    type's routed model by default), building it on first use. Importing
+    this module builds nothing, so it needs no API keys.
     """
-    agent_map = {
-        "note": note_agent,
-        "research": research_agent,
-        "step": step_agent,
-        "diagram": diagram_agent,
-        "flashcard": flashcard_agent,
-        "feynman": feynman_agent,
-        "general": general_agent
-    }
-
-    selected_agent = agent_map.get(agent_type)
-    if not selected_agent:
+    if agent_type not in AGENT_FACTORIES:
         raise ValueError(f"Unknown agent type: {agent_type}")
+    return _build_agent(agent_type, model or resolve_model(agent_type))
 
+
+@lru_cache(maxsize=64)
+def agent_fingerprint(agent_type, model=None):
+    """
+    Hash of what shapes an agent's answer besides its input: the prompt
+    templates built in its create_*_agent function, its output model and
+    the model settings. Editing a prompt changes the fingerprint.
+    """
+    model = model or resolve_model(agent_type)
+    selected_agent = _get_agent(agent_type, model)
+    steps = getattr(getattr(selected_agent.agent, "runnable", None), "steps", [])
+    templates = [
+        message.prompt.template
+        for step in steps if isinstance(step, ChatPromptTemplate)
+        for message in step.messages if hasattr(message, "prompt")
+    ]
+    raw = json.dumps({
+        "templates": templates or [repr(selected_agent.agent)],
+        "output": AGENT_OUTPUT_MODELS[agent_type].model_json_schema(),
+        "model": [model.provider, model.model, model.temperature, model.max_tokens],
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cached_turn(topic_request, result, chat_history=None):
+    """
+    Record a turn answered from the response cache in the chat history, the
+    same way run_agent_file_content records an agent run.
+
+    Returns:
+        tuple: (result, chat_history)
+    """
     if chat_history is None:
         chat_history = []
+    _, message_content = _build_messages(topic_request)
+    return result, _update_chat_history(chat_history, message_content, result)
+
 
-    langchain_messages = []
-    for message in chat_history:
-        if message['type'] == 'human':
-            langchain_messages.append(HumanMessage(content=message['content']))
-        elif message['type'] == 'ai':
-            # Truncate the AI message to limit token usage
-            # Adjust the length as needed
-            truncated_content = message['content'][:1000]
-            langchain_messages.append(AIMessage(content=truncated_content))
+def _build_messages(topic_request, file_content=None, history_messages=None):
+    """
+    Build the LangChain message list for a turn.
+
+    history_messages is the conversation history already fitted to the
+    agent's token budget by memory.prepare_history. file_content is the
+    reference text retrieved for this turn. It is sent to the model but left
+    out of message_content, so the stored history does not carry every
+    turn's excerpts into later prompts.
+
+    Returns:
+        tuple: (messages, message_content) where message_content is the new human
+        message as recorded in the chat history
+    """
+    message_content = f"Please process this topic: {topic_request}"
     if file_content:
-        message_content = f"Please process this topic: {topic_request}. Use the following file content as reference:\n\n{file_content}"
+        new_message = HumanMessage(
+            content=f"{message_content}. Use the following file content as reference:\n\n{file_content}")
     else:
-        message_content = f"Please process this topic: {topic_request}"
+        new_message = HumanMessage(content=message_content)
 
-    new_message = HumanMessage(content=message_content)
+    return list(history_messages or []) + [new_message], message_content
 
-    messages = langchain_messages + [new_message]
-
-    result = selected_agent.invoke(
-        {
-            "messages": messages
-        }
-    )
 
+def _update_chat_history(chat_history, message_content, result):
     chat_history.append({"type": "human", "content": message_content})
 
     if isinstance(result, dict):
@@ -601,7 +672,211 @@ def run_agent_file_content(topic_request, file_content=None, agent_type="note",
 
         chat_history.append({"type": "ai", "content": ai_content})
 
-    return result, chat_history
+    return chat_history
+
+
+def run_agent_file_content(topic_request, file_content=None, agent_type="note", session_id=None, chat_history=None, memory=None, model=None):
+    """
+    Run the specified agent with the given topic and optional files, maintaining conversation history.
+
+    This blocks the calling thread for the whole agent loop; request handlers
+    should use arun_agent_file_content instead.
+
+    Args:
+        topic_request (str): The topic to process
+        file_contaent (list): Optional list of file content after uploading
+        agent_type (str): Type of agent to use 
+        session_id (str): Optional session ID for persistence
+        chat_history (list): Optional list of previous messages
+        memory (MemoryState): Optional rolling summary of the session, updated in
+            place when older turns are folded into it
+        model (ModelSpec): Optional model for this run, see modelRegistry.resolve_model;
+            the agent type's routed model by default
+
+    Returns:
+        dict: Structured output from the agent
+    """
+    selected_agent = _get_agent(agent_type, model)
+
+    if chat_history is None:
+        chat_history = []
+
+    with span("agent.run", agent_type) as run_span, deadline(get_settings().chat_deadline_seconds):
+        with span("agent.prepare_history", agent_type):
+            history_messages = prepare_history(chat_history, agent_type, memory)
+        messages, message_content = _build_messages(
+            topic_request, file_content, history_messages)
+
+        metrics = AgentMetricsHandler(agent_type)
+        result = selected_agent.invoke(
+            {
+                "messages": messages
+            },
+            config={"callbacks": [metrics]}
+        )
+        run_span.set(**metrics.summary())
+
+    return result, _update_chat_history(chat_history, message_content, result)
+
+
+async def arun_agent_file_content(topic_request, file_content=None, agent_type="note", session_id=None, chat_history=None, memory=None, model=None):
+    """
+    Async version of run_agent_file_content.
+
+    Uses AgentExecutor.ainvoke so the LLM and Tavily round trips never block
+    the event loop. Callers limit how many runs are in flight with
+    controller/admission.py. The whole run, retries included, must finish
+    within CHAT_DEADLINE_SECONDS or resilience.DeadlineExceeded is raised.
+
+    Args:
+        topic_request (str): The topic to process
+        file_content (dict): Optional file content after uploading
+        agent_type (str): Type of agent to use
+        session_id (str): Optional session ID for persistence
+        chat_history (list): Optional list of previous messages
+        memory (MemoryState): Optional rolling summary of the session, updated in
+            place when older turns are folded into it
+        model (ModelSpec): Optional model for this run, see modelRegistry.resolve_model;
+            the agent type's routed model by default
+
+    Returns:
+        tuple: (result, chat_history)
+    """
+    selected_agent = _get_agent(agent_type, model)
+
+    if chat_history is None:
+        chat_history = []
+
+    with span("agent.run", agent_type) as run_span, deadline(get_settings().chat_deadline_seconds):
+        with span("agent.prepare_history", agent_type):
+            history_messages = await within_deadline(
+                aprepare_history(chat_history, agent_type, memory))
+        messages, message_content = _build_messages(
+            topic_request, file_content, history_messages)
+
+        metrics = AgentMetricsHandler(agent_type)
+        result = await within_deadline(selected_agent.ainvoke(
+            {
+                "messages": messages
+            },
+            config={"callbacks": [metrics]}
+        ))
+        run_span.set(**metrics.summary())
+
+    return result, _update_chat_history(chat_history, message_content, result)
+
+
+class StreamEventTranslator:
+    """
+    Turns the astream_events (v2) events of an agent run into the token,
+    partial and tool_start / tool_end events astream_agent_file_content
+    yields. One per run: it tracks the function call arguments streamed so far.
+    """
+
+    def __init__(self, agent_type):
+        self.output_fields = set(AGENT_OUTPUT_MODELS[agent_type].model_fields)
+        self.arguments = ""
+        self.last_partial = None
+
+    def translate(self, event) -> List[Dict[str, Any]]:
+        kind = event["event"]
+
+        if kind == "on_chat_model_start":
+            # Each step of the agent loop is a fresh model call
+            self.arguments = ""
+        elif kind == "on_chat_model_stream":
+            events = []
+            chunk = event["data"]["chunk"]
+            if chunk.content:
+                events.append({"event": "token", "data": {"content": chunk.content}})
+
+            delta = ""
+            for tool_chunk in getattr(chunk, "tool_call_chunks", None) or []:
+                delta += tool_chunk.get("args") or ""
+            if not delta:
+                function_call = chunk.additional_kwargs.get(
+                    "function_call") or {}
+                delta = function_call.get("arguments") or ""
+            if not delta:
+                return events
+
+            self.arguments += delta
+            parsed = parse_partial_json(self.arguments)
+            if not isinstance(parsed, dict):
+                return events
+            partial = {key: value for key, value in parsed.items()
+                       if key in self.output_fields}
+            if partial and partial != self.last_partial:
+                self.last_partial = partial
+                events.append({"event": "partial", "data": partial})
+            return events
+        elif kind == "on_tool_start":
+            return [{"event": "tool_start", "data": {
+                "tool": event["name"],
+                "input": event["data"].get("input"),
+            }}]
+        elif kind == "on_tool_end":
+            return [{"event": "tool_end", "data": {
+                "tool": event["name"],
+                "output": event["data"].get("output"),
+            }}]
+        return []
+
+
+async def astream_agent_file_content(topic_request, file_content=None, agent_type="note", session_id=None, chat_history=None, memory=None, model=None):
+    """
+    Run the specified agent and yield events as the work happens.
+
+    Events are dicts of the form {"event": name, "data": {...}}:
+        - tool_start / tool_end: a tool call (Tavily search) began or finished
+        - token: a text delta from the model
+        - partial: the structured output parsed so far, limited to the fields
+          of the agent's output model in agentOutputs.py
+        - result: the final agent result and updated chat history, always last
+
+    Like arun_agent_file_content, raises resilience.DeadlineExceeded when the
+    run outlasts CHAT_DEADLINE_SECONDS.
+
+    Args:
+        topic_request (str): The topic to process
+        file_content (dict): Optional file content after uploading
+        agent_type (str): Type of agent to use
+        session_id (str): Optional session ID for persistence
+        chat_history (list): Optional list of previous messages
+        memory (MemoryState): Optional rolling summary of the session, updated in
+            place when older turns are folded into it
+        model (ModelSpec): Optional model for this run, see modelRegistry.resolve_model;
+            the agent type's routed model by default
+    """
+    selected_agent = _get_agent(agent_type, model)
+
+    if chat_history is None:
+        chat_history = []
+
+    # Timed by hand: span() cannot be held across this generator's yields
+    started = time.perf_counter()
+    with deadline(get_settings().chat_deadline_seconds):
+        history_messages = await within_deadline(
+            aprepare_history(chat_history, agent_type, memory))
+        messages, message_content = _build_messages(
+            topic_request, file_content, history_messages)
+
+        metrics = AgentMetricsHandler(agent_type)
+        translator = StreamEventTranslator(agent_type)
+        result = None
+        async for event in iterate_within_deadline(selected_agent.astream_events(
+                {"messages": messages}, version="v2", config={"callbacks": [metrics]})):
+            for translated in translator.translate(event):
+                yield translated
+            if event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                # Root run finished: this is the AgentExecutor's return value
+                result = event["data"].get("output")
+
+    observe_stage("agent.run", agent_type, time.perf_counter() - started)
+    yield {"event": "result", "data": {
+        "result": result,
+        "chat_history": _update_chat_history(chat_history, message_content, result),
+    }}
 
 
 def display_result(result, agent_type="note"):
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BLOB_STORE = os.getenv("BLOB_STORE", "local")
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", "./blobs")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_PREFIX = os.getenv("S3_PREFIX", "blobs/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+
+
+def blob_key(data: bytes) -> str:
+    """Content address of a blob: the hex SHA-256 of its bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_blob_key(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """blob_key of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed storage for uploaded file bytes.
+
+    Blobs are keyed by their SHA-256, so storing the same bytes twice keeps a
+    single copy. Implementations only need get/exists/delete and _write;
+    _write_file and local_path can be overridden to avoid holding whole
+    files in memory.
+    """
+
+    def put(self, data: bytes) -> str:
+        """
+        Store data if it is not already present.
+
+        Returns:
+            The blob key (hex SHA-256 of data)
+        """
+        key = blob_key(data)
+        if not self.exists(key):
+            self._write(key, data)
+        return key
+
+    def put_file(self, path: str, key: Optional[str] = None) -> str:
+        """
+        Store the contents of the file at path if not already present.
+
+        Args:
+            path: Local file to store
+            key: The file's hex SHA-256 if already known, computed otherwise
+
+        Returns:
+            The blob key
+        """
+        if key is None:
+            key = file_blob_key(path)
+        if not self.exists(key):
+            self._write_file(key, path)
+        return key
+
+    @contextmanager
+    def local_path(self, key: str):
+        """Yield a local filesystem path holding the blob's bytes."""
+        fd, tmp_path = tempfile.mkstemp(prefix="blob-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.get(key))
+            yield tmp_path
+        finally:
+            os.remove(tmp_path)
+
+    def get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def _write(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def _write_file(self, key: str, path: str) -> None:
+        with open(path, "rb") as f:
+            self._write(key, f.read())
+
+
+class LocalBlobStore(BlobStore):
+    """Stores blobs on the local filesystem under root/ab/cd/<key>."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def get(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def local_path(self, key: str):
+        yield self._path(key)
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def _write_file(self, key: str, path: str) -> None:
+        blob_path = self._path(key)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path))
+        os.close(fd)
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, blob_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+class S3BlobStore(BlobStore):
+    """Stores blobs in an S3-compatible bucket under prefix/<key>. Requires boto3."""
+
+    def __init__(self, bucket: str, prefix: str = "blobs/", endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+        except ImportError:
+            raise ImportError(
+                "BLOB_STORE=s3 requires boto3: pip install boto3")
+        if not bucket:
+            raise ValueError("BLOB_STORE=s3 requires S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def get(self, key: str) -> bytes:
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self._object_key(key))
+        return response["Body"].read()
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(
+                Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(
+            Bucket=self.bucket, Key=self._object_key(key))
+
+    def _write(self, key: str, data: bytes) -> None:
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def _write_file(self, key: str, path: str) -> None:
+        # Multipart upload straight from disk
+        self.client.upload_file(path, self.bucket, self._object_key(key))
+
+    @contextmanager
+    def local_path(self, key: str):
+        fd, tmp_path = tempfile.mkstemp(prefix="blob-")
+        os.close(fd)
+        try:
+            self.client.download_file(
+                self.bucket, self._object_key(key), tmp_path)
+            yield tmp_path
+        finally:
+            os.remove(tmp_path)
+
+
+@lru_cache(maxsize=1)
+def get_blob_store() -> BlobStore:
+    """Return the blob store selected by BLOB_STORE ("local" or "s3")."""
+    if BLOB_STORE == "local":
+        return LocalBlobStore(BLOB_STORE_PATH)
+    if BLOB_STORE == "s3":
+        return S3BlobStore(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL)
+    raise ValueError(f"Unknown BLOB_STORE: {BLOB_STORE}")
@@ -0,0 +1,439 @@
+import random
+import asyncio
+import hashlib
+import weakref
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import orjson
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.serde.types import TASKS
+from sqlalchemy import and_, delete, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from config import get_settings
+from db import GraphCheckpoint, GraphCheckpointBlob, GraphCheckpointWrite, get_engine, get_lock_engine
+
+
+# How often a turn waiting for another worker's turn on the same thread
+# checks whether it has finished
+THREAD_LOCK_POLL_SECONDS = 0.2
+
+
+def _thread(config: RunnableConfig) -> Tuple[str, str]:
+    configurable = config["configurable"]
+    return str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+
+
+def _config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {"configurable": {
+        "thread_id": thread_id,
+        "checkpoint_ns": checkpoint_ns,
+        "checkpoint_id": checkpoint_id,
+    }}
+
+
+class PostgresCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpoint saver on the app's SQLAlchemy engine, storing
+    checkpoints in the graph_checkpoints, graph_checkpoint_blobs and
+    graph_checkpoint_writes tables.
+
+    The table layout follows langgraph-checkpoint-postgres, which needs
+    psycopg 3; the app runs on psycopg2. A checkpoint row keeps scalar
+    channel values inline and references the rest by (channel, version), so
+    a step only writes the blobs of the channels it changed, and loading a
+    thread's latest state is one checkpoint row plus its current blobs.
+
+    Only the newest keep checkpoints of a thread are kept (0 keeps all);
+    older ones, their writes and the blobs no remaining checkpoint uses are
+    deleted when a checkpoint is written.
+
+    The async methods run the sync ones in a worker thread.
+    """
+
+    def __init__(self, bind, keep: int = 0, serde=None, lock_bind=None):
+        super().__init__(serde=serde)
+        self.engine = bind
+        # Where thread locks take their connections, see ThreadLock
+        self.lock_engine = lock_bind if lock_bind is not None else bind
+        self.keep = keep
+        # Metadata is stored as JSONB, so it always goes through the JSON serializer
+        self.jsonplus_serde = JsonPlusSerializer()
+        self.checkpoints = GraphCheckpoint.__table__
+        self.blobs = GraphCheckpointBlob.__table__
+        self.writes = GraphCheckpointWrite.__table__
+        # thread id -> lock of the turns on it running in this process
+        self._local_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def thread_lock(self, thread_id: str) -> "ThreadLock":
+        """A lock for running one turn at a time on a thread, see ThreadLock."""
+        thread_id = str(thread_id)
+        local = self._local_locks.get(thread_id)
+        if local is None:
+            local = self._local_locks[thread_id] = asyncio.Lock()
+        return ThreadLock(self.lock_engine, thread_id, local)
+
+    def get_next_version(self, current: Optional[str], channel) -> str:
+        # Zero-padded so versions compare as strings; the random part keeps
+        # two workers writing the same thread from reusing a version number
+        # for different values
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def _dump_metadata(self, metadata: CheckpointMetadata) -> Any:
+        return orjson.loads(self.jsonplus_serde.dumps(metadata))
+
+    def _load_metadata(self, metadata: Any) -> CheckpointMetadata:
+        return self.jsonplus_serde.loads(orjson.dumps(metadata))
+
+    def _load(self, conn, row) -> CheckpointTuple:
+        """Build the CheckpointTuple of a graph_checkpoints row: blobs, pending writes and sends."""
+        thread_id, checkpoint_ns = row.thread_id, row.checkpoint_ns
+        checkpoint = dict(row.checkpoint)
+        channel_values = dict(checkpoint.get("channel_values") or {})
+
+        versions = [(channel, str(version)) for channel, version in checkpoint["channel_versions"].items()]
+        if versions:
+            blobs = conn.execute(
+                select(self.blobs.c.channel, self.blobs.c.type, self.blobs.c.blob).where(
+                    self.blobs.c.thread_id == thread_id,
+                    self.blobs.c.checkpoint_ns == checkpoint_ns,
+                    tuple_(self.blobs.c.channel, self.blobs.c.version).in_(versions),
+                )
+            ).all()
+            for blob in blobs:
+                if blob.type != "empty":
+                    channel_values[blob.channel] = self.serde.loads_typed((blob.type, blob.blob))
+        checkpoint["channel_values"] = channel_values
+
+        writes = conn.execute(
+            select(self.writes.c.task_id, self.writes.c.channel, self.writes.c.type, self.writes.c.blob)
+            .where(
+                self.writes.c.thread_id == thread_id,
+                self.writes.c.checkpoint_ns == checkpoint_ns,
+                self.writes.c.checkpoint_id == row.checkpoint_id,
+            )
+            .order_by(self.writes.c.task_id, self.writes.c.idx)
+        ).all()
+
+        # Sends made in the parent's step are delivered in this checkpoint's step
+        pending_sends = []
+        if row.parent_checkpoint_id:
+            pending_sends = [
+                self.serde.loads_typed((send.type, send.blob))
+                for send in conn.execute(
+                    select(self.writes.c.type, self.writes.c.blob)
+                    .where(
+                        self.writes.c.thread_id == thread_id,
+                        self.writes.c.checkpoint_ns == checkpoint_ns,
+                        self.writes.c.checkpoint_id == row.parent_checkpoint_id,
+                        self.writes.c.channel == TASKS,
+                    )
+                    .order_by(self.writes.c.task_path, self.writes.c.task_id, self.writes.c.idx)
+                ).all()
+            ]
+        checkpoint["pending_sends"] = pending_sends
+
+        return CheckpointTuple(
+            config=_config(thread_id, checkpoint_ns, row.checkpoint_id),
+            checkpoint=checkpoint,
+            metadata=self._load_metadata(row._mapping["metadata"]),
+            parent_config=(_config(thread_id, checkpoint_ns, row.parent_checkpoint_id)
+                           if row.parent_checkpoint_id else None),
+            pending_writes=[
+                (write.task_id, write.channel, self.serde.loads_typed((write.type, write.blob)))
+                for write in writes
+            ],
+        )
+
+    def _select(self):
+        table = self.checkpoints
+        return select(
+            table.c.thread_id, table.c.checkpoint_ns, table.c.checkpoint_id,
+            table.c.parent_checkpoint_id, table.c.checkpoint, table.c["metadata"],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """The checkpoint config names, or the thread's latest one when it names none."""
+        thread_id, checkpoint_ns = _thread(config)
+        table = self.checkpoints
+        query = self._select().where(table.c.thread_id == thread_id, table.c.checkpoint_ns == checkpoint_ns)
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id:
+            query = query.where(table.c.checkpoint_id == checkpoint_id)
+        else:
+            query = query.order_by(table.c.checkpoint_id.desc()).limit(1)
+
+        with self.engine.connect() as conn:
+            row = conn.execute(query).first()
+            return self._load(conn, row) if row is not None else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        """Checkpoints matching config, metadata filter and before, newest first."""
+        table = self.checkpoints
+        query = self._select()
+        if config:
+            configurable = config["configurable"]
+            query = query.where(table.c.thread_id == str(configurable["thread_id"]))
+            if "checkpoint_ns" in configurable:
+                query = query.where(table.c.checkpoint_ns == configurable["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                query = query.where(table.c.checkpoint_id == get_checkpoint_id(config))
+        if filter:
+            query = query.where(table.c["metadata"].contains(filter))
+        if before and get_checkpoint_id(before):
+            query = query.where(table.c.checkpoint_id < get_checkpoint_id(before))
+        query = query.order_by(table.c.checkpoint_id.desc())
+        if limit:
+            query = query.limit(limit)
+
+        # Loaded up front so the connection is not held while the caller iterates
+        with self.engine.connect() as conn:
+            tuples = [self._load(conn, row) for row in conn.execute(query).all()]
+        yield from tuples
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """Store a checkpoint and the blobs of the channels in new_versions."""
+        thread_id, checkpoint_ns = _thread(config)
+        parent_id = config["configurable"].get("checkpoint_id")
+
+        values = checkpoint["channel_values"]
+        inline = {channel: value for channel, value in values.items()
+                  if value is None or isinstance(value, (str, int, float, bool))}
+        stored = {**checkpoint, "channel_values": inline, "pending_sends": []}
+
+        blobs = []
+        for channel, version in new_versions.items():
+            if channel in inline:
+                continue
+            type_, blob = self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)
+            blobs.append({"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "channel": channel,
+                          "version": str(version), "type": type_, "blob": blob})
+
+        with self.engine.begin() as conn:
+            if blobs:
+                conn.execute(insert(self.blobs).values(blobs).on_conflict_do_nothing())
+            statement = insert(self.checkpoints).values(
+                thread_id=thread_id,
+                checkpoint_ns=checkpoint_ns,
+                checkpoint_id=checkpoint["id"],
+                parent_checkpoint_id=parent_id,
+                checkpoint=stored,
+                metadata=self._dump_metadata(metadata),
+            )
+            conn.execute(statement.on_conflict_do_update(
+                index_elements=["thread_id", "checkpoint_ns", "checkpoint_id"],
+                set_={"checkpoint": statement.excluded.checkpoint,
+                      "metadata": statement.excluded["metadata"]},
+            ))
+            if self.keep:
+                self._prune(conn, thread_id, checkpoint_ns)
+
+        return _config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def _prune(self, conn, thread_id: str, checkpoint_ns: str) -> None:
+        table = self.checkpoints
+        in_thread = and_(table.c.thread_id == thread_id, table.c.checkpoint_ns == checkpoint_ns)
+        kept = conn.execute(
+            select(table.c.checkpoint_id, table.c.checkpoint).where(in_thread)
+            .order_by(table.c.checkpoint_id.desc()).limit(self.keep)
+        ).all()
+        if len(kept) < self.keep:
+            return
+        oldest_kept = kept[-1].checkpoint_id
+        removed = conn.execute(delete(table).where(in_thread, table.c.checkpoint_id < oldest_kept)).rowcount
+        if not removed:
+            return
+        conn.execute(delete(self.writes).where(
+            self.writes.c.thread_id == thread_id,
+            self.writes.c.checkpoint_ns == checkpoint_ns,
+            self.writes.c.checkpoint_id < oldest_kept,
+        ))
+        used = {(channel, str(version)) for row in kept
+                for channel, version in row.checkpoint["channel_versions"].items()}
+        stale = [
+            (blob.channel, blob.version) for blob in conn.execute(
+                select(self.blobs.c.channel, self.blobs.c.version).where(
+                    self.blobs.c.thread_id == thread_id, self.blobs.c.checkpoint_ns == checkpoint_ns)
+            ).all()
+            if (blob.channel, blob.version) not in used
+        ]
+        if stale:
+            conn.execute(delete(self.blobs).where(
+                self.blobs.c.thread_id == thread_id,
+                self.blobs.c.checkpoint_ns == checkpoint_ns,
+                tuple_(self.blobs.c.channel, self.blobs.c.version).in_(stale),
+            ))
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        """Store the writes a task made in the step after config's checkpoint."""
+        thread_id, checkpoint_ns = _thread(config)
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append({
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": config["configurable"]["checkpoint_id"],
+                "task_id": task_id,
+                "task_path": task_path,
+                "idx": WRITES_IDX_MAP.get(channel, idx),
+                "channel": channel,
+                "type": type_,
+                "blob": blob,
+            })
+        if not rows:
+            return
+
+        statement = insert(self.writes).values(rows)
+        # Special channels (errors, interrupts) keep their latest value;
+        # regular writes of a task are never rewritten
+        if all(channel in WRITES_IDX_MAP for channel, _ in writes):
+            statement = statement.on_conflict_do_update(
+                index_elements=["thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx"],
+                set_={"channel": statement.excluded.channel, "type": statement.excluded.type,
+                      "blob": statement.excluded.blob},
+            )
+        else:
+            statement = statement.on_conflict_do_nothing()
+        with self.engine.begin() as conn:
+            conn.execute(statement)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete every checkpoint, blob and write of a thread."""
+        with self.engine.begin() as conn:
+            for table in (self.writes, self.blobs, self.checkpoints):
+                conn.execute(delete(table).where(table.c.thread_id == str(thread_id)))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None,
+                    limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        tuples: List[CheckpointTuple] = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+class ThreadLock:
+    """
+    Held for a whole graph run so turns on one thread do not interleave: a
+    second turn, or a retry of the same one, waits for the first to finish
+    instead of resuming or deleting its checkpoints while it still writes.
+
+    Turns in this process queue on an asyncio lock; on Postgres the holder
+    also takes a session advisory lock on the thread, so turns in other
+    workers wait too. The lock is polled, each poll checking a connection
+    out only for the attempt, so a waiting turn holds no connection and no
+    worker thread, and a cancelled wait leaves nothing behind. The holder
+    keeps its connection until it releases the lock; the app passes the
+    lock engine (db.get_lock_engine), whose pool is separate from the one
+    request handlers use.
+    """
+
+    def __init__(self, engine, thread_id: str, local: asyncio.Lock):
+        self.engine = engine
+        self.local = local
+        self.key = int.from_bytes(
+            hashlib.sha256(f"graph_thread:{thread_id}".encode()).digest()[:8], "big", signed=True)
+        self.conn = None
+
+    def _try_lock(self) -> bool:
+        conn = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            locked = bool(conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar())
+        except BaseException:
+            conn.close()
+            raise
+        if not locked:
+            conn.close()
+            return False
+        self.conn = conn
+        return True
+
+    def _unlock(self) -> None:
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        try:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+        except Exception:
+            # Closing the database session releases its locks
+            conn.invalidate()
+        finally:
+            conn.close()
+
+    async def acquire(self) -> None:
+        await self.local.acquire()
+        try:
+            if self.engine.dialect.name != "postgresql":
+                return
+            attempt = None
+            try:
+                while True:
+                    # Shielded so a cancelled wait knows whether the lock was taken
+                    attempt = asyncio.ensure_future(asyncio.to_thread(self._try_lock))
+                    if await asyncio.shield(attempt):
+                        return
+                    await asyncio.sleep(THREAD_LOCK_POLL_SECONDS)
+            except BaseException:
+                if attempt is not None and not attempt.done():
+                    await asyncio.wait([attempt])
+                await asyncio.to_thread(self._unlock)
+                raise
+        except BaseException:
+            self.local.release()
+            raise
+
+    async def release(self) -> None:
+        try:
+            await asyncio.to_thread(self._unlock)
+        finally:
+            self.local.release()
+
+    async def __aenter__(self) -> "ThreadLock":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.release()
+
+
+@lru_cache(maxsize=1)
+def get_checkpointer() -> PostgresCheckpointSaver:
+    """The checkpoint saver shared by the app, on the app database."""
+    return PostgresCheckpointSaver(get_engine(), keep=get_settings().graph_checkpoints_kept,
+                                   lock_bind=get_lock_engine())
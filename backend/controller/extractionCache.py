@@ -0,0 +1,140 @@
+import os
+import tempfile
+import threading
+import logging
+from functools import lru_cache
+from typing import Optional, Callable, Union
+
+from dotenv import load_dotenv
+
+from .utilities import EXTRACTOR_VERSION, process_file, is_extraction_error
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "./extraction_cache")
+EXTRACTION_CACHE_MAX_BYTES = int(
+    os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+class ExtractionCache:
+    """
+    On-disk cache of extracted text keyed by file SHA-256 and extractor version.
+
+    Entries are plain UTF-8 files. Reads bump the file's mtime, and when the
+    total size goes over max_bytes the least recently used entries are removed.
+    Bumping EXTRACTOR_VERSION makes old entries unreachable; they age out
+    through the same eviction.
+    """
+
+    def __init__(self, root: str, max_bytes: int, version: str = EXTRACTOR_VERSION):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._total_bytes = sum(
+            os.path.getsize(path) for path in self._entry_paths())
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.root, f"{sha256}-v{self.version}.txt")
+
+    def _entry_paths(self):
+        for name in os.listdir(self.root):
+            if name.endswith(".txt"):
+                yield os.path.join(self.root, name)
+
+    def get(self, sha256: str) -> Optional[str]:
+        path = self._path(sha256)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, sha256: str, text: str) -> None:
+        path = self._path(sha256)
+        data = text.encode("utf-8")
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            with self._lock:
+                if os.path.exists(path):
+                    self._total_bytes -= os.path.getsize(path)
+                os.replace(tmp_path, path)
+                self._total_bytes += len(data)
+                self._evict()
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _evict(self) -> None:
+        # Caller holds the lock
+        if self._total_bytes <= self.max_bytes:
+            return
+        entries = sorted(
+            ((os.path.getmtime(path), path) for path in self._entry_paths()))
+        for _, path in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                continue
+            logger.info(f"Evicted extraction cache entry {os.path.basename(path)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "extractor_version": self.version,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_extraction_cache() -> ExtractionCache:
+    return ExtractionCache(EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_MAX_BYTES)
+
+
+def process_file_cached(file_data: Union[bytes, str], sha256: str, file_type: Optional[str] = None,
+                        progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """
+    Same as process_file, but reuses text already extracted from identical bytes.
+
+    Args:
+        file_data: File content as bytes, or a path to the file
+        sha256: Hex SHA-256 of the file content
+        file_type: Optional file type hint
+        progress: Optional callback for PDFs, called with (pages_done, pages_total)
+
+    Returns:
+        Extracted text as string
+    """
+    cache = get_extraction_cache()
+    text = cache.get(sha256)
+    if text is not None:
+        return text
+
+    text = process_file(file_data, file_type, progress)
+    # Errors include OCR that ran out of time, so only whole documents are kept
+    if not is_extraction_error(text):
+        cache.put(sha256, text)
+    return text
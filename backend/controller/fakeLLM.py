@@ -0,0 +1,210 @@
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional, Type
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_function
+from pydantic import BaseModel, Field
+
+
+def _last_human_text(messages: List[BaseMessage]) -> str:
+    for message in reversed(messages):
+        if message.type == "human":
+            return message.content if isinstance(message.content, str) else str(message.content)
+    return ""
+
+
+def _fake_value(schema: Dict[str, Any], field: str, topic: str, seed: str) -> Any:
+    kind = schema.get("type")
+    if kind == "array":
+        items = schema.get("items") or {}
+        if items.get("type") == "object":
+            return [{"front": f"{topic} ({seed}) question {i + 1}",
+                     "back": f"{topic} ({seed}) answer {i + 1}"} for i in range(3)]
+        return [f"{field} {i + 1}" for i in range(3)]
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    if kind == "object":
+        return {}
+    return f"{field.replace('_', ' ').capitalize()} for {topic} ({seed})"
+
+
+# How long an injected hang lasts, far beyond any call timeout
+HANG_SECONDS = 3600
+
+
+class FakeUpstreamError(Exception):
+    """An injected provider failure, shaped like an HTTP 503 from the API."""
+    status_code = 503
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic in-process chat model for offline runs and load tests.
+
+    Replies depend only on the last human message, so the same input always
+    produces the same output. When a function call is forced (as
+    with_structured_output does) it fills every field of the function's
+    schema; otherwise it answers with plain text. latency seconds are slept
+    per call to stand in for a remote model, and replies stream in chunks of
+    chunk_size characters. For fault injection, failure_rate of the calls
+    raise FakeUpstreamError and hang_rate of them never answer.
+    """
+    model: str = "fake"
+    latency: float = 0.0
+    chunk_size: int = 40
+    failure_rate: float = 0.0
+    hang_rate: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "latency": self.latency}
+
+    def bind_functions(self, functions, function_call: Optional[str] = None, **kwargs):
+        """Same contract as ChatOpenAI.bind_functions."""
+        formatted = [convert_to_openai_function(fn) for fn in functions]
+        if function_call is not None:
+            kwargs["function_call"] = {"name": function_call}
+        return self.bind(functions=formatted, **kwargs)
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, **kwargs):
+        function = convert_to_openai_function(schema)
+        bound = self.bind(functions=[function], function_call={"name": function["name"]})
+
+        def parse(message: AIMessage):
+            arguments = json.loads(message.additional_kwargs["function_call"]["arguments"])
+            parsed = schema(**arguments) if isinstance(schema, type) else arguments
+            return {"raw": message, "parsed": parsed, "parsing_error": None} if include_raw else parsed
+
+        return bound | RunnableLambda(parse)
+
+    def _fault(self) -> float:
+        """Raise an injected failure, or return how long to sleep before answering."""
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise FakeUpstreamError("Injected fake model failure")
+        if self.hang_rate and random.random() < self.hang_rate:
+            return HANG_SECONDS
+        return self.latency
+
+    def _reply(self, messages: List[BaseMessage], functions: Optional[List[dict]] = None,
+               function_call: Optional[dict] = None) -> AIMessage:
+        topic = " ".join(_last_human_text(messages).split())[:80] or "the topic"
+        seed = hashlib.sha256(topic.encode("utf-8")).hexdigest()[:8]
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+
+        function = None
+        if function_call and functions:
+            function = next((fn for fn in functions if fn["name"] == function_call.get("name")), None)
+        if function is None:
+            content = f"[{self.model}] Answer about {topic} ({seed})."
+            return AIMessage(content=content, usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": len(content) // 4,
+                "total_tokens": input_tokens + len(content) // 4,
+            })
+
+        properties = function.get("parameters", {}).get("properties", {})
+        arguments = json.dumps({field: _fake_value(schema, field, topic, seed)
+                                for field, schema in properties.items()})
+        return AIMessage(
+            content="",
+            additional_kwargs={"function_call": {"name": function["name"], "arguments": arguments}},
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": len(arguments) // 4,
+                "total_tokens": input_tokens + len(arguments) // 4,
+            },
+        )
+
+    def _chunks(self, message: AIMessage) -> Iterator[ChatGenerationChunk]:
+        function_call = message.additional_kwargs.get("function_call")
+        text = function_call["arguments"] if function_call else message.content
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        for index, piece in enumerate(pieces):
+            if function_call:
+                call = {"arguments": piece}
+                if index == 0:
+                    call["name"] = function_call["name"]
+                chunk = AIMessageChunk(content="", additional_kwargs={"function_call": call})
+            else:
+                chunk = AIMessageChunk(content=piece)
+            if index == len(pieces) - 1:
+                chunk.usage_metadata = message.usage_metadata
+            yield ChatGenerationChunk(message=chunk)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay = self._fault()
+        if delay:
+            time.sleep(delay)
+        message = self._reply(messages, kwargs.get("functions"), kwargs.get("function_call"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay = self._fault()
+        if delay:
+            await asyncio.sleep(delay)
+        message = self._reply(messages, kwargs.get("functions"), kwargs.get("function_call"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        delay = self._fault()
+        if delay:
+            time.sleep(delay)
+        message = self._reply(messages, kwargs.get("functions"), kwargs.get("function_call"))
+        for chunk in self._chunks(message):
+            if run_manager and chunk.message.content:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        delay = self._fault()
+        if delay:
+            await asyncio.sleep(delay)
+        message = self._reply(messages, kwargs.get("functions"), kwargs.get("function_call"))
+        for chunk in self._chunks(message):
+            if run_manager and chunk.message.content:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+
+class FakeSearchInput(BaseModel):
+    query: str = Field(description="Search query to look up")
+
+
+class FakeSearchTool(BaseTool):
+    """
+    Offline stand-in for the Tavily search tool, with the same name. Returns
+    a fixed-shape result derived from the query. Like TavilySearch it reports
+    failures as {"error": ...}; failure_rate of the calls fail that way.
+    """
+    name: str = "tavily_search"
+    description: str = "A search engine for current information. Input should be a search query."
+    args_schema: Type[BaseModel] = FakeSearchInput
+    failure_rate: float = 0.0
+
+    def _run(self, query: str, run_manager=None) -> dict:
+        if self.failure_rate and random.random() < self.failure_rate:
+            return {"error": "Injected fake search failure"}
+        seed = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+        return {
+            "query": query,
+            "results": [{
+                "title": f"Result {i + 1} for {query}",
+                "url": f"https://example.com/{seed}/{i + 1}",
+                "content": f"Offline search result {i + 1} for {query}.",
+            } for i in range(3)],
+            "images": [],
+        }
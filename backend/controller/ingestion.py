@@ -0,0 +1,194 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import update
+
+from db import SessionLocal, UploadedFile, IngestionJob
+from .blobStore import get_blob_store
+from .extractionCache import process_file_cached
+from .retrieval import index_file_chunks
+from .utilities import is_extraction_error, shutdown_ocr_pool
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Uploads extracted at once by this process. OCR for all jobs shares one
+# process pool (OCR_WORKERS), so this mostly bounds concurrent documents.
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+# A processing job that has not reported progress for this long is assumed to
+# belong to a worker that died, and is picked up again by the next sweep
+INGESTION_STALE_SECONDS = int(os.getenv("INGESTION_STALE_SECONDS", "900"))
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+# Seconds between sweeps for stale jobs while the app is running
+INGESTION_SWEEP_SECONDS = int(os.getenv("INGESTION_SWEEP_SECONDS", "60"))
+# Minimum seconds between progress writes for one job
+PROGRESS_INTERVAL = 1.0
+
+_executor = ThreadPoolExecutor(
+    max_workers=INGESTION_WORKERS, thread_name_prefix="ingestion")
+_stop_sweeper = threading.Event()
+
+
+def enqueue_ingestion(job_id):
+    """Schedule a pending ingestion job on the worker pool."""
+    _executor.submit(run_ingestion_job, job_id)
+
+
+def _claim(db, job_id) -> bool:
+    # Conditional update, so a job is only run once even if several
+    # processes enqueue it
+    claimed = db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == job_id, IngestionJob.status == "pending")
+        .values(status="processing", attempts=IngestionJob.attempts + 1,
+                updated_at=datetime.utcnow())
+    ).rowcount
+    db.commit()
+    return claimed == 1
+
+
+def run_ingestion_job(job_id):
+    """
+    Extract the text of an uploaded file, store it on the file row and index
+    its chunks for retrieval.
+
+    Page progress is written to the job row as extraction goes, at most once
+    every PROGRESS_INTERVAL seconds.
+    """
+    with SessionLocal() as db:
+        if not _claim(db, job_id):
+            return
+
+        job = db.get(IngestionJob, job_id)
+        uploaded_file = db.get(UploadedFile, job.file_id)
+        last_progress = 0.0
+
+        def progress(pages_done, pages_total):
+            nonlocal last_progress
+            now = time.monotonic()
+            if pages_done < pages_total and now - last_progress < PROGRESS_INTERVAL:
+                return
+            last_progress = now
+            job.pages_done = pages_done
+            job.pages_total = pages_total
+            job.updated_at = datetime.utcnow()
+            db.commit()
+
+        try:
+            # Extractors read from the blob's path rather than loading it
+            file_type = (uploaded_file.fileType or "").split("/")[-1].lower()
+            with get_blob_store().local_path(uploaded_file.sha256) as path:
+                text = process_file_cached(
+                    path, uploaded_file.sha256, file_type or None, progress)
+
+            if is_extraction_error(text):
+                job.status = "failed"
+                job.error = text
+            else:
+                uploaded_file.content = text
+                # Chunks are committed with the ready status, so a chat never
+                # sees a ready file it would have to index itself
+                _index_chunks(db, uploaded_file)
+                job.status = "ready"
+            job.updated_at = datetime.utcnow()
+            db.commit()
+            logger.info(f"Ingestion job {job_id} finished: {job.status}")
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {str(e)}")
+            db.rollback()
+            job = db.get(IngestionJob, job_id)
+            job.status = "failed"
+            job.error = f"Error processing file: {str(e)}"
+            job.updated_at = datetime.utcnow()
+            db.commit()
+
+
+def _index_chunks(db, uploaded_file):
+    # The text is usable without chunks: if embedding fails, only the
+    # savepoint is rolled back and the chunks are built the first time the
+    # file is used in a chat instead
+    try:
+        with db.begin_nested():
+            count = index_file_chunks(db, uploaded_file.id, uploaded_file.content)
+        logger.info(f"Indexed {count} chunks for file {uploaded_file.id}")
+    except Exception as e:
+        logger.error(f"Chunk indexing failed for file {uploaded_file.id}: {str(e)}")
+
+
+def _reclaim_stale_jobs(db) -> list:
+    """
+    Take back jobs whose worker went quiet for INGESTION_STALE_SECONDS:
+    processing jobs are failed once they reach INGESTION_MAX_ATTEMPTS and
+    otherwise reset to pending, and pending jobs nobody picked up are touched
+    so only one process re-enqueues them. Returns the ids to enqueue.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=INGESTION_STALE_SECONDS)
+    stale = IngestionJob.updated_at < stale_before
+    processing = IngestionJob.status == "processing"
+    db.execute(
+        update(IngestionJob)
+        .where(processing, stale, IngestionJob.attempts >= INGESTION_MAX_ATTEMPTS)
+        .values(status="failed", error="Ingestion was interrupted too many times",
+                updated_at=now)
+    )
+    # Conditional update, so each stale job is handed to one process only
+    job_ids = db.execute(
+        update(IngestionJob)
+        .where(processing | (IngestionJob.status == "pending"), stale)
+        .values(status="pending", updated_at=now)
+        .returning(IngestionJob.id)
+    ).scalars().all()
+    db.commit()
+    return job_ids
+
+
+def recover_ingestion_jobs():
+    """
+    Re-enqueue jobs left behind by a restart: every pending job, and
+    processing jobs that have gone stale. Called on application startup.
+    """
+    with SessionLocal() as db:
+        _reclaim_stale_jobs(db)
+        job_ids = db.query(IngestionJob.id).filter(
+            IngestionJob.status == "pending").all()
+
+    for (job_id,) in job_ids:
+        enqueue_ingestion(job_id)
+    if job_ids:
+        logger.info(f"Re-enqueued {len(job_ids)} ingestion jobs")
+
+
+def _sweep_ingestion_jobs():
+    while not _stop_sweeper.wait(INGESTION_SWEEP_SECONDS):
+        try:
+            with SessionLocal() as db:
+                job_ids = _reclaim_stale_jobs(db)
+            for job_id in job_ids:
+                enqueue_ingestion(job_id)
+            if job_ids:
+                logger.info(f"Reclaimed {len(job_ids)} stale ingestion jobs")
+        except Exception as e:
+            logger.error(f"Error sweeping ingestion jobs: {str(e)}")
+
+
+def start_ingestion_sweeper():
+    """
+    Reclaim stale jobs every INGESTION_SWEEP_SECONDS, so a job whose worker
+    died is retried without waiting for a restart.
+    """
+    threading.Thread(target=_sweep_ingestion_jobs,
+                     name="ingestion-sweeper", daemon=True).start()
+
+
+def shutdown_ingestion():
+    """Stop taking new jobs. Queued jobs stay pending and are recovered on the next start."""
+    _stop_sweeper.set()
+    _executor.shutdown(wait=False, cancel_futures=True)
+    shutdown_ocr_pool()
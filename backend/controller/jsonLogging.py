@@ -0,0 +1,183 @@
+import sys
+import json
+import uuid
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from config import get_settings
+
+# Attributes every LogRecord has; anything else on a record came from extra=
+_STANDARD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime"}
+# Route and id of the request being handled, added to every record logged for it
+_request_route: ContextVar[Optional[str]] = ContextVar("request_route", default=None)
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# Whether the current request's records below WARNING are kept
+_request_sampled: ContextVar[bool] = ContextVar("request_sampled", default=True)
+
+
+def truncate(value: Any, max_chars: int) -> Any:
+    """
+    Bound a log field: long strings are cut to max_chars, and containers or
+    other objects are replaced by their JSON (or repr) cut the same way.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if not isinstance(value, str):
+        try:
+            value = json.dumps(value, default=str)
+        except (TypeError, ValueError):
+            value = repr(value)
+    if len(value) > max_chars:
+        return f"{value[:max_chars]}...[{len(value) - max_chars} more chars]"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg, the request's route and
+    id when there is one, every field passed with extra=, and exc for
+    exceptions. Each field is truncated to max_field_chars so a record never
+    carries a whole payload.
+    """
+
+    def __init__(self, max_field_chars: int = 512, max_exc_chars: int = 8000):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+        self.max_exc_chars = max_exc_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": truncate(record.getMessage(), self.max_field_chars),
+        }
+        route = getattr(record, "route", None) or _request_route.get()
+        if route:
+            entry["route"] = route
+            entry["request_id"] = getattr(record, "request_id", None) or _request_id.get()
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and key not in entry:
+                entry[key] = truncate(value, self.max_field_chars)
+        if record.exc_info:
+            entry["exc"] = truncate(self.formatException(record.exc_info), self.max_exc_chars)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Drops records below WARNING for requests that were not sampled (see bind_request)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _request_sampled.get()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Formats records on the calling thread, so their arguments are captured
+    as they are now, and hands the finished line to a background thread that
+    writes it. When the queue is full the record is dropped and counted
+    instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+@lru_cache(maxsize=1)
+def _sample_rates() -> Dict[str, float]:
+    raw = get_settings().log_sample_rates
+    return {prefix: float(rate) for prefix, rate in json.loads(raw).items()} if raw else {}
+
+
+def sample_rate(path: str) -> float:
+    """
+    Share of requests to path whose info and debug records are kept: the
+    rate of the longest matching prefix in LOG_SAMPLE_RATES, else LOG_SAMPLE_RATE.
+    """
+    rates = _sample_rates()
+    matches = [prefix for prefix in rates if path.startswith(prefix)]
+    if matches:
+        return rates[max(matches, key=len)]
+    return get_settings().log_sample_rate
+
+
+def bind_request(route: str, request_id: str) -> None:
+    """
+    Tag the records of the current request with its route and id, and decide
+    once for the whole request whether its records below WARNING are kept.
+    Called by the request middleware in main.py.
+    """
+    _request_route.set(route)
+    _request_id.set(request_id)
+    rate = sample_rate(route)
+    _request_sampled.set(rate >= 1 or random.random() < rate)
+
+
+def configure_logging() -> None:
+    """
+    Send the root logger's records, as JSON lines (or plain text with
+    LOG_FORMAT=text), through a bounded queue to a background thread that
+    writes them to stdout. Idempotent.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    settings = get_settings()
+
+    if settings.log_format == "text":
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    else:
+        formatter = JsonFormatter(max_field_chars=settings.log_field_max_chars)
+    handler = DroppingQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+    handler.setFormatter(formatter)
+    handler.addFilter(SamplingFilter())
+
+    output = logging.StreamHandler(sys.stdout)
+    # Records arrive already formatted by the queue handler
+    output.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(handler.queue, output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.log_level.upper())
+
+
+def shutdown_logging() -> None:
+    """Write out the records still queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestLoggingMiddleware:
+    """ASGI middleware calling bind_request for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            bind_request(scope["path"], uuid.uuid4().hex[:16])
+        await self.app(scope, receive, send)
@@ -0,0 +1,230 @@
+import os
+import re
+import logging
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import tiktoken
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Tokens of conversation history sent with each turn, per agent type.
+# Override one with MEMORY_TOKEN_BUDGET_<AGENT_TYPE>, e.g. MEMORY_TOKEN_BUDGET_NOTE=6000
+DEFAULT_MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "3000"))
+MEMORY_TOKEN_BUDGETS = {
+    "general": 4000,
+    "note": 3000,
+    "research": 3000,
+    "step": 3000,
+    "diagram": 2000,
+    "flashcard": 2000,
+    "feynman": 3000,
+}
+# When the verbatim history overflows, the oldest turns are folded into the
+# summary until it is back under this fraction of the budget. Folding several
+# turns at once means the summary is rewritten every few turns, not every turn.
+MEMORY_FOLD_RATIO = float(os.getenv("MEMORY_FOLD_RATIO", "0.5"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "500"))
+# Approximate per-message overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+# The latest turn (human + ai) is always kept verbatim, trimmed if needed
+MIN_RECENT_MESSAGES = 2
+
+SUMMARY_PROMPT = """You maintain the running summary of a conversation between a student and a study assistant.
+Update the summary with the new messages below. Keep the topics, the facts and definitions the assistant gave,
+the student's goals and open questions, and any preferences they stated. Drop pleasantries and formatting.
+Answer with the updated summary only, in at most {max_words} words."""
+
+
+@lru_cache(maxsize=1)
+def token_encoding():
+    """The tiktoken encoding used by gpt-4o."""
+    return tiktoken.encoding_for_model("gpt-4o")
+
+
+def count_tokens(text: str) -> int:
+    return len(token_encoding().encode(text or ""))
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Shorten text to at most max_tokens tokens, ending at the last sentence
+    or line break when there is one in the kept part.
+    """
+    tokens = token_encoding().encode(text or "")
+    if len(tokens) <= max_tokens:
+        return text
+    kept = token_encoding().decode(tokens[:max(0, max_tokens - 1)])
+    boundaries = [m.end() for m in re.finditer(r"[.!?](\s|$)|\n", kept)]
+    # Only cut back to a sentence end if that keeps most of the text
+    if boundaries and boundaries[-1] > len(kept) // 2:
+        kept = kept[:boundaries[-1]]
+    return kept.rstrip() + " …"
+
+
+def history_budget(agent_type: str) -> int:
+    """Token budget for the conversation history sent to agent_type."""
+    override = os.getenv(f"MEMORY_TOKEN_BUDGET_{agent_type.upper()}")
+    if override:
+        return int(override)
+    return MEMORY_TOKEN_BUDGETS.get(agent_type, DEFAULT_MEMORY_TOKEN_BUDGET)
+
+
+@dataclass
+class MemoryState:
+    """
+    Rolling summary of a session's older turns.
+
+    summary covers chat_history[:summary_seq]; everything from summary_seq on
+    is still replayed verbatim. Callers persist it between turns (the chat
+    routes keep it on the session row) so the summary is only extended, never
+    rebuilt from the start.
+    """
+    summary: Optional[str] = None
+    summary_seq: int = 0
+
+
+@lru_cache(maxsize=1)
+def _summary_llm():
+    # SUMMARY_MODEL may name a model registry entry (e.g. "fake" for offline
+    # runs); anything else is taken as an OpenAI model name
+    from .modelRegistry import ModelSpec, get_models, get_chat_model
+    from .resilience import guard_model
+    spec = get_models().get(SUMMARY_MODEL) or ModelSpec("openai", SUMMARY_MODEL)
+    spec = replace(spec, temperature=0, max_tokens=SUMMARY_MAX_TOKENS)
+    return guard_model(get_chat_model(spec), spec)
+
+
+def _message_tokens(message: dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _fold_point(chat_history: List[dict], start: int, budget: int) -> int:
+    """
+    Index up to which chat_history should be folded into the summary, so
+    that chat_history[index:] fits the verbatim budget. Returns start when
+    nothing needs folding.
+    """
+    sizes = [_message_tokens(message) for message in chat_history[start:]]
+    if sum(sizes) <= budget:
+        return start
+
+    target = int(budget * MEMORY_FOLD_RATIO)
+    remaining = sum(sizes)
+    last_foldable = len(chat_history) - MIN_RECENT_MESSAGES
+    index = start
+    while index < last_foldable and remaining > target:
+        remaining -= sizes[index - start]
+        index += 1
+    # Fold whole turns: stop at a human message
+    while index < last_foldable and chat_history[index]["type"] != "human":
+        remaining -= sizes[index - start]
+        index += 1
+    return index
+
+
+def _summary_messages(summary: Optional[str], folded: List[dict]) -> List[BaseMessage]:
+    lines = []
+    for message in folded:
+        speaker = "Student" if message["type"] == "human" else "Assistant"
+        lines.append(f"{speaker}: {trim_to_tokens(message['content'], 1000)}")
+    previous = summary or "(empty)"
+    return [
+        SystemMessage(content=SUMMARY_PROMPT.format(
+            max_words=int(SUMMARY_MAX_TOKENS * 0.7))),
+        HumanMessage(content=f"Current summary:\n{previous}\n\nNew messages:\n" + "\n\n".join(lines)),
+    ]
+
+
+def _recent_messages(chat_history: List[dict], budget: int) -> List[BaseMessage]:
+    # Walk back from the newest message; the oldest one that does not fit is
+    # trimmed, anything older is left out
+    selected = []
+    remaining = budget
+    for message in reversed(chat_history):
+        size = _message_tokens(message)
+        content = message["content"]
+        # Leave room for the rest of the latest turn
+        required = min(MIN_RECENT_MESSAGES - len(selected),
+                       len(chat_history) - len(selected))
+        allowance = remaining // required if required > 1 else remaining
+        if size > allowance:
+            if remaining <= MESSAGE_OVERHEAD_TOKENS * 4 and len(selected) >= MIN_RECENT_MESSAGES:
+                break
+            content = trim_to_tokens(content, max(allowance - MESSAGE_OVERHEAD_TOKENS, 1))
+            size = allowance
+        selected.append(HumanMessage(content=content) if message["type"] == "human"
+                        else AIMessage(content=content))
+        remaining -= size
+        if remaining <= 0:
+            break
+    return list(reversed(selected))
+
+
+def _assemble(chat_history: List[dict], state: MemoryState, budget: int) -> List[BaseMessage]:
+    messages = []
+    if state.summary:
+        messages.append(SystemMessage(
+            content=f"Summary of the earlier conversation:\n{state.summary}"))
+        budget -= count_tokens(state.summary) + MESSAGE_OVERHEAD_TOKENS
+    return messages + _recent_messages(chat_history[state.summary_seq:], budget)
+
+
+def _prepare(chat_history: List[dict], agent_type: str, state: MemoryState) -> Tuple[int, int]:
+    budget = history_budget(agent_type)
+    # A stored state from a longer history (e.g. messages deleted) is unusable
+    if state.summary_seq > len(chat_history):
+        state.summary, state.summary_seq = None, 0
+    recent_budget = budget - (SUMMARY_MAX_TOKENS + MESSAGE_OVERHEAD_TOKENS)
+    return budget, _fold_point(chat_history, state.summary_seq, recent_budget)
+
+
+def prepare_history(chat_history: List[dict], agent_type: str,
+                    state: Optional[MemoryState] = None, summarizer=None) -> List[BaseMessage]:
+    """
+    Build the history messages for a turn within the agent type's token budget.
+
+    Recent turns are replayed verbatim. When they no longer fit, the oldest
+    ones are folded into state's rolling summary with one call to the
+    summary model, and the summary is sent in their place.
+
+    Args:
+        chat_history: Stored history, a list of {"type": "human" | "ai", "content": str}
+        agent_type: Agent the history is for, selects the budget
+        state: Summary carried over from earlier turns, updated in place
+        summarizer: Chat model used to write the summary, SUMMARY_MODEL by default
+
+    Returns:
+        List of LangChain messages, starting with the summary if there is one
+    """
+    state = state if state is not None else MemoryState()
+    budget, fold_to = _prepare(chat_history, agent_type, state)
+    if fold_to > state.summary_seq:
+        summarizer = summarizer or _summary_llm()
+        response = summarizer.invoke(_summary_messages(
+            state.summary, chat_history[state.summary_seq:fold_to]))
+        state.summary = trim_to_tokens(response.content.strip(), SUMMARY_MAX_TOKENS)
+        state.summary_seq = fold_to
+        logger.info(f"Folded history into summary up to message {fold_to}")
+    return _assemble(chat_history, state, budget)
+
+
+async def aprepare_history(chat_history: List[dict], agent_type: str,
+                           state: Optional[MemoryState] = None, summarizer=None) -> List[BaseMessage]:
+    """Async version of prepare_history."""
+    state = state if state is not None else MemoryState()
+    budget, fold_to = _prepare(chat_history, agent_type, state)
+    if fold_to > state.summary_seq:
+        summarizer = summarizer or _summary_llm()
+        response = await summarizer.ainvoke(_summary_messages(
+            state.summary, chat_history[state.summary_seq:fold_to]))
+        state.summary = trim_to_tokens(response.content.strip(), SUMMARY_MAX_TOKENS)
+        state.summary_seq = fold_to
+        logger.info(f"Folded history into summary up to message {fold_to}")
+    return _assemble(chat_history, state, budget)
@@ -0,0 +1,143 @@
+import os
+import json
+import logging
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Any, Dict, Optional, Union
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds the fake model sleeps per call, to stand in for a remote model in load tests
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+# Fault injection for the fake model: share of calls that fail with a 503,
+# and share that hang, to exercise controller/resilience.py
+FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+FAKE_LLM_HANG_RATE = float(os.getenv("FAKE_LLM_HANG_RATE", "0"))
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """
+    A chat model configuration.
+
+    provider is "fake" for the in-process FakeChatModel, or any provider
+    init_chat_model knows ("openai", "anthropic", ...). timeout is in seconds.
+    """
+    provider: str
+    model: str
+    temperature: float = 0.7
+    max_tokens: int = 4000
+    timeout: Optional[float] = None
+
+
+# Models an agent type or a request can select by name. Add or replace
+# entries with MODEL_REGISTRY, a JSON object of name -> ModelSpec fields
+DEFAULT_MODELS = {
+    "gpt-4o": ModelSpec("openai", "gpt-4o", temperature=0.7, max_tokens=7500, timeout=120),
+    "gpt-4o-mini": ModelSpec("openai", "gpt-4o-mini", temperature=0.7, max_tokens=4000, timeout=60),
+    "fake": ModelSpec("fake", "fake", temperature=0, max_tokens=4000),
+}
+# Model used by each agent type. Quick, short-form tasks go to the smaller
+# model. AGENT_MODEL sets one model for every type, and
+# AGENT_MODEL_<AGENT_TYPE> (e.g. AGENT_MODEL_GENERAL=gpt-4o) sets one type
+DEFAULT_AGENT_MODEL = "gpt-4o"
+AGENT_MODEL_ROUTES = {
+    "general": "gpt-4o-mini",
+    "flashcard": "gpt-4o-mini",
+    "note": "gpt-4o",
+    "research": "gpt-4o",
+    "step": "gpt-4o",
+    "diagram": "gpt-4o",
+    "feynman": "gpt-4o",
+}
+# Fields a request may override, with their allowed ranges
+REQUEST_OVERRIDE_LIMITS = {
+    "temperature": (0.0, 2.0),
+    "max_tokens": (1, 16000),
+    "timeout": (1.0, 600.0),
+}
+
+
+@lru_cache(maxsize=1)
+def get_models() -> Dict[str, ModelSpec]:
+    """The model registry: DEFAULT_MODELS plus the entries in MODEL_REGISTRY."""
+    models = dict(DEFAULT_MODELS)
+    raw = get_settings().model_registry
+    if raw:
+        for name, fields in json.loads(raw).items():
+            models[name] = ModelSpec(**fields)
+    return models
+
+
+def get_model_spec(name: str) -> ModelSpec:
+    """Look a model up by name. Raises ValueError for names not in the registry."""
+    spec = get_models().get(name)
+    if spec is None:
+        raise ValueError(f"Unknown model: {name}")
+    return spec
+
+
+def agent_model_name(agent_type: str) -> str:
+    """Registry name of the model agent_type uses when a request does not pick one."""
+    override = os.getenv(f"AGENT_MODEL_{agent_type.upper()}")
+    if override:
+        return override
+    return get_settings().agent_model or AGENT_MODEL_ROUTES.get(agent_type, DEFAULT_AGENT_MODEL)
+
+
+def resolve_model(agent_type: str, option: Union[str, Dict[str, Any], None] = None) -> ModelSpec:
+    """
+    The model for one request.
+
+    Args:
+        agent_type: Agent handling the request, selects the default model
+        option: The request's "model" option: a registry name, or
+            {"name": ..., "temperature": ..., "max_tokens": ..., "timeout": ...}
+            where every key is optional
+
+    Raises:
+        ValueError: Unknown model name, unknown field or value out of range
+    """
+    if option is None or option == "":
+        return get_model_spec(agent_model_name(agent_type))
+    if isinstance(option, str):
+        return get_model_spec(option)
+    if not isinstance(option, dict):
+        raise ValueError("model must be a name or an object")
+
+    overrides = dict(option)
+    spec = get_model_spec(overrides.pop("name", None) or agent_model_name(agent_type))
+    for field, value in overrides.items():
+        if field not in REQUEST_OVERRIDE_LIMITS:
+            raise ValueError(f"Unknown model option: {field}")
+        low, high = REQUEST_OVERRIDE_LIMITS[field]
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not low <= value <= high:
+            raise ValueError(f"model {field} must be between {low} and {high}")
+    if "max_tokens" in overrides:
+        overrides["max_tokens"] = int(overrides["max_tokens"])
+    return replace(spec, **overrides)
+
+
+@lru_cache(maxsize=32)
+def get_chat_model(spec: ModelSpec):
+    """Build the chat model for spec, once per distinct spec."""
+    if spec.provider == "fake":
+        from .fakeLLM import FakeChatModel
+        return FakeChatModel(model=spec.model, latency=FAKE_LLM_LATENCY_MS / 1000,
+                             failure_rate=FAKE_LLM_FAILURE_RATE, hang_rate=FAKE_LLM_HANG_RATE)
+
+    from langchain.chat_models import init_chat_model
+
+    settings = get_settings()
+    # Retries are done by controller/resilience.py, so the client makes one attempt
+    kwargs = {"timeout": spec.timeout or settings.llm_timeout, "max_retries": 0}
+    if spec.provider == "openai":
+        settings.require("openai_api_key")
+        kwargs["api_key"] = settings.openai_api_key
+        # Report token usage on streamed replies too, for controller/telemetry.py
+        kwargs["stream_usage"] = True
+    logger.info(f"Building chat model {spec.provider}:{spec.model}")
+    return init_chat_model(spec.model, model_provider=spec.provider, temperature=spec.temperature,
+                           max_tokens=spec.max_tokens, **kwargs)
@@ -0,0 +1,507 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Transport errors from openai/httpx/requests, matched by name so none of them
+# has to be importable here
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "ConnectError", "ConnectTimeout",
+    "ReadTimeout", "WriteTimeout", "PoolTimeout", "ReadError", "RemoteProtocolError",
+    "ConnectionError", "Timeout",
+}
+
+
+class UpstreamError(Exception):
+    """
+    An LLM or search provider call failed for good. status_code is what the
+    chat routes answer with; retry_after (seconds) is sent as Retry-After.
+    """
+    status_code = 502
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    """The provider's circuit breaker is open; the call was not attempted."""
+    status_code = 503
+
+
+class DeadlineExceeded(UpstreamError):
+    """The chat request ran out of time."""
+    status_code = 504
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for timeouts, connection failures, 429s and 5xx responses."""
+    if isinstance(error, UpstreamError):
+        return False
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    timeout bounds one attempt in seconds (None: no bound). Failed attempts
+    are retried up to max_retries times after a jittered exponential backoff.
+    """
+    timeout: Optional[float]
+    max_retries: int
+    backoff_base: float
+    backoff_max: float
+
+    def backoff(self, attempt: int) -> float:
+        # "Full jitter": a uniform draw up to the exponential cap, so clients
+        # that failed together do not retry together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Fails calls to a provider fast once it looks down.
+
+    Closed: calls go through. failure_threshold retryable failures in a row
+    open the breaker, and calls fail with CircuitOpenError for reset_timeout
+    seconds. After that one trial call is let through (half-open): success
+    closes the breaker, failure opens it again. Thread safe.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            wait = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and wait <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} is unavailable", retry_after=max(wait, 1.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"Circuit {self.name} closed")
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                    logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def record_neutral(self) -> None:
+        """The call failed for a reason that says nothing about the provider."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """The process-wide breaker for one provider, e.g. "llm:openai"."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            settings = get_settings()
+            breaker = _breakers[name] = CircuitBreaker(
+                name, settings.breaker_failure_threshold, settings.breaker_reset_seconds)
+        return breaker
+
+
+def breaker_stats() -> Dict[str, dict]:
+    with _breakers_lock:
+        return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+
+# Monotonic time by which the current chat request must finish, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Give every guarded call made inside the block a shared time budget. Calls
+    are cut short to fit it and DeadlineExceeded is raised once it is spent.
+    A nested block never extends an outer one.
+    """
+    if not seconds:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    _deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield
+    finally:
+        # Not a token reset: inside an async generator the block may be
+        # left from another context than the one it was entered in
+        _deadline.set(outer)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, None when there is none."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def _attempt_timeout(policy: RetryPolicy) -> Optional[float]:
+    left = remaining()
+    if left is None:
+        return policy.timeout
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left if policy.timeout is None else min(policy.timeout, left)
+
+
+def _next_delay(policy: RetryPolicy, breaker: CircuitBreaker, attempt: int, error: BaseException) -> float:
+    """Backoff before retrying error, or raise if the call should not be retried."""
+    if not is_retryable(error):
+        breaker.record_neutral()
+        raise error
+    breaker.record_failure()
+    if attempt >= policy.max_retries:
+        raise UpstreamError(
+            f"{breaker.name} failed after {attempt + 1} attempts: {error!r}") from error
+    delay = policy.backoff(attempt)
+    left = remaining()
+    if left is not None and delay >= left:
+        raise DeadlineExceeded("Request deadline exceeded") from error
+    logger.info(f"Retrying {breaker.name} in {delay:.2f}s after {error!r}")
+    return delay
+
+
+def _record_midstream(breaker: CircuitBreaker, error: BaseException) -> None:
+    # A stream that broke after its first chunk is not retried, but still
+    # counts against the provider
+    if is_retryable(error):
+        breaker.record_failure()
+    else:
+        breaker.record_neutral()
+
+
+def call(fn: Callable[[], Any], policy: RetryPolicy, breaker: CircuitBreaker) -> Any:
+    """
+    Run fn under the policy and breaker. Blocking calls cannot be cut short
+    from here, so policy.timeout is left to the client's own timeout; the
+    deadline is checked before every attempt.
+    """
+    attempt = 0
+    while True:
+        _attempt_timeout(policy)
+        breaker.before_call()
+        try:
+            result = fn()
+        except Exception as e:
+            time.sleep(_next_delay(policy, breaker, attempt, e))
+            attempt += 1
+            continue
+        except BaseException:
+            # Interrupted, not failed: free the half-open probe for the next call
+            breaker.record_neutral()
+            raise
+        breaker.record_success()
+        return result
+
+
+async def acall(fn: Callable[[], Any], policy: RetryPolicy, breaker: CircuitBreaker) -> Any:
+    """Async version of call, fn returns an awaitable. Each attempt is bounded by policy.timeout."""
+    attempt = 0
+    while True:
+        timeout = _attempt_timeout(policy)
+        breaker.before_call()
+        try:
+            result = await asyncio.wait_for(fn(), timeout)
+        except Exception as e:
+            await asyncio.sleep(_next_delay(policy, breaker, attempt, e))
+            attempt += 1
+            continue
+        except BaseException:
+            # Cancelled: free the half-open probe for the next call
+            breaker.record_neutral()
+            raise
+        breaker.record_success()
+        return result
+
+
+def stream(fn: Callable[[], Iterator], policy: RetryPolicy, breaker: CircuitBreaker) -> Iterator:
+    """
+    Iterate over fn() under the policy and breaker. Only a stream that failed
+    before its first chunk is retried, so callers never see a chunk twice.
+    """
+    attempt = 0
+    while True:
+        _attempt_timeout(policy)
+        breaker.before_call()
+        started = False
+        try:
+            for chunk in fn():
+                started = True
+                yield chunk
+        except Exception as e:
+            if started:
+                _record_midstream(breaker, e)
+                raise
+            time.sleep(_next_delay(policy, breaker, attempt, e))
+            attempt += 1
+            continue
+        except BaseException:
+            # Closed by the consumer or interrupted: free the half-open probe
+            breaker.record_neutral()
+            raise
+        breaker.record_success()
+        return
+
+
+async def astream(fn: Callable[[], AsyncIterator], policy: RetryPolicy, breaker: CircuitBreaker) -> AsyncIterator:
+    """Async version of stream. policy.timeout bounds the wait for each chunk."""
+    attempt = 0
+    while True:
+        breaker_checked = False
+        started = False
+        iterator = None
+        try:
+            timeout = _attempt_timeout(policy)
+            breaker.before_call()
+            breaker_checked = True
+            iterator = fn().__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                started = True
+                yield chunk
+                timeout = _attempt_timeout(policy)
+        except UpstreamError:
+            if breaker_checked:
+                breaker.record_neutral()
+            raise
+        except Exception as e:
+            if started:
+                _record_midstream(breaker, e)
+                raise
+            await asyncio.sleep(_next_delay(policy, breaker, attempt, e))
+            attempt += 1
+            continue
+        except BaseException:
+            # Cancelled or closed by the consumer: free the half-open probe
+            if breaker_checked:
+                breaker.record_neutral()
+            raise
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        breaker.record_success()
+        return
+
+
+class GuardedRunnable(Runnable):
+    """
+    Runs a runnable (a chat model, possibly with functions bound) under a
+    retry policy and circuit breaker. Calls pass the caller's config straight
+    through, so callbacks and streamed events look the same as without it.
+    """
+
+    def __init__(self, inner: Runnable, policy: RetryPolicy, breaker: CircuitBreaker):
+        self.inner = inner
+        self.policy = policy
+        self.breaker = breaker
+
+    @property
+    def InputType(self):
+        return self.inner.InputType
+
+    @property
+    def OutputType(self):
+        return self.inner.OutputType
+
+    def invoke(self, input, config=None, **kwargs):
+        return call(lambda: self.inner.invoke(input, config, **kwargs), self.policy, self.breaker)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await acall(lambda: self.inner.ainvoke(input, config, **kwargs), self.policy, self.breaker)
+
+    def stream(self, input, config=None, **kwargs):
+        yield from stream(lambda: self.inner.stream(input, config, **kwargs), self.policy, self.breaker)
+
+    async def astream(self, input, config=None, **kwargs):
+        async for chunk in astream(lambda: self.inner.astream(input, config, **kwargs), self.policy, self.breaker):
+            yield chunk
+
+
+class _ToolFailure(Exception):
+    """A tool reported an error in its result instead of raising."""
+    status_code = 503
+
+
+class GuardedTool(BaseTool):
+    """
+    Wraps a tool (TavilySearch) with a retry policy and circuit breaker.
+
+    TavilySearch reports failures as {"error": ...} rather than raising, so
+    such results are retried too. When every attempt fails, or the breaker
+    is open, the agent gets an {"error": ...} result and carries on without
+    search instead of failing the turn.
+    """
+    inner: BaseTool
+    policy: Any
+    breaker: Any
+
+    def __init__(self, inner: BaseTool, policy: RetryPolicy, breaker: CircuitBreaker, **kwargs):
+        super().__init__(
+            inner=inner,
+            policy=policy,
+            breaker=breaker,
+            name=inner.name,
+            description=inner.description,
+            args_schema=inner.args_schema,
+            **kwargs,
+        )
+
+    @staticmethod
+    def _checked(result: Any) -> Any:
+        if isinstance(result, dict) and result.get("error"):
+            raise _ToolFailure(str(result["error"]))
+        return result
+
+    def _run(self, run_manager=None, **kwargs) -> Any:
+        try:
+            return call(lambda: self._checked(self.inner.invoke(kwargs)), self.policy, self.breaker)
+        except DeadlineExceeded:
+            raise
+        except UpstreamError as e:
+            return {"error": str(e)}
+
+    async def _arun(self, run_manager=None, **kwargs) -> Any:
+        async def attempt():
+            return self._checked(await self.inner.ainvoke(kwargs))
+
+        try:
+            return await acall(attempt, self.policy, self.breaker)
+        except DeadlineExceeded:
+            raise
+        except UpstreamError as e:
+            return {"error": str(e)}
+
+
+class GuardedEmbedder:
+    """
+    Runs an embedder (controller/retrieval.py) under a retry policy and
+    circuit breaker. Keeps the inner embedder's name, so stored embeddings
+    still match.
+    """
+
+    def __init__(self, inner, policy: RetryPolicy, breaker: CircuitBreaker):
+        self.inner = inner
+        self.name = inner.name
+        self.policy = policy
+        self.breaker = breaker
+
+    def embed_documents(self, texts):
+        return call(lambda: self.inner.embed_documents(texts), self.policy, self.breaker)
+
+    def embed_query(self, text):
+        return call(lambda: self.inner.embed_query(text), self.policy, self.breaker)
+
+
+def _policy(timeout: Optional[float]) -> RetryPolicy:
+    settings = get_settings()
+    return RetryPolicy(
+        timeout=timeout,
+        max_retries=settings.upstream_max_retries,
+        backoff_base=settings.upstream_backoff_base,
+        backoff_max=settings.upstream_backoff_max,
+    )
+
+
+def guard_model(runnable: Runnable, spec) -> GuardedRunnable:
+    """Guard a runnable built from the chat model for spec (a ModelSpec)."""
+    timeout = spec.timeout or get_settings().llm_timeout
+    return GuardedRunnable(runnable, _policy(timeout), get_breaker(f"llm:{spec.provider}"))
+
+
+def guard_tool(tool: BaseTool, provider: str) -> GuardedTool:
+    """Guard a search tool; provider names its circuit breaker, e.g. "tavily"."""
+    return GuardedTool(tool, _policy(get_settings().search_timeout), get_breaker(f"search:{provider}"))
+
+
+def guard_embedder(embedder, provider: str) -> GuardedEmbedder:
+    """Guard an embedder; provider names its circuit breaker, e.g. "openai"."""
+    return GuardedEmbedder(embedder, _policy(get_settings().embedding_timeout),
+                           get_breaker(f"embeddings:{provider}"))
+
+
+async def within_deadline(awaitable):
+    """Await awaitable, raising DeadlineExceeded if the current deadline passes first."""
+    try:
+        return await asyncio.wait_for(awaitable, remaining())
+    except asyncio.TimeoutError:
+        # Guarded calls turn their own timeouts into UpstreamError, so this is the deadline
+        raise DeadlineExceeded("Request deadline exceeded")
+
+
+async def iterate_within_deadline(iterator: AsyncIterator) -> AsyncIterator:
+    """Iterate over iterator, raising DeadlineExceeded if the current deadline passes."""
+    iterator = iterator.__aiter__()
+    while True:
+        try:
+            item = await within_deadline(iterator.__anext__())
+        except StopAsyncIteration:
+            return
+        yield item
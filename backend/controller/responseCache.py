@@ -0,0 +1,226 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from db import ResponseCacheEntry, UploadedFile
+from .agents import agent_fingerprint
+from .agentOutputs import AGENT_OUTPUT_MODELS
+from .retrieval import Embedder, get_embedder
+from .searchCache import normalize_query
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Off unless RESPONSE_CACHE_ENABLED=true
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+# How long a stored answer is served, per agent type. Types not listed (or set
+# to 0) are never cached; general and research answers depend on the
+# conversation and on current web results. Override one with
+# RESPONSE_CACHE_TTL_<AGENT_TYPE>, e.g. RESPONSE_CACHE_TTL_NOTE=86400
+RESPONSE_CACHE_TTLS = {
+    "flashcard": 7 * 24 * 60 * 60,
+    "feynman": 7 * 24 * 60 * 60,
+    "diagram": 7 * 24 * 60 * 60,
+    "note": 3 * 24 * 60 * 60,
+    "step": 24 * 60 * 60,
+}
+# Minimum cosine similarity between prompts for a near match
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Most recent entries of a scope compared on a near-match lookup
+RESPONSE_CACHE_SCAN_LIMIT = int(os.getenv("RESPONSE_CACHE_SCAN_LIMIT", "500"))
+
+
+def response_ttl(agent_type: str) -> int:
+    """Seconds a cached answer of agent_type stays fresh, 0 when not cached."""
+    override = os.getenv(f"RESPONSE_CACHE_TTL_{agent_type.upper()}")
+    if override:
+        return int(override)
+    return RESPONSE_CACHE_TTLS.get(agent_type, 0)
+
+
+def _digest(value: Any) -> str:
+    raw = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ResponseCacheKey:
+    """
+    Identifies one cacheable agent request.
+
+    scope covers everything but the prompt text: the agent type and its
+    fingerprint (system prompt, output model, model settings), the SHA-256
+    of each selected file, and the conversation so far. Entries only match
+    within a scope; the prompt is then compared exactly (prompt_key) or by
+    embedding similarity.
+    """
+    agent_type: str
+    prompt: str
+    scope: str
+    prompt_key: str
+    ttl: int
+    _embedding: Optional[List[float]] = field(default=None, repr=False)
+
+    def embedding(self, embedder: Embedder) -> List[float]:
+        if self._embedding is None:
+            self._embedding = embedder.embed_query(self.prompt)
+        return self._embedding
+
+
+class ResponseCache:
+    """
+    Stored structured outputs of agent runs, reused for repeated requests.
+
+    Entries live in the response_cache table. A prompt edit in any
+    create_*_agent changes the agent's fingerprint and so the scope, which
+    makes earlier entries unreachable; they are deleted once they expire.
+    """
+
+    def __init__(self, enabled: bool = RESPONSE_CACHE_ENABLED, similarity: float = RESPONSE_CACHE_SIMILARITY,
+                 embedder: Optional[Embedder] = None):
+        self.enabled = enabled
+        self.similarity = similarity
+        self._embedder = embedder
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+
+    @property
+    def embedder(self) -> Embedder:
+        return self._embedder or get_embedder()
+
+    def key(self, db, agent_type: str, message: str, file_ids: List[str],
+            chat_history: List[dict], memory=None, model=None) -> Optional[ResponseCacheKey]:
+        """
+        Build the cache key for a request, or None when the request is not
+        cacheable (cache disabled, or agent type without a freshness policy).
+        model is the request's ModelSpec, the agent type's routed model by default.
+        """
+        ttl = response_ttl(agent_type)
+        if not self.enabled or ttl <= 0:
+            return None
+
+        file_hashes = []
+        if file_ids:
+            file_hashes = sorted(sha256 for (sha256,) in db.query(UploadedFile.sha256).filter(
+                UploadedFile.id.in_([uuid.UUID(fid) for fid in file_ids])
+            ).all())
+        history = {
+            "summary": memory.summary if memory else None,
+            "messages": chat_history[memory.summary_seq if memory else 0:],
+        }
+        prompt = normalize_query(message)
+        return ResponseCacheKey(
+            agent_type=agent_type,
+            prompt=prompt,
+            scope=_digest([agent_type, agent_fingerprint(agent_type, model), file_hashes, history]),
+            prompt_key=_digest(prompt),
+            ttl=ttl,
+        )
+
+    def lookup(self, db, key: ResponseCacheKey) -> Optional[dict]:
+        """
+        Return the stored output for key: an exact prompt match if there is
+        one, else the most similar prompt in the scope above the similarity
+        threshold. Commits the hit counter update.
+        """
+        now = datetime.utcnow()
+        entry = db.query(ResponseCacheEntry.id, ResponseCacheEntry.result).filter(
+            ResponseCacheEntry.scope == key.scope,
+            ResponseCacheEntry.prompt_key == key.prompt_key,
+            ResponseCacheEntry.expires_at > now
+        ).order_by(ResponseCacheEntry.created_at.desc()).first()
+        kind = "exact"
+
+        if entry is None:
+            entry, kind = self._nearest(db, key, now), "similar"
+
+        if entry is None:
+            db.commit()
+            with self._lock:
+                self.misses += 1
+            return None
+
+        db.query(ResponseCacheEntry).filter(ResponseCacheEntry.id == entry.id).update(
+            {ResponseCacheEntry.hits: ResponseCacheEntry.hits + 1}, synchronize_session=False)
+        db.commit()
+        with self._lock:
+            if kind == "exact":
+                self.exact_hits += 1
+            else:
+                self.similar_hits += 1
+        logger.info(f"Response cache {kind} hit for {key.agent_type}")
+        return entry.result
+
+    def _nearest(self, db, key: ResponseCacheKey, now: datetime):
+        embedder = self.embedder
+        rows = db.query(ResponseCacheEntry.id, ResponseCacheEntry.embedding, ResponseCacheEntry.result).filter(
+            ResponseCacheEntry.scope == key.scope,
+            ResponseCacheEntry.embedder == embedder.name,
+            ResponseCacheEntry.expires_at > now
+        ).order_by(ResponseCacheEntry.created_at.desc()).limit(RESPONSE_CACHE_SCAN_LIMIT).all()
+        if not rows:
+            return None
+
+        matrix = np.array([row.embedding for row in rows], dtype=float)
+        query_vector = np.array(key.embedding(embedder), dtype=float)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        scores = matrix @ query_vector / np.where(norms == 0, 1.0, norms)
+        best = int(np.argmax(scores))
+        return rows[best] if scores[best] >= self.similarity else None
+
+    def store(self, db, key: ResponseCacheKey, result: dict) -> None:
+        """Save an agent's output under key and drop expired entries. Commits."""
+        now = datetime.utcnow()
+        embedder = self.embedder
+        db.add(ResponseCacheEntry(
+            agent_type=key.agent_type,
+            scope=key.scope,
+            prompt_key=key.prompt_key,
+            prompt=key.prompt,
+            embedding=key.embedding(embedder),
+            embedder=embedder.name,
+            result=result,
+            expires_at=now + timedelta(seconds=key.ttl),
+        ))
+        db.query(ResponseCacheEntry).filter(
+            ResponseCacheEntry.expires_at <= now
+        ).delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            self.stores += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": hits,
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "similarity": self.similarity,
+                "ttl_seconds": {agent_type: response_ttl(agent_type)
+                                for agent_type in AGENT_OUTPUT_MODELS},
+            }
+
+
+@lru_cache(maxsize=1)
+def get_response_cache() -> ResponseCache:
+    return ResponseCache()
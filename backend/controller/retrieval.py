@@ -0,0 +1,326 @@
+import os
+import re
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from config import get_settings
+from db import FileChunk, UploadedFile
+from .memory import token_encoding
+from .resilience import guard_embedder
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "openai" for OpenAI embeddings, "hash" for the deterministic local embedder
+EMBEDDER = os.getenv("EMBEDDER", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+# Texts per embedding request when indexing a file
+EMBEDDING_BATCH_SIZE = 64
+# Megabytes of chunk embeddings kept in memory between chat turns
+RETRIEVAL_CACHE_MB = int(os.getenv("RETRIEVAL_CACHE_MB", "128"))
+
+
+def chunk_text(text: str, chunk_tokens: int = CHUNK_TOKENS,
+               overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """
+    Split text into windows of chunk_tokens tokens, each overlapping the
+    previous one by overlap_tokens so sentences on a boundary are not lost.
+    """
+    tokens = token_encoding().encode(text)
+    if not tokens:
+        return []
+
+    step = max(1, chunk_tokens - overlap_tokens)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunk = token_encoding().decode(tokens[start:start + chunk_tokens]).strip()
+        if chunk:
+            chunks.append(chunk)
+        if start + chunk_tokens >= len(tokens):
+            break
+    return chunks
+
+
+class Embedder:
+    """
+    Turns text into vectors for retrieval.
+
+    name identifies the model; stored chunks are only compared with queries
+    embedded by the embedder of the same name.
+    """
+    name: str
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class OpenAIEmbedder(Embedder):
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        from langchain_openai import OpenAIEmbeddings
+        self.name = f"openai:{model}"
+        # Retries are done by controller/resilience.py, so the client makes one attempt
+        self.client = OpenAIEmbeddings(
+            model=model, request_timeout=get_settings().embedding_timeout, max_retries=0)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.embed_query(text)
+
+
+class HashEmbedder(Embedder):
+    """
+    Deterministic local embedder using the hashing trick over lowercased
+    words. Needs no network or API key, for tests and offline runs; its
+    retrieval quality is only lexical.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+        self.name = f"hash:{dimensions}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] % 2 == 0 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+
+@lru_cache(maxsize=1)
+def get_embedder() -> Embedder:
+    """
+    Return the embedder selected by EMBEDDER ("openai" or "hash"). OpenAI
+    calls go through the same retry policy and circuit breaker as the model.
+    """
+    if EMBEDDER == "openai":
+        return guard_embedder(OpenAIEmbedder(), "openai")
+    if EMBEDDER == "hash":
+        return HashEmbedder()
+    raise ValueError(f"Unknown EMBEDDER: {EMBEDDER}")
+
+
+def index_file_chunks(db, file_id, text: str, embedder: Optional[Embedder] = None) -> int:
+    """
+    Chunk and embed a file's text and store the chunks, replacing any
+    chunks stored for the file by the same embedder. Does not commit.
+
+    Returns:
+        Number of chunks stored
+    """
+    embedder = embedder or get_embedder()
+    chunks = chunk_text(text or "")
+
+    db.query(FileChunk).filter(
+        FileChunk.file_id == file_id,
+        FileChunk.embedder == embedder.name
+    ).delete(synchronize_session=False)
+    _embedding_cache.discard((str(file_id), embedder.name))
+
+    for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
+        batch = chunks[start:start + EMBEDDING_BATCH_SIZE]
+        embeddings = embedder.embed_documents(batch)
+        for offset, (content, embedding) in enumerate(zip(batch, embeddings)):
+            db.add(FileChunk(
+                file_id=file_id,
+                chunk_index=start + offset,
+                content=content,
+                embedding=embedding,
+                embedder=embedder.name,
+            ))
+    return len(chunks)
+
+
+def _unindexed(db, file_ids: List[str], embedder: Embedder) -> List[str]:
+    indexed = {
+        str(file_id) for (file_id,) in db.query(FileChunk.file_id).filter(
+            FileChunk.file_id.in_([uuid.UUID(file_id) for file_id in file_ids]),
+            FileChunk.embedder == embedder.name
+        ).distinct()
+    }
+    return [file_id for file_id in file_ids if file_id not in indexed]
+
+
+class EmbeddingCache:
+    """
+    Chunk embeddings of recently used files, so a chat turn about the same
+    files does not read every embedding from the database again. Each entry
+    is a file's chunk indices and its unit-length embedding matrix; the least
+    recently used files are dropped once entries take more than max_bytes.
+
+    A file's text never changes after extraction, so its chunks for one
+    embedder are always the same and entries need no invalidation across
+    processes. Thread safe.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(entry) -> int:
+        return entry[0].nbytes + entry[1].nbytes
+
+    def get(self, key: Tuple[str, str]):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple[str, str], entry) -> None:
+        if self._size(entry) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self._bytes += self._size(entry)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+
+    def discard(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= self._size(entry)
+
+
+_embedding_cache = EmbeddingCache(RETRIEVAL_CACHE_MB * 1024 * 1024)
+
+
+def _chunk_embeddings(db, file_ids: List[str], embedder: Embedder) -> Dict[str, tuple]:
+    """(chunk indices, unit-length embedding matrix) of each file, from the cache or the database."""
+    matrices = {}
+    for file_id in file_ids:
+        entry = _embedding_cache.get((file_id, embedder.name))
+        if entry is not None:
+            matrices[file_id] = entry
+
+    uncached = [file_id for file_id in file_ids if file_id not in matrices]
+    if not uncached:
+        return matrices
+
+    rows = db.query(FileChunk.file_id, FileChunk.chunk_index, FileChunk.embedding).filter(
+        FileChunk.file_id.in_([uuid.UUID(file_id) for file_id in uncached]),
+        FileChunk.embedder == embedder.name
+    ).order_by(FileChunk.file_id, FileChunk.chunk_index).all()
+    by_file: Dict[str, list] = {file_id: [] for file_id in uncached}
+    for row in rows:
+        by_file[str(row.file_id)].append(row)
+
+    for file_id, file_rows in by_file.items():
+        indices = np.array([row.chunk_index for row in file_rows], dtype=np.int32)
+        matrix = np.array([row.embedding for row in file_rows], dtype=np.float32)
+        if len(file_rows):
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1.0, norms)
+        entry = (indices, matrix)
+        _embedding_cache.put((file_id, embedder.name), entry)
+        matrices[file_id] = entry
+    return matrices
+
+
+def retrieve_chunks(db, file_ids: List[str], query: str, k: int = RETRIEVAL_TOP_K,
+                    embedder: Optional[Embedder] = None) -> List[dict]:
+    """
+    Return the k chunks of the given files most similar to query.
+
+    Files that have no chunks for the current embedder yet (uploaded before
+    retrieval existed, or whose indexing failed) are indexed first. Only
+    those files' extracted text is read; the others are served from their
+    chunks alone.
+
+    Args:
+        db: Database session
+        file_ids: Ids of the files to search
+        query: The user's message
+        k: Number of chunks to return
+
+    Returns:
+        List of {file_id, chunk_index, content, score}, in file and chunk order
+    """
+    if not file_ids:
+        return []
+
+    embedder = embedder or get_embedder()
+    file_ids = list(dict.fromkeys(str(uuid.UUID(str(file_id))) for file_id in file_ids))
+
+    missing = _unindexed(db, file_ids, embedder)
+    if missing:
+        # Lock the files, then check again: a concurrent request may have
+        # indexed them while this one waited for the lock
+        texts = db.query(UploadedFile.id, UploadedFile.content).filter(
+            UploadedFile.id.in_([uuid.UUID(file_id) for file_id in missing])
+        ).order_by(UploadedFile.id).with_for_update().all()
+        missing = set(_unindexed(db, missing, embedder))
+        for file_id, text in texts:
+            if str(file_id) in missing:
+                index_file_chunks(db, file_id, text, embedder)
+        db.commit()
+
+    matrices = _chunk_embeddings(db, file_ids, embedder)
+    candidates = [(file_id, indices, matrix) for file_id, (indices, matrix) in matrices.items()
+                  if len(indices)]
+    if not candidates:
+        return []
+
+    query_vector = np.array(embedder.embed_query(query), dtype=np.float32)
+    query_vector /= np.linalg.norm(query_vector) or 1.0
+    scores = np.concatenate([matrix @ query_vector for _, _, matrix in candidates])
+    owners = np.concatenate([np.full(len(indices), position)
+                             for position, (_, indices, _) in enumerate(candidates)])
+    chunk_indices = np.concatenate([indices for _, indices, _ in candidates])
+
+    top = np.argsort(-scores)[:k]
+    picked = {(candidates[owners[i]][0], int(chunk_indices[i])): float(scores[i]) for i in top}
+
+    # Only the selected chunks' text is read
+    contents = db.query(FileChunk.file_id, FileChunk.chunk_index, FileChunk.content).filter(
+        FileChunk.file_id.in_({uuid.UUID(file_id) for file_id, _ in picked}),
+        FileChunk.chunk_index.in_({chunk_index for _, chunk_index in picked}),
+        FileChunk.embedder == embedder.name
+    ).all()
+    selected = [{
+        "file_id": str(row.file_id),
+        "chunk_index": row.chunk_index,
+        "content": row.content,
+        "score": picked[(str(row.file_id), row.chunk_index)],
+    } for row in contents if (str(row.file_id), row.chunk_index) in picked]
+    # Read in document order so neighbouring chunks stay coherent
+    selected.sort(key=lambda chunk: (file_ids.index(chunk["file_id"]), chunk["chunk_index"]))
+    return selected
+
+
+def format_chunks(chunks: List[dict]) -> str:
+    """Render retrieved chunks as reference text for the prompt."""
+    return "\n\n".join(
+        f"[File {chunk['file_id']}, excerpt {chunk['chunk_index'] + 1}]\n{chunk['content']}"
+        for chunk in chunks
+    )
@@ -0,0 +1,363 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.tools import BaseTool
+from sqlalchemy import create_engine, select, delete
+
+from db import SearchCacheEntry, get_engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2048"))
+# Second cache tier shared between workers and restarts: empty for in-memory
+# only, "db" for the app database, or any SQLAlchemy URL such as
+# sqlite:///./search_cache.db
+SEARCH_CACHE_STORE = os.getenv("SEARCH_CACHE_STORE", "")
+# Expired rows are deleted from the store once every this many writes
+STORE_PURGE_EVERY = 200
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a search query, so that queries differing only in
+    case, spacing, quotes or trailing punctuation share a cache entry.
+    """
+    query = unicodedata.normalize("NFKC", query or "").lower()
+    query = re.sub(r"[\"'`“”‘’]", "", query)
+    query = re.sub(r"\s+", " ", query).strip()
+    return query.strip(" .?!,;:")
+
+
+def cache_key(namespace: str, args: dict) -> Tuple[str, str]:
+    """
+    Cache key for a search call.
+
+    Returns:
+        tuple: (key, normalized query) where key is the hex SHA-256 of the
+        namespace, the normalized query and the other non-empty arguments
+    """
+    query = normalize_query(args.get("query", ""))
+    options = {name: value for name, value in args.items()
+               if name != "query" and value not in (None, [], "")}
+    raw = json.dumps([namespace, query, options], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest(), query
+
+
+def is_cacheable(result: Any) -> bool:
+    # Tavily returns {"error": ...} on API failures and the tool turns a
+    # "no results" ToolException into a plain message; neither is worth keeping
+    return isinstance(result, dict) and "error" not in result
+
+
+class _LeaderGone(Exception):
+    """Set on an in-flight future whose leader was cancelled; its waiters search again."""
+
+
+class SqlSearchStore:
+    """
+    Search results kept in the search_cache table of a SQL database, so
+    workers and restarts share them. Values are stored as JSON text.
+    """
+
+    def __init__(self, bind):
+        self.engine = bind
+        self.table = SearchCacheEntry.__table__
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.result, self.table.c.expires_at)
+                .where(self.table.c.key == key)
+            ).first()
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None
+        return json.loads(row.result)
+
+    def put(self, key: str, query: str, result: Any, ttl: int) -> None:
+        now = datetime.utcnow()
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.key == key))
+            conn.execute(self.table.insert().values(
+                key=key,
+                query=query,
+                result=json.dumps(result, default=str),
+                expires_at=now + timedelta(seconds=ttl),
+                created_at=now,
+            ))
+            self._writes += 1
+            if self._writes % STORE_PURGE_EVERY == 0:
+                conn.execute(delete(self.table).where(self.table.c.expires_at <= now))
+
+
+class SearchCache:
+    """
+    Two-tier TTL cache for search results with coalescing of in-flight calls.
+
+    The first tier is an in-memory LRU of at most max_entries results; the
+    optional store (SqlSearchStore) is checked on a memory miss and filled on
+    every successful search. While a search for a key is running, other
+    callers asking for the same key wait for its result instead of sending
+    their own request. Sync and async callers share the in-flight table.
+    A failed search fails its waiters too; a cancelled one does not, and
+    one of them runs the search instead.
+    """
+
+    def __init__(self, ttl: int = SEARCH_CACHE_TTL_SECONDS, max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+                 store: Optional[SqlSearchStore] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.errors = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _memory_put(self, key: str, result: Any) -> None:
+        # Caller holds the lock
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _store_get(self, key: str) -> Optional[Any]:
+        if self.store is None:
+            return None
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            logger.warning(f"Search cache store read failed: {str(e)}")
+            return None
+
+    def _store_put(self, key: str, query: str, result: Any) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.put(key, query, result, self.ttl)
+        except Exception as e:
+            logger.warning(f"Search cache store write failed: {str(e)}")
+
+    def _claim(self, key: str) -> Tuple[Optional[Any], Optional[Future], bool]:
+        """
+        Look key up in memory and the in-flight table.
+
+        Returns:
+            tuple: (cached result, future, leader). leader is True when the
+            caller registered the future and must run the search itself.
+        """
+        with self._lock:
+            result = self._memory_get(key)
+            if result is not None:
+                self.memory_hits += 1
+                return result, None, False
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            future = Future()
+            self._in_flight[key] = future
+            return None, future, True
+
+    def _from_store(self, key: str) -> Optional[Any]:
+        result = self._store_get(key)
+        if result is not None:
+            with self._lock:
+                self.store_hits += 1
+                self._memory_put(key, result)
+        return result
+
+    def _finish(self, key: str, query: str, future: Future, result: Any = None,
+                error: Optional[BaseException] = None, searched: bool = True) -> None:
+        cacheable = error is None and is_cacheable(result)
+        if searched and cacheable:
+            self._store_put(key, query, result)
+        with self._lock:
+            if searched:
+                self.misses += 1
+                if not cacheable:
+                    self.errors += 1
+            if cacheable:
+                self._memory_put(key, result)
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _abandon(self, key: str, future: Future) -> None:
+        # The leader was cancelled or interrupted: nothing is cached and the
+        # waiters retry rather than fail with an error that was not theirs
+        with self._lock:
+            self._in_flight.pop(key, None)
+        future.set_exception(_LeaderGone())
+
+    def get_or_search(self, key: str, query: str, search) -> Any:
+        """
+        Return the cached result for key, or call search() to produce it.
+
+        Results that are not a dict, or carry an "error" key, are returned
+        to the caller but not cached.
+        """
+        while True:
+            result, future, leader = self._claim(key)
+            if future is None:
+                return result
+            if leader:
+                break
+            try:
+                return future.result()
+            except _LeaderGone:
+                continue
+
+        try:
+            result = self._from_store(key)
+            if result is not None:
+                self._finish(key, query, future, result, searched=False)
+                return result
+            result = search()
+        except Exception as e:
+            self._finish(key, query, future, error=e)
+            raise
+        except BaseException:
+            self._abandon(key, future)
+            raise
+        self._finish(key, query, future, result)
+        return result
+
+    async def aget_or_search(self, key: str, query: str, asearch) -> Any:
+        """Async version of get_or_search; asearch is a coroutine function."""
+        while True:
+            result, future, leader = self._claim(key)
+            if future is None:
+                return result
+            if leader:
+                break
+            try:
+                return await asyncio.wrap_future(future)
+            except _LeaderGone:
+                continue
+
+        try:
+            result = await asyncio.to_thread(self._from_store, key) if self.store else None
+            if result is not None:
+                self._finish(key, query, future, result, searched=False)
+                return result
+            result = await asearch()
+        except Exception as e:
+            self._finish(key, query, future, error=e)
+            raise
+        except BaseException:
+            self._abandon(key, future)
+            raise
+        if self.store is not None and is_cacheable(result):
+            await asyncio.to_thread(self._finish, key, query, future, result)
+        else:
+            self._finish(key, query, future, result)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.store_hits + self.coalesced
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "in_flight": len(self._in_flight),
+                "ttl_seconds": self.ttl,
+                "store": type(self.store).__name__ if self.store else None,
+            }
+
+
+def _make_store(spec: str) -> Optional[SqlSearchStore]:
+    if not spec:
+        return None
+    if spec == "db":
+        return SqlSearchStore(get_engine())
+    # A dedicated database (e.g. SQLite) has no migrations; create the table here
+    bind = create_engine(spec)
+    SearchCacheEntry.__table__.create(bind, checkfirst=True)
+    return SqlSearchStore(bind)
+
+
+@lru_cache(maxsize=1)
+def get_search_cache() -> SearchCache:
+    return SearchCache(store=_make_store(SEARCH_CACHE_STORE))
+
+
+class CachedSearchTool(BaseTool):
+    """
+    Wraps a search tool (TavilySearch) with a SearchCache.
+
+    Exposes the wrapped tool's name, description and arguments, so agents
+    bind it exactly like the tool itself. namespace should identify the
+    wrapped tool's fixed settings (search depth, result count, ...), so
+    differently configured tools never share results.
+    """
+    inner: BaseTool
+    cache: Any
+    namespace: str
+
+    def __init__(self, inner: BaseTool, cache: Optional[SearchCache] = None,
+                 namespace: Optional[str] = None, **kwargs):
+        super().__init__(
+            inner=inner,
+            cache=cache or get_search_cache(),
+            namespace=namespace or inner.name,
+            name=inner.name,
+            description=inner.description,
+            args_schema=inner.args_schema,
+            **kwargs,
+        )
+
+    def _run(self, run_manager=None, **kwargs) -> Any:
+        key, query = cache_key(self.namespace, kwargs)
+        return self.cache.get_or_search(
+            key, query, lambda: self.inner.invoke(kwargs))
+
+    async def _arun(self, run_manager=None, **kwargs) -> Any:
+        key, query = cache_key(self.namespace, kwargs)
+        return await self.cache.aget_or_search(
+            key, query, lambda: self.inner.ainvoke(kwargs))
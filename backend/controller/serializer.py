@@ -0,0 +1,78 @@
+import base64
+from typing import Any
+
+import orjson
+from langchain_core.messages import BaseMessage, messages_from_dict
+from pydantic import BaseModel
+
+from .agentOutputs import AGENT_OUTPUT_MODELS
+
+# Dict keys that are not strings (ints, UUIDs, ...) are written as strings
+# instead of failing, and numpy arrays (embeddings) as lists
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def message_to_dict(message: BaseMessage) -> dict:
+    """
+    A LangChain message as a plain dict: every field of the message,
+    including its "type" ("human", "ai", "tool", ...). message_from_dict
+    turns it back into an equal message.
+    """
+    # Message fields hold JSON types already (content, kwargs and metadata
+    # dicts, tool calls as TypedDicts), so a copy of the field values is the
+    # same as model_dump() without walking every nested value in Python
+    return dict(message.__dict__)
+
+
+def message_from_dict(data: dict) -> BaseMessage:
+    """Rebuild the message message_to_dict produced."""
+    return messages_from_dict([{"type": data["type"], "data": data}])[0]
+
+
+def _default(value: Any) -> Any:
+    # Called by orjson for every value it cannot write natively; the
+    # returned value is serialized in its place
+    if isinstance(value, BaseMessage):
+        return message_to_dict(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    # pydantic v1 models (langchain_core.pydantic_v1)
+    if hasattr(value, "dict") and hasattr(value, "__fields__"):
+        return value.dict()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, BaseException):
+        return f"{type(value).__name__}: {value}"
+    # Anything else is written as its str(), as the old clean_dict did
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Serialize value to JSON bytes. Handles LangChain messages, pydantic
+    models (such as the output models in agentOutputs.py), dataclasses,
+    datetimes, UUIDs and numpy arrays; anything else becomes its str().
+    """
+    return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+
+def loads(data) -> Any:
+    return orjson.loads(data)
+
+
+def to_jsonable(value: Any) -> Any:
+    """
+    value as plain JSON types (dict, list, str, number, bool, None), ready
+    for a JSONB column or a response body.
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return orjson.loads(dumps(value))
+
+
+def agent_output_from_dict(agent_type: str, data: dict) -> BaseModel:
+    """Rebuild an agent's structured output from its serialized result, validated against its output model."""
+    return AGENT_OUTPUT_MODELS[agent_type].model_validate(data)
+
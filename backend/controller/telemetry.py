@@ -0,0 +1,351 @@
+import time
+import inspect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Spans go to OpenTelemetry when its API is installed. Without an SDK and
+# exporter configured (e.g. by opentelemetry-instrument) the API is itself a
+# no-op, so tracing costs nothing until a collector is set up
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.trace import Status, StatusCode
+    _tracer = otel_trace.get_tracer("canvasAgents")
+except ImportError:
+    otel_trace = None
+    _tracer = None
+
+# Upper bounds (seconds) of the latency histogram buckets, from a DB read to a long agent loop
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """A Prometheus counter with labels."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: List[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """A Prometheus histogram with labels."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: List[str], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # Label values -> (count per bucket, sum, count)
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labels, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """The metrics of this process, rendered in the Prometheus text format by /metrics."""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, documentation: str, labels: List[str]) -> Counter:
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: List[str], buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_seconds", "Time spent in each traced stage of a chat request", ["stage", "agent_type"])
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "agent_llm_call_seconds", "Duration of each LLM step of an agent loop", ["agent_type", "model"])
+LLM_CALLS = REGISTRY.counter(
+    "agent_llm_calls_total", "LLM steps made by agents", ["agent_type", "model", "status"])
+LLM_TOKENS = REGISTRY.counter(
+    "agent_llm_tokens_total", "Tokens used by agent LLM steps; kind is prompt or completion",
+    ["agent_type", "model", "kind"])
+TOOL_CALL_SECONDS = REGISTRY.histogram(
+    "agent_tool_call_seconds", "Duration of each tool call made by an agent", ["agent_type", "tool"])
+TOOL_CALLS = REGISTRY.counter(
+    "agent_tool_calls_total", "Tool calls made by agents", ["agent_type", "tool", "status"])
+
+
+class Span:
+    """A timed stage of a request, mirrored to an OpenTelemetry span when tracing is available."""
+
+    def __init__(self, name: str, agent_type: str, otel_span=None):
+        self.name = name
+        self.agent_type = agent_type
+        self.otel_span = otel_span
+
+    def set(self, **attributes) -> None:
+        """Add attributes to the span. agent_type also becomes the stage's metric label."""
+        if "agent_type" in attributes:
+            self.agent_type = attributes["agent_type"] or ""
+        if self.otel_span is not None:
+            self.otel_span.set_attributes({key: value for key, value in attributes.items()
+                                           if isinstance(value, (str, bool, int, float))})
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, agent_type: str = "", **attributes):
+    """
+    Trace a stage: its duration goes to chat_stage_seconds{stage=name}, and
+    it is an OpenTelemetry span when an SDK is configured. agent_type
+    defaults to the enclosing span's.
+
+    Not for blocks that span a yield of an async generator: the span is
+    made current, which must be undone in the same context.
+    """
+    start = time.perf_counter()
+    parent = _current_span.get()
+    if not agent_type and parent is not None:
+        agent_type = parent.agent_type
+    otel_span = None
+    otel_scope = None
+    if _tracer is not None:
+        otel_scope = _tracer.start_as_current_span(name)
+        otel_span = otel_scope.__enter__()
+    current = Span(name, agent_type, otel_span)
+    current.set(agent_type=agent_type, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        if otel_span is not None:
+            otel_span.record_exception(e)
+            otel_span.set_status(Status(StatusCode.ERROR, str(e)))
+        raise
+    finally:
+        _current_span.reset(token)
+        if otel_scope is not None:
+            otel_scope.__exit__(None, None, None)
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name, agent_type=current.agent_type)
+
+
+def annotate(**attributes) -> None:
+    """Add attributes to the innermost active span, if any (see Span.set)."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def observe_stage(name: str, agent_type: str, seconds: float) -> None:
+    """Record a stage timed by hand, for code where span() cannot be used."""
+    STAGE_SECONDS.observe(seconds, stage=name, agent_type=agent_type)
+
+
+def traced(name: str):
+    """
+    Decorator running a function (sync or async) inside span(name). A route
+    decorated with it can label its stages with annotate(agent_type=...).
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _token_usage(response) -> Tuple[int, int]:
+    """(prompt tokens, completion tokens) of an LLMResult."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class AgentMetricsHandler(BaseCallbackHandler):
+    """
+    Callback handler for one agent run: times every LLM step and tool call,
+    counts tokens, records them in the metrics above labelled with
+    agent_type, and traces each as a child span of the span active when the
+    handler was created.
+
+    Tool calls made inside another tool (the search cache and retry wrappers
+    around Tavily) are part of the outer call and not counted again.
+    """
+    run_inline = True
+
+    def __init__(self, agent_type: str):
+        self.agent_type = agent_type
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # run id -> (start time, otel span, name)
+        self._runs: Dict[UUID, Tuple[float, Any, str]] = {}
+        self._tool_runs = set()
+        self._parent = otel_trace.set_span_in_context(otel_trace.get_current_span()) if otel_trace else None
+
+    def _start(self, run_id: UUID, span_name: str, name: str, **attributes) -> None:
+        otel_span = None
+        if _tracer is not None:
+            otel_span = _tracer.start_span(span_name, context=self._parent, attributes={
+                "agent_type": self.agent_type, **attributes})
+        self._runs[run_id] = (time.perf_counter(), otel_span, name)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **attributes) -> Optional[Tuple[float, str]]:
+        entry = self._runs.pop(run_id, None)
+        if entry is None:
+            return None
+        start, otel_span, name = entry
+        if otel_span is not None:
+            otel_span.set_attributes(attributes)
+            if error is not None:
+                otel_span.record_exception(error)
+                otel_span.set_status(Status(StatusCode.ERROR, str(error)))
+            otel_span.end()
+        return time.perf_counter() - start, name
+
+    @staticmethod
+    def _model_name(kwargs) -> str:
+        params = kwargs.get("invocation_params") or {}
+        return str(params.get("model") or params.get("model_name") or "")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        model = self._model_name(kwargs)
+        self._start(run_id, "agent.llm_step", model, model=model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        model = self._model_name(kwargs)
+        self._start(run_id, "agent.llm_step", model, model=model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = _token_usage(response)
+        ended = self._end(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if ended is None:
+            return
+        elapsed, model = ended
+        self.llm_calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        LLM_CALL_SECONDS.observe(elapsed, agent_type=self.agent_type, model=model)
+        LLM_CALLS.inc(agent_type=self.agent_type, model=model, status="ok")
+        LLM_TOKENS.inc(prompt_tokens, agent_type=self.agent_type, model=model, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, agent_type=self.agent_type, model=model, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        ended = self._end(run_id, error)
+        if ended is not None:
+            self.llm_calls += 1
+            LLM_CALLS.inc(agent_type=self.agent_type, model=ended[1], status="error")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        nested = parent_run_id in self._tool_runs
+        self._tool_runs.add(run_id)
+        if not nested:
+            tool = (serialized or {}).get("name") or kwargs.get("name") or ""
+            self._start(run_id, "agent.tool", tool, tool=tool)
+
+    def _tool_done(self, run_id: UUID, error: Optional[BaseException] = None) -> None:
+        self._tool_runs.discard(run_id)
+        ended = self._end(run_id, error)
+        if ended is None:
+            return
+        elapsed, tool = ended
+        self.tool_calls += 1
+        TOOL_CALL_SECONDS.observe(elapsed, agent_type=self.agent_type, tool=tool)
+        TOOL_CALLS.inc(agent_type=self.agent_type, tool=tool, status="error" if error else "ok")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._tool_done(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._tool_done(run_id, error)
+
+    def summary(self) -> dict:
+        return {
+            "llm_calls": self.llm_calls,
+            "tool_calls": self.tool_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
@@ -0,0 +1,170 @@
+import os
+import hashlib
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+load_dotenv()
+
+# Largest accepted upload, in bytes
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+# Directory for spooled uploads, defaults to the system temp dir
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+# Largest accepted non-file form field, in bytes
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """The request body is not a usable multipart upload."""
+
+
+class UploadTooLarge(UploadError):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+
+@dataclass
+class SpooledUpload:
+    """A file part written to a temp file while the request streamed in."""
+    path: str
+    sha256: str
+    size: int
+    filename: Optional[str]
+    content_type: Optional[str]
+    fields: Dict[str, str] = field(default_factory=dict)
+
+    def cleanup(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class _Part:
+    def __init__(self):
+        self.headers: Dict[bytes, bytes] = {}
+        self.name: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.value = bytearray()
+
+
+async def spool_multipart_upload(request: Request, file_field: str = "file",
+                                 max_bytes: int = UPLOAD_MAX_BYTES) -> SpooledUpload:
+    """
+    Parse a multipart/form-data request as it streams in.
+
+    The file part named file_field is written to a temp file chunk by chunk
+    and hashed as it goes, so memory use does not grow with the file size.
+    Other parts are kept as small text fields. The caller owns the temp file
+    and must call cleanup() on the result.
+
+    Raises:
+        UploadTooLarge: the Content-Length or the streamed file is over max_bytes
+        UploadError: the body is not multipart or has no file part
+    """
+    content_type, params = parse_options_header(
+        request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError("Expected a multipart/form-data body")
+
+    # Reject early when the client announces an oversized body
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MAX_FIELD_BYTES:
+        raise UploadTooLarge(max_bytes)
+
+    fields: Dict[str, str] = {}
+    digest = hashlib.sha256()
+    spool = tempfile.NamedTemporaryFile(
+        dir=UPLOAD_TMP_DIR, prefix="upload-", delete=False)
+    state = {"part": None, "header_field": b"", "header_value": b"",
+             "file": None, "size": 0, "error": None}
+
+    def on_part_begin():
+        state["part"] = _Part()
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["part"].headers[state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        part = state["part"]
+        _, disposition = parse_options_header(
+            part.headers.get(b"content-disposition", b""))
+        part.name = disposition.get(b"name", b"").decode("utf-8")
+        if b"filename" in disposition:
+            part.filename = disposition[b"filename"].decode("utf-8")
+            part.content_type = part.headers.get(
+                b"content-type", b"application/octet-stream").decode("latin-1")
+
+    def on_part_data(data, start, end):
+        part = state["part"]
+        chunk = data[start:end]
+        if part.filename is not None and part.name == file_field:
+            if state["file"] is None:
+                state["file"] = part
+            elif state["file"] is not part:
+                # Only the first file part is kept
+                return
+            state["size"] += len(chunk)
+            if state["size"] > max_bytes:
+                state["error"] = UploadTooLarge(max_bytes)
+                return
+            digest.update(chunk)
+            spool.write(chunk)
+        elif part.filename is None:
+            part.value += chunk
+            if len(part.value) > MAX_FIELD_BYTES:
+                state["error"] = UploadError(f"Field {part.name} is too large")
+
+    def on_part_end():
+        part = state["part"]
+        if part.filename is None and part.name:
+            fields[part.name] = part.value.decode("utf-8")
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if state["error"]:
+                raise state["error"]
+        parser.finalize()
+        spool.close()
+
+        if state["file"] is None:
+            raise UploadError(f"Missing file field '{file_field}'")
+    except Exception:
+        spool.close()
+        os.remove(spool.name)
+        raise
+
+    return SpooledUpload(
+        path=spool.name,
+        sha256=digest.hexdigest(),
+        size=state["size"],
+        filename=state["file"].filename,
+        content_type=state["file"].content_type,
+        fields=fields,
+    )
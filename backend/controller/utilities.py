@@ -1,104 +1,296 @@
 import base64
-import PyPDF2
 from io import BytesIO
 from PIL import Image
 import pytesseract
 import os
 import logging
-from typing import Union, Optional
+import time
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Union, Optional, Dict, List, Callable
 import fitz  # PyMuPDF
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump whenever extraction output can change, so cached text from an older
+# extractor is not reused (see extractionCache.py)
+EXTRACTOR_VERSION = "3"
 
-def extract_text_from_pdf(file_bytes: Union[bytes, BytesIO]) -> str:
+# Prefixes of the messages process_file returns instead of raising
+EXTRACTION_ERROR_PREFIXES = (
+    "[Error extracting",
+    "Error processing file",
+    "Error: Invalid base64 data",
+    "Unsupported input type",
+    "Unsupported or unknown file type",
+)
+
+
+def is_extraction_error(text: str) -> bool:
+    """Whether text is an error message from process_file rather than file text."""
+    return text.startswith(EXTRACTION_ERROR_PREFIXES)
+
+
+# OCR settings: size of the OCR process pool shared by all ingestion jobs,
+# render resolution and the wall-clock budget for OCR of one document
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "300"))
+# Documents each OCR worker keeps open between pages
+OCR_OPEN_DOCUMENTS = 4
+
+
+class OCRTimeout(Exception):
+    """OCR of a document did not finish within its budget.
+
+    results holds the pages that did finish, so callers can report on them,
+    but the document's text is incomplete and must not be stored as if whole.
+    """
+
+    def __init__(self, results: Dict[int, str], total: int, timeout: Optional[float]):
+        super().__init__(
+            f"OCR timed out after {timeout}s with {len(results)}/{total} pages done")
+        self.results = results
+
+
+# Documents opened by this OCR worker process, keyed by (path, mtime, size)
+# so a reused temp path is never mistaken for the old file. Only used in
+# pool workers: the in-process path opens its own document, since ingestion
+# jobs run in parallel threads of the same process
+_ocr_documents = OrderedDict()
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def _open_pdf(pdf_source: Union[bytes, str]):
+    if isinstance(pdf_source, str):
+        return fitz.open(pdf_source, filetype="pdf")
+    return fitz.open(stream=pdf_source, filetype="pdf")
+
+
+def _worker_document(doc_key):
+    doc = _ocr_documents.pop(doc_key, None)
+    if doc is None:
+        doc = _open_pdf(doc_key[0])
+        while len(_ocr_documents) >= OCR_OPEN_DOCUMENTS:
+            _ocr_documents.popitem(last=False)[1].close()
+    _ocr_documents[doc_key] = doc
+    return doc
+
+
+def _ocr_document_page(doc, page_index: int, dpi: int, deadline: Optional[float] = None) -> str:
+    """Render one page of doc in grayscale and OCR it.
+
+    deadline is a time.time() value. tesseract is killed if it is still
+    running then, so a page never outlives its document's budget.
+    """
+    tesseract_timeout = 0
+    if deadline is not None:
+        tesseract_timeout = deadline - time.time()
+        if tesseract_timeout <= 0:
+            raise TimeoutError("OCR deadline passed")
+    pix = doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    img = Image.frombytes("L", [pix.width, pix.height], pix.samples)
+    return pytesseract.image_to_string(img, timeout=tesseract_timeout)
+
+
+def _ocr_page(doc_key, page_index: int, dpi: int, deadline: Optional[float]):
+    """OCR one page of a document in an OCR worker process."""
+    return page_index, _ocr_document_page(_worker_document(doc_key), page_index, dpi, deadline)
+
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            # Spawned rather than forked: ingestion calls this from several
+            # threads, and a forked child can inherit locks another thread held
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _ocr_pool
+
+
+def _stop_ocr_pool(pool: ProcessPoolExecutor):
+    """Drop queued pages and kill the pool's worker processes."""
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def _discard_ocr_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next document starts a fresh one."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is pool:
+            _ocr_pool = None
+    _stop_ocr_pool(pool)
+
+
+def shutdown_ocr_pool():
+    """Stop the shared OCR worker processes, abandoning any pages in flight."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        pool, _ocr_pool = _ocr_pool, None
+    if pool is not None:
+        _stop_ocr_pool(pool)
+
+
+def ocr_pdf_pages(pdf_source: Union[bytes, str], page_indices: List[int], workers: int = OCR_WORKERS,
+                  dpi: int = OCR_DPI, timeout: Optional[float] = OCR_TIMEOUT,
+                  on_page: Optional[Callable[[int], None]] = None) -> Dict[int, str]:
     """
-    Extract text from a PDF file, with OCR fallback for image-based PDFs.
+    OCR the given pages of a PDF on the shared OCR process pool.
+
+    The pool has OCR_WORKERS processes for the whole backend, however many
+    documents are ingested at once. Each document keeps at most workers pages
+    in the pool at a time, and workers keep recently used documents open
+    between pages. tesseract is stopped at the deadline, so pages of a timed
+    out document do not keep running in the pool.
 
     Args:
-        file_bytes: PDF file content as bytes or BytesIO object
+        pdf_source: PDF file content, or a path so workers read it from disk
+        page_indices: Zero-based indices of the pages to OCR
+        workers: Maximum number of this document's pages OCR'd at once. 1 OCRs
+            in this process instead of the pool.
+        dpi: Render resolution for OCR
+        timeout: Wall-clock budget for the whole document, None for no limit
+        on_page: Optional callback, called with each page index once it is OCR'd
 
     Returns:
-        Extracted text as string
+        Dict of page index to OCR text. A page that fails to OCR is logged
+        and left out.
+
+    Raises:
+        OCRTimeout: If timeout seconds pass before every page is done
     """
-    try:
-        if isinstance(file_bytes, bytes):
-            pdf_file = BytesIO(file_bytes)
-        else:
-            pdf_file = file_bytes
-            # Create a copy to use for fitz later
-            pdf_file_copy = BytesIO(pdf_file.getvalue())
-            pdf_file.seek(0)  # Reset position for PyPDF2
+    results = {}
+    if not page_indices:
+        return results
 
-        # First try using PyPDF2 for text extraction
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = []
-        pages_with_text = 0
+    deadline = time.time() + timeout if timeout is not None else None
+    workers = max(1, min(workers, OCR_WORKERS, len(page_indices)))
 
-        for i, page in enumerate(pdf_reader.pages):
-            page_text = page.extract_text()
-            if page_text and len(page_text.strip()) > 0:
-                text.append(page_text)
-                pages_with_text += 1
-            else:
-                logger.warning(
-                    f"No text extracted from page {i+1} with PyPDF2")
+    if workers == 1:
+        # Not worth a trip through the pool for a single page or worker
+        with _open_pdf(pdf_source) as doc:
+            for page_index in page_indices:
+                try:
+                    results[page_index] = _ocr_document_page(doc, page_index, dpi, deadline)
+                except Exception as e:
+                    if deadline is not None and time.time() >= deadline:
+                        raise OCRTimeout(results, len(page_indices), timeout)
+                    logger.error(f"OCR failed for page {page_index + 1}: {str(e)}")
+                    continue
+                if on_page:
+                    on_page(page_index)
+        return results
+
+    tmp_path = None
+    if not isinstance(pdf_source, str):
+        # Workers read the document from disk rather than being sent its bytes
+        # with every page
+        fd, tmp_path = tempfile.mkstemp(prefix="ocr-", suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_source)
+        pdf_source = tmp_path
+
+    pool = _get_ocr_pool()
+    stat = os.stat(pdf_source)
+    doc_key = (pdf_source, stat.st_mtime_ns, stat.st_size)
+    pending_pages = list(page_indices)
+    running = set()
+    try:
+        while pending_pages or running:
+            while pending_pages and len(running) < workers:
+                running.add(pool.submit(
+                    _ocr_page, doc_key, pending_pages.pop(0), dpi, deadline))
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            done, running = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                raise OCRTimeout(results, len(page_indices), timeout)
+            for future in done:
+                try:
+                    page_index, page_text = future.result()
+                except BrokenProcessPool:
+                    _discard_ocr_pool(pool)
+                    raise
+                except Exception as e:
+                    if deadline is not None and time.time() >= deadline:
+                        raise OCRTimeout(results, len(page_indices), timeout)
+                    logger.error(f"OCR failed for a page: {str(e)}")
+                    continue
+                results[page_index] = page_text
+                if on_page:
+                    on_page(page_index)
+        return results
+    finally:
+        # Pages still queued are dropped; running ones stop at the deadline
+        for future in running:
+            future.cancel()
+        if tmp_path is not None:
+            os.remove(tmp_path)
+
+
+def extract_text_from_pdf(file_bytes: Union[bytes, BytesIO, str],
+                          progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """
+    Extract text from a PDF file, with OCR fallback for image-based pages.
 
-        # If we got text from all pages, return it
-        if pages_with_text == len(pdf_reader.pages):
-            return "\n\n".join(text)
+    The document is opened once with PyMuPDF. Each page uses its text layer
+    when it has one, and only pages without text are rendered and OCR'd.
 
-        # Otherwise, try PyMuPDF (fitz) as it might be better at text extraction
-        logger.info(
-            "Some pages have no text. Trying PyMuPDF for better extraction...")
+    Args:
+        file_bytes: PDF file content as bytes or BytesIO object, or a file path
+        progress: Optional callback, called with (pages_done, pages_total)
 
+    Returns:
+        Extracted text as string, or an error message if extraction failed or
+        OCR ran out of time
+    """
+    try:
         if isinstance(file_bytes, BytesIO):
-            pdf_file_copy.seek(0)
-            pdf_doc = fitz.open(
-                stream=pdf_file_copy.getvalue(), filetype="pdf")
+            pdf_source = file_bytes.getvalue()
         else:
-            pdf_doc = fitz.open(stream=file_bytes, filetype="pdf")
+            pdf_source = file_bytes
 
         text = []
-        pages_with_text = 0
-
-        for i, page in enumerate(pdf_doc):
-            page_text = page.get_text()
-            if page_text and len(page_text.strip()) > 0:
-                text.append(page_text)
-                pages_with_text += 1
-            else:
-                logger.warning(
-                    f"No text extracted from page {i+1} with PyMuPDF")
-
-        # If we got text from all pages, return it
-        if pages_with_text == len(pdf_doc):
+        needs_ocr = []
+        with _open_pdf(pdf_source) as pdf_doc:
+            for i, page in enumerate(pdf_doc):
+                page_text = page.get_text()
+                if page_text and len(page_text.strip()) > 0:
+                    text.append(page_text)
+                else:
+                    text.append("")
+                    needs_ocr.append(i)
+
+        pages_done = len(text) - len(needs_ocr)
+        if progress:
+            progress(pages_done, len(text))
+
+        if not needs_ocr:
             return "\n\n".join(text)
 
-        # If we still have pages without text, apply OCR
         logger.info(
-            "Some pages still have no text. Applying OCR to extract from images...")
-
-        # Reset text list to contain all pages
-        text = [""] * len(pdf_doc)
-
-        for i, page in enumerate(pdf_doc):
-            # If we already have text for this page from PyMuPDF, use it
-            if i < len(text) and text[i]:
-                continue
+            f"{len(needs_ocr)}/{len(text)} pages have no text layer. Applying OCR to those pages...")
 
-            # Extract images from the page
-            pix = page.get_pixmap(alpha=False)
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-            # Convert to grayscale for better OCR
-            img = img.convert('L')
-
-            # Apply OCR
-            ocr_text = pytesseract.image_to_string(img)
+        def on_page(page_index):
+            nonlocal pages_done
+            pages_done += 1
+            if progress:
+                progress(pages_done, len(text))
 
+        ocr_results = ocr_pdf_pages(pdf_source, needs_ocr, on_page=on_page)
+        for i in needs_ocr:
+            ocr_text = ocr_results.get(i)
             if ocr_text and len(ocr_text.strip()) > 0:
                 text[i] = ocr_text
                 logger.info(
@@ -107,19 +299,24 @@ def extract_text_from_pdf(file_bytes: Union[bytes, BytesIO]) -> str:
                 logger.warning(
                     f"Failed to extract text from page {i+1} even with OCR")
 
-        return "\n\n".join(text)
+        return "\n\n".join(page_text for page_text in text if page_text)
 
+    except OCRTimeout as e:
+        # Returned as an error, not as the pages that finished, so a partial
+        # document is never cached or marked ready as if it were complete
+        logger.error(f"Error extracting text from PDF: {str(e)}")
+        return f"[Error extracting PDF text: {str(e)}]"
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {str(e)}")
         return f"[Error extracting PDF text: {str(e)}]"
 
 
-def extract_text_from_image(file_bytes: Union[bytes, BytesIO]) -> str:
+def extract_text_from_image(file_bytes: Union[bytes, BytesIO, str]) -> str:
     """
     Extract text from an image using OCR.
 
     Args:
-        file_bytes: Image file content as bytes or BytesIO object
+        file_bytes: Image file content as bytes or BytesIO object, or a file path
 
     Returns:
         Extracted text as string
@@ -145,13 +342,17 @@ def extract_text_from_image(file_bytes: Union[bytes, BytesIO]) -> str:
         return f"[Error extracting image text: {str(e)}]"
 
 
-def process_file(file_data: Union[str, bytes, BytesIO], file_type: Optional[str] = None) -> str:
+def process_file(file_data: Union[str, bytes, BytesIO], file_type: Optional[str] = None,
+                 progress: Optional[Callable[[int, int], None]] = None) -> str:
     """
     Process a file and extract text.
 
     Args:
-        file_data: File content as string, bytes, or BytesIO object
+        file_data: File content as string, bytes, or BytesIO object. A string
+            naming an existing file is read from disk by the extractors
+            instead of being loaded into memory.
         file_type: Optional file type hint
+        progress: Optional callback for PDFs, called with (pages_done, pages_total)
 
     Returns:
         Extracted text as string
@@ -162,9 +363,11 @@ def process_file(file_data: Union[str, bytes, BytesIO], file_type: Optional[str]
     try:
         if isinstance(file_data, str):
             if os.path.isfile(file_data):
-                with open(file_data, "rb") as f:
-                    file_content = f.read()
-                file_type = file_data.split('.')[-1].lower()
+                # Keep the path; only the first bytes are read to sniff the type
+                file_content = file_data
+                extension = os.path.splitext(file_data)[1].lstrip('.').lower()
+                if extension:
+                    file_type = extension
 
             elif "," in file_data and ";" in file_data:
                 file_content = base64.b64decode(file_data.split(",")[1])
@@ -192,18 +395,28 @@ def process_file(file_data: Union[str, bytes, BytesIO], file_type: Optional[str]
 
         # Process based on file type
         if file_type in ["pdf"]:
-            return extract_text_from_pdf(file_content)
+            return extract_text_from_pdf(file_content, progress)
         elif file_type in ["jpeg", "jpg", "png", "gif", "bmp", "tiff", "webp"]:
             return extract_text_from_image(file_content)
         else:
-            if isinstance(file_content, bytes):
-                if file_content.startswith(b'%PDF'):
-                    return extract_text_from_pdf(file_content)
-                # Common image signatures
-                elif any(file_content.startswith(sig) for sig in [b'\xff\xd8\xff', b'\x89PNG', b'GIF', b'BM']):
-                    return extract_text_from_image(file_content)
+            if isinstance(file_content, str):
+                with open(file_content, "rb") as f:
+                    head = f.read(8)
+            elif isinstance(file_content, bytes):
+                head = file_content[:8]
+            else:
+                head = b""
+
+            if head.startswith(b'%PDF'):
+                return extract_text_from_pdf(file_content, progress)
+            # Common image signatures
+            elif any(head.startswith(sig) for sig in [b'\xff\xd8\xff', b'\x89PNG', b'GIF', b'BM']):
+                return extract_text_from_image(file_content)
 
             try:
+                if isinstance(file_content, str):
+                    with open(file_content, "rb") as f:
+                        return f.read().decode('utf-8')
                 if isinstance(file_content, bytes):
                     return file_content.decode('utf-8')
                 return str(file_content)
@@ -1,9 +1,6 @@
-import os
-from dotenv import load_dotenv
 from fastapi import Request
 import jwt
-load_dotenv()
-JWT_SECRET = os.getenv("JWT_SECRET")
+from config import get_settings
 
 
 def validateCookie(request: Request):
@@ -12,7 +9,7 @@ def validateCookie(request: Request):
         return {"status": False, "message": "No token found"}
 
     try:
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        decoded_token = jwt.decode(token, get_settings().jwt_secret, algorithms=["HS256"])
         return {"status": True, "userDetails": decoded_token}
     except jwt.ExpiredSignatureError:
         return {"status": False, "message": "Token expired"}
@@ -28,7 +25,7 @@ def validateBearer(request: Request):
     token = auth_header.split("Bearer ")[1]
 
     try:
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        decoded_token = jwt.decode(token, get_settings().jwt_secret, algorithms=["HS256"])
         return {"status": True, "userDetails": decoded_token}
     except jwt.ExpiredSignatureError:
         return {"status": False, "message": "Token expired"}
@@ -1,3 +1,3 @@
 # DB package
 
-from .schemas import User, session, LLMSession, UploadedFile
+from .schemas import User, LLMSession, SessionMessage, UploadedFile, IngestionJob, FileChunk, SearchCacheEntry, ResponseCacheEntry, GraphCheckpoint, GraphCheckpointBlob, GraphCheckpointWrite, SessionLocal, get_engine, get_lock_engine, dispose_engine, check_connection_budget, get_db
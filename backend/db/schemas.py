@@ -1,20 +1,88 @@
-from sqlalchemy import create_engine, Column, String
-from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy.dialects.postgresql import UUID
-import os
-import dotenv
+from sqlalchemy import create_engine, Column, String, Text, Integer, BigInteger, Float, LargeBinary, UniqueConstraint, Index
+from sqlalchemy.orm import declarative_base, sessionmaker, deferred
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
 import uuid
+from functools import lru_cache
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy import ForeignKey
 from sqlalchemy.orm import relationship
 from datetime import datetime
-from sqlalchemy import DateTime
-dotenv.load_dotenv()
+from sqlalchemy import DateTime, text
+import orjson
+from config import get_settings
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-print(DATABASE_URL)
 
-engine = create_engine(DATABASE_URL)
+def _json_serializer(value) -> str:
+    # JSONB values are written with orjson instead of json.dumps; chat
+    # payloads and cached results are the largest things the app stores
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+@lru_cache(maxsize=1)
+def get_engine():
+    """
+    The application's engine, created on first use so importing the models
+    needs neither a database driver nor DATABASE_URL.
+    """
+    settings = get_settings()
+    settings.require("database_url")
+    return create_engine(
+        settings.database_url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        json_serializer=_json_serializer,
+        json_deserializer=orjson.loads,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_lock_engine():
+    """
+    Engine for the per-session advisory locks held across graph turns
+    (controller/checkpointer.py). A holder keeps its connection for the whole
+    model call, so these connections come from a pool of their own, one per
+    admitted agent run, and never take the app pool's from request handlers.
+    """
+    settings = get_settings()
+    settings.require("database_url")
+    return create_engine(
+        settings.database_url,
+        pool_size=settings.agent_max_concurrency,
+        max_overflow=0,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+
+
+def dispose_engine():
+    """Close pooled connections, if the engines were ever created."""
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
+    if get_lock_engine.cache_info().currsize:
+        get_lock_engine().dispose()
+
+
+def check_connection_budget():
+    """
+    Raise RuntimeError if every worker opening its full connection budget
+    (Settings.connection_budget) would exceed the server's max_connections
+    less its superuser reserve.
+    """
+    settings = get_settings()
+    with get_engine().connect() as conn:
+        max_connections = int(conn.execute(text("SHOW max_connections")).scalar())
+        reserved = int(conn.execute(text("SHOW superuser_reserved_connections")).scalar())
+    needed = settings.connection_budget() * settings.web_concurrency
+    if needed > max_connections - reserved:
+        raise RuntimeError(
+            f"{settings.web_concurrency} worker(s) may open {needed} database connections "
+            f"(DB_POOL_SIZE + DB_MAX_OVERFLOW + AGENT_MAX_CONCURRENCY session locks each), "
+            f"more than the {max_connections - reserved} the server allows")
+
 
 Base = declarative_base()
 
@@ -37,34 +105,245 @@ class User(Base):
 
 class LLMSession(Base):
     __tablename__ = "llm_sessions"
+    # Serves the newest-first session listing for a user
+    __table_args__ = (
+        Index("ix_llm_sessions_user_id_created_at", "user_id", "created_at"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey(
         "users.id"), nullable=False)
-    user_input = Column(JSONB, default=lambda: [])
-    ai_response = Column(JSONB, default=lambda: [])
-    chat_history = Column(JSONB, default=[])
+    # Legacy per-session history arrays. Turns are stored in session_messages
+    # now; these are kept only for rows written before the backfill migration
+    # and are deferred so loading a session never pulls them in.
+    user_input = deferred(Column(JSONB, default=lambda: []))
+    ai_response = deferred(Column(JSONB, default=lambda: []))
+    chat_history = deferred(Column(JSONB, default=[]))
     # List of {"request": "...", "response": {...}}
+    # Rolling summary of session_messages with seq < summary_seq, sent in
+    # place of those turns once they no longer fit the history token budget
+    # (controller/memory.py)
+    summary = Column(String, nullable=True)
+    summary_seq = Column(Integer, nullable=False, default=0, server_default="0")
     user = relationship("User", back_populates="sessions")
-    created_at = Column(DateTime, default=datetime.utcnow)
+    messages = relationship(
+        "SessionMessage", back_populates="session", order_by="SessionMessage.seq")
+    # Not nullable: the session listing pages on (created_at, id)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
 
+class SessionMessage(Base):
+    """
+    One message of a chat session. A turn appends a human row and an ai row,
+    so writing a turn is two INSERTs regardless of session length.
+    """
+    __tablename__ = "session_messages"
+    __table_args__ = (UniqueConstraint("session_id", "seq"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    session_id = Column(UUID(as_uuid=True), ForeignKey(
+        "llm_sessions.id", ondelete="CASCADE"), nullable=False)
+    # Position in the session, starting at 0
+    seq = Column(Integer, nullable=False)
+    role = Column(String, nullable=False)  # "human" or "ai"
+    agent_type = Column(String, nullable=True)
+    # Text replayed to the model as conversation history
+    content = Column(String, nullable=False)
+    # human: {"agent_type", "message"} as sent by the client
+    # ai: the agent's structured output
+    payload = Column(JSONB, nullable=True)
+    session = relationship("LLMSession", back_populates="messages")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class UploadedFile(Base):
     __tablename__ = "uploaded_files"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), nullable=False)
-    content = Column(String, nullable=False)
-    base64 = Column(String, nullable=False)
+    # Indexed for the file sidebar, which lists a session's files
+    session_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    # Name the file was uploaded with (NULL for files uploaded before it was kept)
+    filename = Column(String, nullable=True)
+    # Extracted text, filled in by the ingestion job (NULL until it is ready).
+    # Can be megabytes: listings select the columns they need, never whole rows
+    content = Column(String, nullable=True)
+    # File bytes live in the blob store (controller/blobStore.py) under their
+    # SHA-256; the row only keeps the reference, size and MIME type
+    sha256 = Column(String(64), nullable=False, index=True)
+    size = Column(BigInteger, nullable=False)
     fileType = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
 
-Session = sessionmaker(bind=engine)
-session = Session()
+class IngestionJob(Base):
+    """
+    Text extraction for one uploaded file, run in the background by
+    controller/ingestion.py.
+
+    status moves pending -> processing -> ready | failed.
+    """
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    file_id = Column(UUID(as_uuid=True), ForeignKey(
+        "uploaded_files.id", ondelete="CASCADE"), nullable=False, unique=True)
+    status = Column(String, nullable=False, default="pending")
+    pages_total = Column(Integer, nullable=True)
+    pages_done = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class FileChunk(Base):
+    """
+    A slice of an uploaded file's extracted text and its embedding, used to
+    put only the relevant parts of a file in the prompt (controller/retrieval.py).
+    """
+    __tablename__ = "file_chunks"
+    # Also the index for looking up a file's chunks by embedder; rules out a
+    # file being stored twice when two requests index it at once
+    __table_args__ = (UniqueConstraint("file_id", "embedder", "chunk_index"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    file_id = Column(UUID(as_uuid=True), ForeignKey(
+        "uploaded_files.id", ondelete="CASCADE"), nullable=False)
+    # Position in the file, starting at 0
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(String, nullable=False)
+    embedding = Column(ARRAY(Float), nullable=False)
+    # Name of the embedder that produced embedding, e.g. "openai:text-embedding-3-small"
+    embedder = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SearchCacheEntry(Base):
+    """
+    A cached web search result, the shared tier behind the in-memory cache
+    in controller/searchCache.py. Columns are portable so the same table
+    also works in a standalone SQLite file.
+    """
+    __tablename__ = "search_cache"
+
+    # SHA-256 of the tool settings, normalized query and search options
+    key = Column(String(64), primary_key=True)
+    query = Column(String, nullable=False)
+    # The search result as JSON text
+    result = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ResponseCacheEntry(Base):
+    """
+    A stored agent output reused for repeated requests by the response
+    cache (controller/responseCache.py).
+    """
+    __tablename__ = "response_cache"
+    __table_args__ = (
+        Index("ix_response_cache_scope_prompt_key", "scope", "prompt_key"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    agent_type = Column(String, nullable=False)
+    # SHA-256 of the agent fingerprint, file hashes and conversation so far
+    scope = Column(String(64), nullable=False)
+    # SHA-256 of the normalized prompt
+    prompt_key = Column(String(64), nullable=False)
+    prompt = Column(String, nullable=False)
+    embedding = Column(ARRAY(Float), nullable=False)
+    embedder = Column(String, nullable=False)
+    # The agent's structured output
+    result = Column(JSONB, nullable=False)
+    hits = Column(Integer, nullable=False, default=0, server_default="0")
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class GraphCheckpoint(Base):
+    """
+    A LangGraph checkpoint of a chat session's agent graph
+    (controller/agentGraph.py), stored by controller/checkpointer.py.
+    thread_id is the session id. Channel values other than plain scalars
+    live in graph_checkpoint_blobs, so a checkpoint only writes the
+    channels that changed since the previous one.
+    """
+    __tablename__ = "graph_checkpoints"
+
+    thread_id = Column(String, primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    # Time-ordered (uuid6), so the newest checkpoint sorts last
+    checkpoint_id = Column(String, primary_key=True)
+    parent_checkpoint_id = Column(String, nullable=True)
+    # The checkpoint without its blob channel values
+    checkpoint = Column(JSONB, nullable=False)
+    # Named metadata_ because declarative classes reserve metadata
+    metadata_ = Column("metadata", JSONB, nullable=False, default=dict)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class GraphCheckpointBlob(Base):
+    """One version of a graph channel's value, shared by every checkpoint that has that version."""
+    __tablename__ = "graph_checkpoint_blobs"
+
+    thread_id = Column(String, primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    channel = Column(String, primary_key=True)
+    version = Column(String, primary_key=True)
+    # Serializer type tag ("msgpack", "json", "empty", ...) and payload
+    type = Column(String, nullable=False)
+    blob = Column(LargeBinary, nullable=True)
+
+
+class GraphCheckpointWrite(Base):
+    """
+    A write a graph node made during the step after checkpoint_id. Writes of
+    nodes that finished before a run was interrupted are replayed when the
+    run resumes, so those nodes are not run again.
+    """
+    __tablename__ = "graph_checkpoint_writes"
+
+    thread_id = Column(String, primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    checkpoint_id = Column(String, primary_key=True)
+    task_id = Column(String, primary_key=True)
+    idx = Column(Integer, primary_key=True)
+    task_path = Column(String, nullable=False, default="")
+    channel = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    blob = Column(LargeBinary, nullable=True)
+
+
+class _LazySessionmaker(sessionmaker):
+    # Binds to get_engine() when the first session is made
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = _LazySessionmaker()
+
+
+def get_db():
+    """
+    FastAPI dependency that yields a session scoped to a single request.
+
+    The session is rolled back if the request fails and always closed, which
+    returns its connection to the pool.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
-# Base.metadata.create_all(engine)
+# Base.metadata.create_all(get_engine())
 
 # print("Database schema created successfully!")
@@ -1,10 +1,17 @@
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from routes import auth_router, agents_router
 import uvicorn
-from sqlalchemy.exc import SQLAlchemyError, PendingRollbackError
-from db import session
-import traceback
+from db import dispose_engine, check_connection_budget
+from controller.ingestion import recover_ingestion_jobs, shutdown_ingestion, start_ingestion_sweeper
+from controller.telemetry import REGISTRY
+from controller.jsonLogging import configure_logging, shutdown_logging, RequestLoggingMiddleware
+import logging
+
+# Structured JSON logs written off the request path, see controller/jsonLogging.py
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -18,38 +25,42 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestLoggingMiddleware)
 
-# Global middleware to handle SQLAlchemy errors and rollbacks
+# Request handlers get their own session from db.get_db, which rolls back and
+# closes it when the request ends. Release pooled connections on shutdown.
 
 
-@app.middleware("http")
-async def db_session_middleware(request: Request, call_next):
+@app.on_event("startup")
+def check_database_connections():
+    # A misconfigured budget fails the start rather than pool timeouts under load
     try:
-        # Try to process the request normally
-        response = await call_next(request)
-        return response
-    except Exception as e:
-        # If any SQLAlchemy error occurs, ensure the session is rolled back
-        if isinstance(e, SQLAlchemyError) or isinstance(e, PendingRollbackError):
-            try:
-                print(f"Rolling back session due to: {str(e)}")
-                session.rollback()
-            except Exception as rollback_error:
-                print(f"Error during rollback: {str(rollback_error)}")
-                print(traceback.format_exc())
-
-        # Re-raise the original exception to let FastAPI handle it
+        check_connection_budget()
+    except RuntimeError:
         raise
+    except Exception as e:
+        logger.exception(f"Could not check the database connection budget: {str(e)}")
+
 
-# Always ensure connections are returned to the pool
+@app.on_event("startup")
+def start_ingestion():
+    # Pick up uploads whose extraction was queued or interrupted before a restart
+    try:
+        recover_ingestion_jobs()
+    except Exception as e:
+        logger.exception(f"Error recovering ingestion jobs: {str(e)}")
+    # Then keep reclaiming jobs whose worker dies while the app is running
+    start_ingestion_sweeper()
 
 
 @app.on_event("shutdown")
 def shutdown_db_client():
+    shutdown_ingestion()
     try:
-        session.close_all()
+        dispose_engine()
     except Exception as e:
-        print(f"Error closing sessions: {str(e)}")
+        logger.exception(f"Error disposing engine: {str(e)}")
+    shutdown_logging()
 
 
 app.include_router(auth_router, prefix="/api/auth")
@@ -66,6 +77,12 @@ async def hello():
     return {"message": "Hello from the API"}
 
 
+@app.get("/metrics")
+async def metrics():
+    # Prometheus scrape endpoint: chat stage latencies, LLM tokens and tool calls (controller/telemetry.py)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 def main():
     uvicorn.run(app, host="127.0.0.1", port=8000)
 
@@ -1,7 +1,8 @@
 from alembic import context
 from sqlalchemy import pool
 from sqlalchemy import engine_from_config
-from db.schemas import DATABASE_URL, Base
+from db.schemas import Base
+from config import get_settings
 from logging.config import fileConfig
 import os
 import sys
@@ -25,6 +26,7 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
+DATABASE_URL = get_settings().database_url
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
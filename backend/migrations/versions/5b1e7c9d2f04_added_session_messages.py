@@ -0,0 +1,140 @@
+"""Added session_messages
+
+Revision ID: 5b1e7c9d2f04
+Revises: c745c7c4944d
+Create Date: 2026-10-17 10:12:31.418204
+
+"""
+from typing import Sequence, Union
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e7c9d2f04'
+down_revision: Union[str, None] = 'c745c7c4944d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+llm_sessions = sa.table(
+    'llm_sessions',
+    sa.column('id', sa.UUID()),
+    sa.column('user_input', postgresql.JSONB()),
+    sa.column('ai_response', postgresql.JSONB()),
+    sa.column('chat_history', postgresql.JSONB()),
+    sa.column('created_at', sa.DateTime()),
+)
+
+
+def _history_content(chat_history, index, role, fallback):
+    if index < len(chat_history):
+        entry = chat_history[index]
+        if isinstance(entry, dict) and entry.get('type') == role and entry.get('content') is not None:
+            return str(entry['content'])
+    return fallback
+
+
+def _ai_fallback_content(message):
+    if isinstance(message, dict):
+        for key in ('answer', 'output'):
+            if key in message:
+                return str(message[key])
+    return str(message)
+
+
+def _session_rows(session):
+    """Turn the legacy JSONB arrays of one session into session_messages rows."""
+    user_input = session.user_input or []
+    ai_response = session.ai_response or []
+    chat_history = session.chat_history or []
+
+    rows = []
+    for turn in range(max(len(user_input), len(ai_response))):
+        human = user_input[turn] if turn < len(user_input) else {}
+        ai = ai_response[turn] if turn < len(ai_response) else None
+        agent_type = human.get('agent_type') or (ai or {}).get('agent_type')
+
+        rows.append({
+            'id': uuid.uuid4(),
+            'session_id': session.id,
+            'seq': len(rows),
+            'role': 'human',
+            'agent_type': agent_type,
+            'content': _history_content(chat_history, 2 * turn, 'human', str(human.get('message', ''))),
+            'payload': human,
+            'created_at': session.created_at,
+        })
+        if ai is not None:
+            message = ai.get('message')
+            rows.append({
+                'id': uuid.uuid4(),
+                'session_id': session.id,
+                'seq': len(rows),
+                'role': 'ai',
+                'agent_type': agent_type,
+                'content': _history_content(chat_history, 2 * turn + 1, 'ai', _ai_fallback_content(message)),
+                'payload': message,
+                'created_at': session.created_at,
+            })
+    return rows
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    session_messages = op.create_table('session_messages',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('session_id', sa.UUID(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(), nullable=False),
+    sa.Column('agent_type', sa.String(), nullable=True),
+    sa.Column('content', sa.String(), nullable=False),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['llm_sessions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('session_id', 'seq')
+    )
+
+    # Backfill from the JSONB arrays, one session at a time
+    conn = op.get_bind()
+    sessions = conn.execution_options(stream_results=True).execute(
+        sa.select(llm_sessions))
+    for session in sessions:
+        rows = _session_rows(session)
+        if rows:
+            op.bulk_insert(session_messages, rows)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Fold messages written since the upgrade back into the JSONB arrays
+    conn = op.get_bind()
+    messages = conn.execute(sa.text(
+        "SELECT session_id, role, agent_type, content, payload "
+        "FROM session_messages ORDER BY session_id, seq")).fetchall()
+
+    histories = {}
+    for message in messages:
+        history = histories.setdefault(
+            message.session_id, {'user_input': [], 'ai_response': [], 'chat_history': []})
+        history['chat_history'].append(
+            {'type': message.role, 'content': message.content})
+        if message.role == 'human':
+            history['user_input'].append(message.payload or {
+                'agent_type': message.agent_type, 'message': message.content})
+        else:
+            history['ai_response'].append(
+                {'agent_type': message.agent_type, 'message': message.payload})
+
+    for session_id, history in histories.items():
+        conn.execute(
+            llm_sessions.update()
+            .where(llm_sessions.c.id == session_id)
+            .values(**history)
+        )
+
+    op.drop_table('session_messages')
@@ -0,0 +1,61 @@
+"""Added ingestion_jobs
+
+Revision ID: 6e2b9f4c8a15
+Revises: d41c8e5a7f36
+Create Date: 2026-10-17 13:25:47.902316
+
+"""
+from typing import Sequence, Union
+import uuid
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e2b9f4c8a15'
+down_revision: Union[str, None] = 'd41c8e5a7f36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    ingestion_jobs = op.create_table('ingestion_jobs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('file_id', sa.UUID(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('pages_total', sa.Integer(), nullable=True),
+    sa.Column('pages_done', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['file_id'], ['uploaded_files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('file_id')
+    )
+    op.alter_column('uploaded_files', 'content',
+               existing_type=sa.VARCHAR(),
+               nullable=True)
+
+    # Files uploaded before this migration were extracted inline and are ready
+    conn = op.get_bind()
+    file_ids = conn.execute(sa.text('SELECT id FROM uploaded_files')).scalars().all()
+    now = datetime.utcnow()
+    if file_ids:
+        op.bulk_insert(ingestion_jobs, [
+            {'id': uuid.uuid4(), 'file_id': file_id, 'status': 'ready', 'pages_done': 0,
+             'attempts': 1, 'created_at': now, 'updated_at': now}
+            for file_id in file_ids
+        ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("UPDATE uploaded_files SET content = '' WHERE content IS NULL")
+    op.alter_column('uploaded_files', 'content',
+               existing_type=sa.VARCHAR(),
+               nullable=False)
+    op.drop_table('ingestion_jobs')
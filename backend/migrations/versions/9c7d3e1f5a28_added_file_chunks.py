@@ -0,0 +1,41 @@
+"""Added file_chunks
+
+Revision ID: 9c7d3e1f5a28
+Revises: 6e2b9f4c8a15
+Create Date: 2026-10-17 14:02:11.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c7d3e1f5a28'
+down_revision: Union[str, None] = '6e2b9f4c8a15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing files are chunked lazily, the first time they are used in a chat
+    op.create_table('file_chunks',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('file_id', sa.UUID(), nullable=False),
+    sa.Column('chunk_index', sa.Integer(), nullable=False),
+    sa.Column('content', sa.String(), nullable=False),
+    sa.Column('embedding', postgresql.ARRAY(sa.Float()), nullable=False),
+    sa.Column('embedder', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['file_id'], ['uploaded_files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('file_id', 'embedder', 'chunk_index')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('file_chunks')
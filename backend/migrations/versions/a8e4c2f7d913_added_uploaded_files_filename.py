@@ -0,0 +1,30 @@
+"""Added uploaded_files filename and session_id index
+
+Revision ID: a8e4c2f7d913
+Revises: f3b6d0a9c217
+Create Date: 2026-10-17 19:03:27.864150
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8e4c2f7d913'
+down_revision: Union[str, None] = 'f3b6d0a9c217'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('uploaded_files', sa.Column('filename', sa.String(), nullable=True))
+    op.create_index(op.f('ix_uploaded_files_session_id'), 'uploaded_files', ['session_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_uploaded_files_session_id'), table_name='uploaded_files')
+    op.drop_column('uploaded_files', 'filename')
@@ -0,0 +1,37 @@
+"""Added search_cache
+
+Revision ID: b3d8f1a6c240
+Revises: e5a1b8d3c692
+Create Date: 2026-10-17 16:41:27.503912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d8f1a6c240'
+down_revision: Union[str, None] = 'e5a1b8d3c692'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('search_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('query', sa.String(), nullable=False),
+    sa.Column('result', sa.Text(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_search_cache_expires_at'), 'search_cache', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_search_cache_expires_at'), table_name='search_cache')
+    op.drop_table('search_cache')
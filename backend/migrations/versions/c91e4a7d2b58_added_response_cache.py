@@ -0,0 +1,46 @@
+"""Added response_cache
+
+Revision ID: c91e4a7d2b58
+Revises: b3d8f1a6c240
+Create Date: 2026-10-17 17:05:48.129036
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c91e4a7d2b58'
+down_revision: Union[str, None] = 'b3d8f1a6c240'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('response_cache',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('agent_type', sa.String(), nullable=False),
+    sa.Column('scope', sa.String(length=64), nullable=False),
+    sa.Column('prompt_key', sa.String(length=64), nullable=False),
+    sa.Column('prompt', sa.String(), nullable=False),
+    sa.Column('embedding', postgresql.ARRAY(sa.Float()), nullable=False),
+    sa.Column('embedder', sa.String(), nullable=False),
+    sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('hits', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_response_cache_scope_prompt_key', 'response_cache', ['scope', 'prompt_key'], unique=False)
+    op.create_index(op.f('ix_response_cache_expires_at'), 'response_cache', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_response_cache_expires_at'), table_name='response_cache')
+    op.drop_index('ix_response_cache_scope_prompt_key', table_name='response_cache')
+    op.drop_table('response_cache')
@@ -0,0 +1,77 @@
+"""Moved uploads to blob store
+
+Revision ID: d41c8e5a7f36
+Revises: 8a3f2c6e1b97
+Create Date: 2026-10-17 11:48:09.732115
+
+"""
+from typing import Sequence, Union
+import base64
+
+from alembic import op
+import sqlalchemy as sa
+
+from controller.blobStore import get_blob_store
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41c8e5a7f36'
+down_revision: Union[str, None] = '8a3f2c6e1b97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+uploaded_files = sa.table(
+    'uploaded_files',
+    sa.column('id', sa.UUID()),
+    sa.column('base64', sa.String()),
+    sa.column('sha256', sa.String()),
+    sa.column('size', sa.BigInteger()),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('uploaded_files', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.add_column('uploaded_files', sa.Column('size', sa.BigInteger(), nullable=True))
+
+    # Move each base64 blob into the blob store, one row at a time so the
+    # whole table is never held in memory
+    store = get_blob_store()
+    conn = op.get_bind()
+    ids = conn.execute(sa.select(uploaded_files.c.id)).scalars().all()
+    for file_id in ids:
+        encoded = conn.execute(
+            sa.select(uploaded_files.c.base64).where(uploaded_files.c.id == file_id)
+        ).scalar()
+        data = base64.b64decode(encoded or '')
+        conn.execute(
+            uploaded_files.update()
+            .where(uploaded_files.c.id == file_id)
+            .values(sha256=store.put(data), size=len(data))
+        )
+
+    op.alter_column('uploaded_files', 'sha256', nullable=False)
+    op.alter_column('uploaded_files', 'size', nullable=False)
+    op.create_index(op.f('ix_uploaded_files_sha256'), 'uploaded_files', ['sha256'], unique=False)
+    op.drop_column('uploaded_files', 'base64')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('uploaded_files', sa.Column('base64', sa.String(), nullable=True))
+
+    store = get_blob_store()
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(uploaded_files.c.id, uploaded_files.c.sha256)).fetchall()
+    for row in rows:
+        conn.execute(
+            uploaded_files.update()
+            .where(uploaded_files.c.id == row.id)
+            .values(base64=base64.b64encode(store.get(row.sha256)).decode('utf-8'))
+        )
+
+    op.alter_column('uploaded_files', 'base64', nullable=False)
+    op.drop_index(op.f('ix_uploaded_files_sha256'), table_name='uploaded_files')
+    op.drop_column('uploaded_files', 'size')
+    op.drop_column('uploaded_files', 'sha256')
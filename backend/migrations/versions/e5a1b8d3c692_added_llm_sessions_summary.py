@@ -0,0 +1,30 @@
+"""Added llm_sessions summary
+
+Revision ID: e5a1b8d3c692
+Revises: 9c7d3e1f5a28
+Create Date: 2026-10-17 14:48:36.207915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1b8d3c692'
+down_revision: Union[str, None] = '9c7d3e1f5a28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('llm_sessions', sa.Column('summary', sa.String(), nullable=True))
+    op.add_column('llm_sessions', sa.Column('summary_seq', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('llm_sessions', 'summary_seq')
+    op.drop_column('llm_sessions', 'summary')
@@ -1,84 +1,472 @@
 import fastapi
-from fastapi import Response, Request, HTTPException
+from fastapi import Response, Request, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
 import jwt
 import bcrypt
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.exc import SQLAlchemyError
-from db import User, session, LLMSession, UploadedFile
+from db import User, LLMSession, SessionMessage, UploadedFile, IngestionJob, SessionLocal, get_db
 from controller.validateJWT import validateCookie, validateBearer
-from controller.utilities import process_file
-from controller.agents import run_agent_file_content
+from controller.extractionCache import get_extraction_cache
+from controller.searchCache import get_search_cache
+from controller.ingestion import enqueue_ingestion
+from controller.uploads import spool_multipart_upload, UploadError, UploadTooLarge
+from controller.blobStore import get_blob_store
+from controller.retrieval import retrieve_chunks, format_chunks
+from controller.memory import MemoryState
+from controller.responseCache import get_response_cache
+from controller.agents import arun_agent_file_content, cached_turn
+from controller.agentGraph import arun_graph_turn, astream_graph_turn
+from controller.agentOutputs import AGENT_OUTPUT_MODELS
+from controller.modelRegistry import resolve_model, get_models, agent_model_name
+from controller.admission import get_admission, AdmissionRejected
+from controller.resilience import UpstreamError, breaker_stats
+from controller.telemetry import span, traced, annotate
+from controller.serializer import to_jsonable, dumps, agent_output_from_dict
 import uuid
+import math
+import time
+import asyncio
 import base64
 from langchain_core.messages import HumanMessage, AIMessage
 import json
-import copy
-from typing import Any, Dict, List
-import traceback
+from datetime import datetime
+from dataclasses import asdict, replace
+from typing import Any, Dict, List, Optional
+import logging
+import inspect
 from functools import wraps
 
 load_dotenv()
 router = fastapi.APIRouter()
+logger = logging.getLogger(__name__)
 
 session_chat_histories = {}
 
+# How long /chat waits for selected files to finish ingestion before giving up
+CHAT_FILE_WAIT_SECONDS = float(os.getenv("CHAT_FILE_WAIT_SECONDS", "30"))
+FILE_POLL_INTERVAL = 0.5
+
 
 # Define a decorator to handle session cleanup
 def with_session_cleanup(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
+        # Request-scoped session injected by the get_db dependency
+        db = kwargs.get("db")
         try:
-            return await func(*args, **kwargs)
+            if inspect.iscoroutinefunction(func):
+                return await func(*args, **kwargs)
+            # Plain def routes only do blocking database work; run them in a
+            # worker thread, as FastAPI would without this wrapper
+            return await run_in_threadpool(func, *args, **kwargs)
         except HTTPException:
             # We don't rollback for HTTP exceptions as they're expected
             raise
+        except UpstreamError as e:
+            # The model or search provider failed after retries, is behind an
+            # open circuit breaker, or the request ran out of time
+            logger.warning(f"Upstream error in {func.__name__}: {str(e)}")
+            headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after else None
+            raise HTTPException(status_code=e.status_code, detail=f"Error: {str(e)}", headers=headers)
         except SQLAlchemyError as e:
             # Explicitly handle SQLAlchemy errors
-            session.rollback()
-            print(f"SQLAlchemy error in {func.__name__}: {str(e)}")
-            print(traceback.format_exc())
+            if db is not None:
+                db.rollback()
+            logger.exception(f"SQLAlchemy error in {func.__name__}: {str(e)}")
             raise HTTPException(
                 status_code=500, detail=f"Database error: {str(e)}")
         except Exception as e:
             # For any other exception, try to rollback
             try:
-                session.rollback()
+                if db is not None:
+                    db.rollback()
             except Exception as rollback_error:
-                print(f"Error during rollback: {str(rollback_error)}")
+                logger.error(f"Error during rollback: {str(rollback_error)}")
 
-            print(f"Error in {func.__name__}: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception(f"Error in {func.__name__}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
     return wrapper
 
 
+# Characters of extracted text /get_files sends as a file's content preview
+FILE_PREVIEW_LENGTH = 200
+FILES_BATCH_MAX_SESSIONS = 100
+
+
+def _list_files(db: Session, session_ids: List[uuid.UUID], preview: bool = False) -> Dict[str, list]:
+    """
+    Metadata of the files of several sessions in one query, oldest first:
+    session id -> list of {id, name, file_type, size, page_count, status, created_at}.
+
+    Only metadata columns are selected, never the extracted text; with
+    preview, its length and first FILE_PREVIEW_LENGTH characters are
+    computed in the database and added as content_length and content.
+    """
+    columns = [
+        UploadedFile.id, UploadedFile.session_id, UploadedFile.filename, UploadedFile.fileType,
+        UploadedFile.size, UploadedFile.created_at, IngestionJob.status, IngestionJob.pages_total,
+        UploadedFile.content.isnot(None).label("extracted"),
+    ]
+    if preview:
+        columns += [
+            func.length(UploadedFile.content).label("content_length"),
+            func.substr(UploadedFile.content, 1, FILE_PREVIEW_LENGTH).label("preview"),
+        ]
+    rows = db.query(*columns).outerjoin(
+        IngestionJob, IngestionJob.file_id == UploadedFile.id
+    ).filter(
+        UploadedFile.session_id.in_(session_ids)
+    ).order_by(UploadedFile.created_at, UploadedFile.id).all()
+
+    files = {str(session_id): [] for session_id in session_ids}
+    for row in rows:
+        entry = {
+            "id": str(row.id),
+            "name": row.filename,
+            "file_type": row.fileType,
+            "size": row.size,
+            "page_count": row.pages_total,
+            # Files extracted before ingestion jobs existed have no job
+            "status": row.status or ("ready" if row.extracted else "pending"),
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+        }
+        if preview:
+            entry["content_length"] = row.content_length or 0
+            entry["content"] = row.preview or ""
+        files[str(row.session_id)].append(entry)
+    return files
+
+
+def _owned_sessions(db: Session, email: str, session_uuids: List[uuid.UUID]) -> List[uuid.UUID]:
+    """The ids among session_uuids of sessions belonging to the user with this email."""
+    db_user = db.query(User).filter(User.email == email).first()
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return [session_id for (session_id,) in db.query(LLMSession.id).filter(
+        LLMSession.id.in_(session_uuids),
+        LLMSession.user_id == db_user.id
+    ).all()] if session_uuids else []
+
+
+def _owned_files(db: Session, email: str, session_uuids: List[uuid.UUID]) -> Dict[str, list]:
+    owned = _owned_sessions(db, email, session_uuids)
+    files = _list_files(db, owned) if owned else {}
+    logger.debug("Listed files of sessions", extra={
+        "sessions": len(owned), "files": sum(len(entries) for entries in files.values())})
+    return files
+
+
 @router.get("/get_files/{session_id}")
 @with_session_cleanup
-async def get_files(request: Request, session_id: str):
+def get_files(request: Request, session_id: str, db: Session = Depends(get_db)):
     """
-    This route is used to get the files for the session
+    This route is used to get the files for one of the user's sessions
 
     inputs{
         - session_id: str
     }
 
     outputs{
-        - files: list
+        - files: list of {id, name, file_type, size, page_count, status, created_at,
+          content_length, content (the first FILE_PREVIEW_LENGTH characters of the extracted text)}
     }
     """
-    files = session.query(UploadedFile).filter(
-        UploadedFile.session_id == session_id
-    ).all()
-    print("Files: ", files)
+    res = validateBearer(request)
+    if not res["status"]:
+        raise HTTPException(status_code=401, detail=res.get(
+            "message", "Unauthorized"))
+
+    try:
+        session_uuid = uuid.UUID(session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid session id")
+
+    if not _owned_sessions(db, res["userDetails"]["email"], [session_uuid]):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    files = _list_files(db, [session_uuid], preview=True)[str(session_uuid)]
+    logger.debug("Listed session files", extra={"session_id": session_id, "files": len(files)})
     return {"files": files}
 
 
+@router.post("/get_files/batch")
+@with_session_cleanup
+async def get_files_batch(request: Request, db: Session = Depends(get_db)):
+    """
+    This route is used to get the file metadata of several of the user's sessions at once
+
+    inputs {
+        - session_ids: list of str (at most FILES_BATCH_MAX_SESSIONS)
+    }
+
+    outputs {
+        - files: dict of session id to list of {id, name, file_type, size, page_count, status, created_at};
+          sessions that do not exist or belong to another user are left out
+    }
+    """
+    res = validateBearer(request)
+    if not res["status"]:
+        raise HTTPException(status_code=401, detail=res.get(
+            "message", "Unauthorized"))
+
+    data = await request.json()
+    session_ids = data.get("session_ids")
+    if not isinstance(session_ids, list) or len(session_ids) > FILES_BATCH_MAX_SESSIONS:
+        raise HTTPException(
+            status_code=400, detail=f"session_ids must be a list of at most {FILES_BATCH_MAX_SESSIONS} session ids")
+    try:
+        session_uuids = list(dict.fromkeys(uuid.UUID(str(session_id)) for session_id in session_ids))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid session id")
+
+    files = await run_in_threadpool(_owned_files, db, res["userDetails"]["email"], session_uuids)
+    return {"files": files}
+
+
+@router.get("/download_file/{file_id}")
+@with_session_cleanup
+def download_file(request: Request, file_id: str, db: Session = Depends(get_db)):
+    """
+    This route is used to download the original bytes of an uploaded file
+
+    inputs {
+        - file_id: str
+    }
+
+    outputs {
+        - the file, with its stored MIME type
+    }
+    """
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        file_uuid = uuid.UUID(file_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid file id")
+
+    # Another user's file is reported as missing, not as forbidden
+    uploaded_file = db.query(UploadedFile.sha256, UploadedFile.fileType).join(
+        LLMSession, LLMSession.id == UploadedFile.session_id
+    ).join(
+        User, User.id == LLMSession.user_id
+    ).filter(
+        UploadedFile.id == file_uuid,
+        User.email == auth_result["userDetails"]["email"]
+    ).first()
+    if not uploaded_file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    data = get_blob_store().get(uploaded_file.sha256)
+    return Response(content=data, media_type=uploaded_file.fileType)
+
+
+@router.get("/file_status/{file_id}")
+@with_session_cleanup
+def file_status(request: Request, file_id: str, db: Session = Depends(get_db)):
+    """
+    This route is used to poll the text extraction status of an uploaded file
+
+    inputs {
+        - file_id: str
+    }
+
+    outputs {
+        - file_id: str
+        - status: str (pending, processing, ready or failed)
+        - pages_done: int
+        - pages_total: int or null until the page count is known
+        - error: str or null
+    }
+    """
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        file_uuid = uuid.UUID(file_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid file id")
+
+    job = db.query(IngestionJob).join(
+        UploadedFile, UploadedFile.id == IngestionJob.file_id
+    ).join(
+        LLMSession, LLMSession.id == UploadedFile.session_id
+    ).join(
+        User, User.id == LLMSession.user_id
+    ).filter(
+        IngestionJob.file_id == file_uuid,
+        User.email == auth_result["userDetails"]["email"]
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return {
+        "file_id": file_id,
+        "status": job.status,
+        "pages_done": job.pages_done,
+        "pages_total": job.pages_total,
+        "error": job.error
+    }
+
+
+@router.get("/extraction_cache_stats")
+@with_session_cleanup
+async def extraction_cache_stats(request: Request):
+    """
+    This route is used to get hit/miss counters for the extracted text cache
+
+    outputs {
+        - hits: int
+        - misses: int
+        - hit_rate: float
+        - bytes: int
+        - max_bytes: int
+        - extractor_version: str
+    }
+    """
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return get_extraction_cache().stats()
+
+
+@router.get("/search_cache_stats")
+@with_session_cleanup
+async def search_cache_stats(request: Request):
+    """
+    This route is used to get hit/miss counters for the web search cache
+
+    outputs {
+        - hits: int (memory_hits + store_hits + coalesced)
+        - memory_hits: int
+        - store_hits: int
+        - coalesced: int (calls that waited on an identical in-flight search)
+        - misses: int (searches sent to Tavily)
+        - errors: int (searches whose result was not cached)
+        - hit_rate: float
+        - entries: int
+        - max_entries: int
+        - in_flight: int
+        - ttl_seconds: int
+        - store: str or null
+    }
+    """
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return get_search_cache().stats()
+
+
+@router.get("/response_cache_stats")
+@with_session_cleanup
+async def response_cache_stats(request: Request):
+    """
+    This route is used to get hit/miss counters for the agent response cache
+
+    outputs {
+        - enabled: bool
+        - hits: int (exact_hits + similar_hits)
+        - exact_hits: int
+        - similar_hits: int (served for a prompt above the similarity threshold)
+        - misses: int
+        - stores: int
+        - hit_rate: float
+        - similarity: float
+        - ttl_seconds: dict of agent type to freshness, 0 when not cached
+    }
+    """
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return get_response_cache().stats()
+
+
+@router.get("/admission_stats")
+@with_session_cleanup
+async def admission_stats(request: Request):
+    """
+    This route is used to get the load on the agent admission queue
+
+    outputs {
+        - in_flight: int (agent runs holding a slot)
+        - max_concurrency: int
+        - queued: int (requests waiting for a slot)
+        - queued_users: int
+        - max_queue: int
+        - admitted: int
+        - rate_limited: int (rejected with 429, user over their rate)
+        - queue_full: int (rejected with 429, queue full)
+        - queue_timeouts: int (rejected with 429, waited too long)
+        - wait_ms_p50 / wait_ms_p95 / wait_ms_max: float (queue wait of admitted requests)
+        - avg_service_seconds: float (moving average of an agent run)
+    }
+    """
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return get_admission().stats()
+
+
+@router.get("/upstream_stats")
+@with_session_cleanup
+async def upstream_stats(request: Request):
+    """
+    This route is used to get the circuit breaker state of each model and search provider
+
+    outputs {
+        - <breaker name, e.g. llm:openai or search:tavily>: {
+            - state: str (closed, open or half_open)
+            - consecutive_failures: int
+            - trips: int (times the breaker opened)
+            - rejected: int (calls failed fast while open)
+        }
+    }
+    """
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return breaker_stats()
+
+
+@router.get("/models")
+@with_session_cleanup
+async def list_models(request: Request):
+    """
+    This route is used to list the models a chat request can pick
+
+    outputs {
+        - models: list of {name, provider, model, temperature, max_tokens, timeout}
+        - agent_models: dict of agent type to the name of its default model
+    }
+    """
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return {
+        "models": [{"name": name, **asdict(spec)} for name, spec in get_models().items()],
+        "agent_models": {agent_type: agent_model_name(agent_type) for agent_type in AGENT_OUTPUT_MODELS},
+    }
+
+
 @router.post("/create_session/{session_id}")
 @with_session_cleanup
-async def create_session(request: Request, session_id: str):
+def create_session(request: Request, session_id: str, db: Session = Depends(get_db)):
     """
     Create a new session for the user
     pass in the bearer token in the header
@@ -96,19 +484,19 @@ async def create_session(request: Request, session_id: str):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     email = decoded["userDetails"]["email"]
-    user_id = session.query(User).filter(
+    user_id = db.query(User).filter(
         User.email == email).first().id
 
     llm_Session = LLMSession(user_id=user_id, id=session_id)
-    session.add(llm_Session)
-    session.commit()
+    db.add(llm_Session)
+    db.commit()
 
     return {"session_id": llm_Session.id}
 
 
 @router.post("/upload_file")
 @with_session_cleanup
-async def upload_file(request: Request):
+async def upload_file(request: Request, db: Session = Depends(get_db)):
     """
     This route is used to upload a file to the session
 
@@ -117,106 +505,127 @@ async def upload_file(request: Request):
         - file: fastapi.UploadFile
     }
 
+    The file is streamed to a temp file as it arrives and rejected with 413
+    once it passes UPLOAD_MAX_BYTES. Text extraction runs in the background;
+    poll /file_status/{file_id} until the status is ready before chatting
+    with the file.
+
     outputs {
         - file_id: str
         - session_id: str
+        - name: str or null
+        - file_type: str
+        - status: str (pending)
     }
     """
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
     try:
-        data = await request.form()
-        session_id = data.get("session_id")
-        print("Session ID: ", session_id)
-        file: fastapi.UploadFile = data.get("file")
+        upload = await spool_multipart_upload(request)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        if not session_id or not file:
+    try:
+        session_id = upload.fields.get("session_id")
+
+        if not session_id:
             raise HTTPException(
                 status_code=400, detail="Session ID and file are required")
 
-        auth_result = validateBearer(request)
-        if not auth_result["status"]:
-            raise HTTPException(status_code=401, detail="Unauthorized")
-
-        file_content = await file.read()
-        content_type = file.content_type
-
-        base64_data = base64.b64encode(file_content).decode("utf-8")
-
-        text_content = process_file(file_content)
-
-        uploaded_file = UploadedFile(
-            content=text_content,
-            base64=base64_data,
-            fileType=content_type,
-            session_id=session_id
-        )
-        print("Uploaded file: ", uploaded_file.session_id)
-
-        session.add(uploaded_file)
-        session.commit()
-        session.refresh(uploaded_file)
+        file_id, job_id, status = await run_in_threadpool(_store_upload, db, upload, session_id)
+        enqueue_ingestion(job_id)
 
         return {
-            "file_id": str(uploaded_file.id),
+            "file_id": file_id,
             "session_id": str(session_id),
-            "file_type": content_type,
-            "content_length": len(text_content)
+            "name": upload.filename,
+            "file_type": upload.content_type,
+            "status": status
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in upload_file: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception(f"Error in upload_file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+    finally:
+        upload.cleanup()
 
 
-def clean_dict(data: Any) -> Any:
+def _store_upload(db: Session, upload, session_id: str):
     """
-    Recursively clean a dictionary or list to make it JSON-serializable.
-    Handles HumanMessage objects and other non-serializable types.
+    Store an upload's blob and add its file row and pending ingestion job.
+
+    Returns:
+        tuple: (file id, job id, job status), read before the commit expires the rows
     """
-    if isinstance(data, dict):
-        cleaned = {}
-        for key, value in data.items():
-            if hasattr(value, '__dict__'):  # Handle objects like HumanMessage
-                cleaned[key] = clean_dict(value.__dict__)
-            elif isinstance(value, (dict, list)):
-                cleaned[key] = clean_dict(value)
-            elif isinstance(value, (str, int, float, bool)) or value is None:
-                cleaned[key] = value
-            else:
-                # Convert other non-serializable objects to string as fallback
-                cleaned[key] = str(value)
-        # For HumanMessage-like objects, add default fields if missing
-        if 'content' in cleaned and 'type' not in cleaned:
-            cleaned.update({
-                "type": "human",
-                "additional_kwargs": cleaned.get("additional_kwargs", {}),
-                "response_metadata": cleaned.get("response_metadata", {}),
-                "name": None,
-                "id": None,
-                "example": False
-            })
-        return cleaned
-    elif isinstance(data, list):
-        return [clean_dict(item) for item in data]
-    elif hasattr(data, '__dict__'):  # Handle objects directly
-        return clean_dict(data.__dict__)
-    elif isinstance(data, (str, int, float, bool)) or data is None:
-        return data
-    else:
-        return str(data)  # Fallback for other types
+    # Identical uploads share one blob
+    sha256 = get_blob_store().put_file(upload.path, upload.sha256)
+
+    uploaded_file = UploadedFile(
+        sha256=sha256,
+        filename=upload.filename,
+        size=upload.size,
+        fileType=upload.content_type,
+        session_id=session_id
+    )
+    db.add(uploaded_file)
+    db.flush()
+    logger.info("Stored upload", extra={
+        "session_id": str(session_id), "file_id": str(uploaded_file.id), "size": upload.size})
+    job = IngestionJob(file_id=uploaded_file.id, status="pending")
+    db.add(job)
+    db.flush()
+    file_id, job_id, status = str(uploaded_file.id), job.id, job.status
+    db.commit()
+    return file_id, job_id, status
+
+
+SESSION_PAGE_SIZE = 20
+MESSAGE_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+SESSION_TITLE_LENGTH = 100
+
+
+def _encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("utf-8")
+
+
+def _decode_cursor(cursor: str, *parsers) -> list:
+    """Decode a cursor from _encode_cursor, parsing each value with the matching parser."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError("wrong number of values")
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _page_size(limit: Optional[int], default: int) -> int:
+    if limit is None:
+        return default
+    return max(1, min(limit, MAX_PAGE_SIZE))
 
 
 @router.get("/get_session_history")
 @with_session_cleanup
-async def get_session_history(request: Request):
+def get_session_history(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None, db: Session = Depends(get_db)):
     """
-    This route is used to get the session history, querying by USER_ID gotten from the token
+    This route is used to get the session history, querying by USER_ID gotten from the token.
+    Sessions are returned newest first, one page at a time, without their messages.
 
     inputs {
-       na just token
+       - limit: int (query, optional, default 20, max 100)
+       - cursor: str (query, optional, next_cursor from the previous page)
     }
 
     outputs {
-        - array of session objects
+        - sessions: list of {id, created_at, title}
+        - next_cursor: str or null when there are no more pages
     }
     """
     decoded = validateBearer(request)
@@ -224,34 +633,311 @@ async def get_session_history(request: Request):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     user_email = decoded["userDetails"]["email"]
-    user_obj = session.query(User).filter(
+    user_obj = db.query(User).filter(
         User.email == user_email).first()
 
     if not user_obj:
         raise HTTPException(status_code=404, detail="User not found")
 
-    print("User ID: ", user_obj.id)
-    session_history = session.query(LLMSession).filter(
-        LLMSession.user_id == user_obj.id).all()
+    page_size = _page_size(limit, SESSION_PAGE_SIZE)
+
+    # Title is the first message the user sent, read through the
+    # (session_id, seq) unique index without touching any other message
+    title = select(
+        func.substr(SessionMessage.payload["message"].astext,
+                    1, SESSION_TITLE_LENGTH)
+    ).where(
+        SessionMessage.session_id == LLMSession.id,
+        SessionMessage.seq == 0
+    ).correlate(LLMSession).scalar_subquery()
+
+    query = db.query(LLMSession.id, LLMSession.created_at, title.label("title")).filter(
+        LLMSession.user_id == user_obj.id)
+    if cursor:
+        created_at, session_id = _decode_cursor(
+            cursor, datetime.fromisoformat, uuid.UUID)
+        query = query.filter(tuple_(LLMSession.created_at, LLMSession.id) < (
+            created_at, session_id))
+    rows = query.order_by(LLMSession.created_at.desc(), LLMSession.id.desc()).limit(
+        page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = _encode_cursor([last.created_at.isoformat(), str(last.id)])
+
+    return {
+        "sessions": [
+            {
+                "id": str(row.id),
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "title": row.title
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor
+    }
+
+
+@router.get("/get_session_messages/{session_id}")
+@with_session_cleanup
+def get_session_messages(request: Request, session_id: uuid.UUID, limit: Optional[int] = None, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    This route is used to get one session's messages in order, one page at a time
+
+    inputs {
+        - session_id: UUID
+        - limit: int (query, optional, default 50, max 100)
+        - cursor: str (query, optional, next_cursor from the previous page)
+    }
+
+    outputs {
+        - messages: list of {seq, role, agent_type, payload, created_at}
+        - next_cursor: str or null when there are no more pages
+    }
+    """
+    res = validateBearer(request)
+    if not res["status"]:
+        raise HTTPException(status_code=401, detail=res.get(
+            "message", "Unauthorized"))
+
+    db_user = db.query(User).filter(
+        User.email == res["userDetails"]["email"]).first()
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    owner_id = db.query(LLMSession.user_id).filter(
+        LLMSession.id == session_id).scalar()
+    if owner_id != db_user.id:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    page_size = _page_size(limit, MESSAGE_PAGE_SIZE)
+    after_seq = _decode_cursor(cursor, int)[0] if cursor else -1
+
+    rows = db.query(
+        SessionMessage.seq,
+        SessionMessage.role,
+        SessionMessage.agent_type,
+        SessionMessage.payload,
+        SessionMessage.created_at
+    ).filter(
+        SessionMessage.session_id == session_id,
+        SessionMessage.seq > after_seq
+    ).order_by(SessionMessage.seq).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = _encode_cursor([rows[-1].seq])
+
+    return {
+        "messages": [
+            {
+                "seq": row.seq,
+                "role": row.role,
+                "agent_type": row.agent_type,
+                "payload": row.payload,
+                "created_at": row.created_at.isoformat() if row.created_at else None
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor
+    }
+
+
+@traced("chat.wait_for_files")
+async def _wait_for_files(db: Session, file_ids: List[str]):
+    """
+    Wait until every selected file has finished ingestion.
+
+    Raises 422 if a file failed, and 409 if files are still processing after
+    CHAT_FILE_WAIT_SECONDS.
+    """
+    if not file_ids:
+        return
+
+    deadline = time.monotonic() + CHAT_FILE_WAIT_SECONDS
+    file_uuids = [uuid.UUID(fid) for fid in file_ids]
+    while True:
+        jobs = await run_in_threadpool(_file_jobs, db, file_uuids)
+
+        failed = [job for job in jobs if job.status == "failed"]
+        if failed:
+            raise HTTPException(
+                status_code=422, detail=f"File {failed[0].file_id} could not be processed: {failed[0].error}")
+        if all(job.status == "ready" for job in jobs):
+            return
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=409, detail="Files are still being processed, try again shortly")
+        await asyncio.sleep(FILE_POLL_INTERVAL)
+
+
+def _file_jobs(db: Session, file_uuids: List[uuid.UUID]):
+    jobs = db.query(IngestionJob.file_id, IngestionJob.status, IngestionJob.error).filter(
+        IngestionJob.file_id.in_(file_uuids)
+    ).all()
+    # Release the connection while _wait_for_files sleeps
+    db.commit()
+    return jobs
 
-    # Convert to JSON-serializable format
-    result = []
-    for sess in session_history:
-        result.append({
-            "id": str(sess.id),
-            "user_id": str(sess.user_id),
-            "created_at": sess.created_at.isoformat() if sess.created_at else None,
-            "user_input": sess.user_input or [],
-            "ai_response": sess.ai_response or [],
-            "chat_history": sess.chat_history or []
-        })
 
-    return result
+@traced("chat.load_context")
+def _load_chat_context(db: Session, session_id: str, file_ids: List[str], message: str):
+    """
+    Load the session history, its rolling summary and the reference text from
+    the selected files needed to run a chat turn.
+
+    Only the file chunks most relevant to message are returned (see
+    controller/retrieval.py), not whole files. Blocks on the embedding call,
+    so run it in a worker thread.
+
+    Ends the read transaction before returning so the request's connection goes
+    back to the pool while the agent runs, instead of being held for the whole
+    LLM call.
+    """
+    llm_session_obj = db.query(LLMSession).filter(
+        LLMSession.id == uuid.UUID(session_id)
+    ).first()
+
+    if not llm_session_obj:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    messages = db.query(SessionMessage).filter(
+        SessionMessage.session_id == llm_session_obj.id
+    ).order_by(SessionMessage.seq).all()
+    user_input, ai_response, chat_history = _split_messages(messages)
+    logger.debug("Loaded chat history", extra={"session_id": session_id, "messages": len(chat_history)})
+
+    file_context = None
+
+    if len(file_ids) > 0:
+        with span("chat.retrieve_chunks"):
+            chunks = retrieve_chunks(db, file_ids, message)
+        file_context = format_chunks(chunks) or None
+        logger.debug("Retrieved file chunks", extra={"chunks": len(chunks), "files": len(file_ids)})
+
+    memory = MemoryState(llm_session_obj.summary, llm_session_obj.summary_seq or 0)
+
+    db.commit()
+
+    return memory, user_input, ai_response, chat_history, file_context
+
+
+def _save_chat_turn(db: Session, session_id: uuid.UUID, agent_type: str, message: str,
+                    result: Any, user_input: list, ai_response: list, updated_lang_history: list,
+                    memory: Optional[MemoryState] = None):
+    """
+    Append one turn to the session as new session_messages rows and commit it,
+    along with the rolling summary if the turn extended it.
+
+    Returns the session object sent back to the client.
+    """
+    chat_history = updated_lang_history[:len(user_input) + len(ai_response)]
+    return _save_chat_turns(db, session_id, message, [(agent_type, result, updated_lang_history)],
+                            user_input, ai_response, chat_history, memory)
+
+
+@traced("chat.save_turn")
+def _save_chat_turns(db: Session, session_id: uuid.UUID, message: str, turns: list,
+                     user_input: list, ai_response: list, chat_history: list,
+                     memory: Optional[MemoryState] = None):
+    """
+    Append several answers to the same message to the session in one
+    transaction, in the order given, as if each had been a separate turn.
+
+    turns is a list of (agent_type, result, updated_lang_history), where each
+    updated_lang_history is chat_history plus that agent's new entries.
+
+    The session row is locked while the turns are written so concurrent turns
+    on the same session get consecutive seq numbers.
+
+    Returns the session object sent back to the client.
+    """
+    llm_session_obj = db.query(LLMSession).filter(
+        LLMSession.id == session_id
+    ).with_for_update().one()
+    next_seq = db.query(func.max(SessionMessage.seq)).filter(
+        SessionMessage.session_id == session_id
+    ).scalar()
+    next_seq = 0 if next_seq is None else next_seq + 1
+
+    user_input, ai_response, history = list(user_input), list(ai_response), list(chat_history)
+    for agent_type, result, updated_lang_history in turns:
+        human_payload = {"agent_type": agent_type, "message": message}
+        with span("chat.serialize", agent_type):
+            ai_payload = to_jsonable(result)
+        logger.debug("Cleaned agent result", extra={
+            "agent_type": agent_type, "keys": sorted(ai_payload) if isinstance(ai_payload, dict) else None})
+
+        # Entries appended by the agent after the history loaded for this turn
+        for entry in updated_lang_history[len(chat_history):]:
+            db.add(SessionMessage(
+                session_id=session_id,
+                seq=next_seq,
+                role=entry["type"],
+                agent_type=agent_type,
+                content=entry["content"],
+                payload=human_payload if entry["type"] == "human" else ai_payload,
+            ))
+            history.append(entry)
+            next_seq += 1
+        user_input.append(human_payload)
+        ai_response.append({"agent_type": agent_type, "message": ai_payload})
+    # A concurrent turn may already have stored a summary covering more
+    if memory and memory.summary_seq > (llm_session_obj.summary_seq or 0):
+        llm_session_obj.summary = memory.summary
+        llm_session_obj.summary_seq = memory.summary_seq
+    llm_session_obj.updated_at = datetime.utcnow()
+
+    obj = {
+        "id": str(llm_session_obj.id),
+        "user_id": str(llm_session_obj.user_id),
+        "user_input": user_input,
+        "ai_response": ai_response,
+        "chat_history": history,
+    }
+
+    with span("chat.commit"):
+        db.commit()
+
+    return obj
+
+
+def _split_messages(messages: List[SessionMessage]):
+    """
+    Rebuild the user_input, ai_response and chat_history lists the client
+    expects from a session's messages, in seq order.
+    """
+    user_input, ai_response, chat_history = [], [], []
+    for message in messages:
+        chat_history.append({"type": message.role, "content": message.content})
+        if message.role == "human":
+            user_input.append(message.payload or {
+                "agent_type": message.agent_type, "message": message.content})
+        else:
+            ai_response.append(
+                {"agent_type": message.agent_type, "message": message.payload})
+    return user_input, ai_response, chat_history
+
+
+def _session_dict(llm_session_obj: LLMSession, messages: List[SessionMessage]):
+    user_input, ai_response, chat_history = _split_messages(messages)
+    return {
+        "id": str(llm_session_obj.id),
+        "user_id": str(llm_session_obj.user_id),
+        "created_at": llm_session_obj.created_at.isoformat() if llm_session_obj.created_at else None,
+        "user_input": user_input,
+        "ai_response": ai_response,
+        "chat_history": chat_history
+    }
 
 
 @router.post("/chat")
 @with_session_cleanup
-async def chat(request: Request):
+@traced("chat")
+async def chat(request: Request, db: Session = Depends(get_db)):
     """
     This route is used to chat with the agent
 
@@ -260,6 +946,9 @@ async def chat(request: Request):
         - message: str
         - agent_type: str
         - file_ids: list (reference to the file ID table)
+        - use_cache: bool (optional, default true; false always runs the agent)
+        - model: str or {name, temperature, max_tokens, timeout} (optional, overrides the
+          agent type's model, see controller/modelRegistry.py)
     }
 
     outputs {
@@ -269,91 +958,418 @@ async def chat(request: Request):
         - ai_response: list
         - chat_history: list
     }
+
+    Agent runs go through admission control (controller/admission.py); a
+    request over the user's rate or a full queue gets 429 with Retry-After.
+    Provider failures (controller/resilience.py) answer 502 after retries,
+    503 with Retry-After while a circuit breaker is open, and 504 when the
+    turn outlasts CHAT_DEADLINE_SECONDS.
+
+    The turn runs as a graph checkpointed per session (controller/agentGraph.py):
+    sending the same message again after such a failure resumes the turn
+    after its last finished step.
     """
     data = await request.json()
     session_id = data.get("session_id")
     message = data.get("message")
     agent_type = data.get("agent_type", "general")
     file_ids = data.get("file_ids", [])
+    annotate(agent_type=agent_type, session_id=session_id)
 
     auth_result = validateBearer(request)
     if not auth_result["status"]:
         raise HTTPException(status_code=401, detail="Unauthorized")
+    model = _request_model(agent_type, data)
 
-    llm_session_obj = session.query(LLMSession).filter(
-        LLMSession.id == uuid.UUID(session_id)
-    ).first()
+    await _wait_for_files(db, file_ids)
+    memory, user_input, ai_response, chat_history, file_context = await run_in_threadpool(
+        _load_chat_context, db, session_id, file_ids, message)
 
-    if not llm_session_obj:
-        raise HTTPException(status_code=404, detail="Session not found")
+    cache_key, cached = await _lookup_response(
+        db, data, agent_type, message, file_ids, chat_history, memory, model)
+    if cached is not None:
+        result, updated_lang_history = cached_turn(message, cached, chat_history)
+    else:
+        ticket = await _admit(auth_result["userDetails"]["email"])
+        try:
+            result, updated_lang_history = await arun_graph_turn(
+                message,
+                file_content=file_context,
+                agent_type=agent_type,
+                session_id=session_id,
+                chat_history=chat_history,
+                memory=memory,
+                model=model
+            )
+        finally:
+            ticket.release()
+        if cache_key:
+            await run_in_threadpool(_store_response, db, cache_key, result)
+
+    return await run_in_threadpool(
+        _save_chat_turn, db, uuid.UUID(session_id), agent_type, message, result,
+        user_input, ai_response, updated_lang_history, memory)
+
+
+@traced("chat.admission")
+async def _admit(user: str):
+    """Wait for an agent slot (controller/admission.py), 429 with Retry-After if refused."""
+    try:
+        return await get_admission().acquire(user)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=f"Too many requests: {e.reason}",
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
 
-    session.refresh(llm_session_obj)
-    ai_response = copy.deepcopy(llm_session_obj.ai_response or [])
-    user_input = copy.deepcopy(llm_session_obj.user_input or [])
-    chat_history = copy.deepcopy(llm_session_obj.chat_history or [])
-    print("chat_history: ", chat_history)
 
-    file_contents = {}
-    print("Got initial data")
+async def _admit_all(user: str, agent_types: List[str]):
+    """Admit one agent run per agent type, all or none. Returns agent type -> ticket."""
+    tickets = {}
+    try:
+        for agent_type in agent_types:
+            tickets[agent_type] = await _admit(user)
+    except HTTPException:
+        for ticket in tickets.values():
+            ticket.release()
+        raise
+    return tickets
 
-    if len(file_ids) > 0:
-        uploaded_files = session.query(UploadedFile).filter(
-            UploadedFile.id.in_([uuid.UUID(fid) for fid in file_ids])
-        ).all()
-
-        for file in uploaded_files:
-            file_contents[str(file.id)] = file.content
-    print("File contents: ", file_contents)
-
-    if file_contents:
-        print("Running agent with file content")
-        context_message = message + "\n\n" + \
-            "\n\n".join(file_contents.values())
-        result, updated_lang_history = run_agent_file_content(
-            context_message,
-            file_content=file_contents,
-            agent_type=agent_type,
-            session_id=session_id,
-            chat_history=chat_history
-        )
-    else:
-        print("Running agent")
-        result, updated_lang_history = run_agent_file_content(
-            message,
-            file_content=file_contents,
-            agent_type=agent_type,
-            session_id=session_id,
-            chat_history=chat_history
-        )
-
-    user_input.append({"agent_type": agent_type, "message": message})
-    ai_response.append({"agent_type": agent_type, "message": result})
 
-    obj = {
-        "id": str(llm_session_obj.id),
-        "user_id": str(llm_session_obj.user_id),
-        "user_input": user_input,
-        "ai_response": ai_response,
-        "chat_history": updated_lang_history,
+def _request_model(agent_type: str, data: dict):
+    """Resolve the request's model option, 400 if it is invalid."""
+    try:
+        return resolve_model(agent_type, data.get("model"))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@traced("chat.cache_lookup")
+async def _lookup_response(db: Session, data: dict, agent_type: str, message: str, file_ids: List[str],
+                           chat_history: list, memory: MemoryState, model=None):
+    """
+    Look a chat request up in the response cache (controller/responseCache.py).
+
+    Returns:
+        tuple: (key, cached output). key is None when the request is not
+        cacheable or the client sent use_cache: false; cached output is None
+        on a miss.
+    """
+    response_cache = get_response_cache()
+    if not response_cache.enabled or not data.get("use_cache", True):
+        return None, None
+
+    key = await run_in_threadpool(
+        response_cache.key, db, agent_type, message, file_ids, chat_history, memory, model)
+    if key is None:
+        return None, None
+    return key, await run_in_threadpool(response_cache.lookup, db, key)
+
+
+@traced("chat.cache_store")
+def _store_response(db: Session, key, result: Any):
+    """Save an agent's output in the response cache. Failures are logged only."""
+    if not isinstance(result, dict):
+        return
+    try:
+        # The echoed input messages are not part of the answer
+        output = to_jsonable({k: v for k, v in result.items() if k != "messages"})
+        get_response_cache().store(db, key, output)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Error storing cached response: {str(e)}")
+
+
+def _agent_output(agent_type: str, result: Any) -> Any:
+    """The agent's structured output, or its cleaned result if it does not fit the output model."""
+    try:
+        return agent_output_from_dict(agent_type, result).model_dump()
+    except Exception:
+        return to_jsonable(result)
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+@router.post("/chat/stream")
+@with_session_cleanup
+@traced("chat_stream")
+async def chat_stream(request: Request, db: Session = Depends(get_db)):
+    """
+    Same as /chat, but streams Server-Sent Events while the agent works
+
+    inputs {
+        - session_id: str
+        - message: str
+        - agent_type: str
+        - file_ids: list (reference to the file ID table)
+        - use_cache: bool (optional, default true; false always runs the agent)
+        - model: str or {name, temperature, max_tokens, timeout} (optional, overrides the
+          agent type's model, see controller/modelRegistry.py)
+    }
+
+    events {
+        - start: {session_id, agent_type}, sent immediately
+        - tool_start / tool_end: {tool, input | output}
+        - token: {content}
+        - partial: structured output fields parsed so far
+        - final: {output, session, cached} once the turn is saved, session has the /chat output shape
+          and cached is true when the answer came from the response cache (no other events are sent then)
+        - error: {detail}
+    }
+
+    Refused by admission control like /chat: 429 with Retry-After before any event is sent.
+    """
+    data = await request.json()
+    session_id = data.get("session_id")
+    message = data.get("message")
+    agent_type = data.get("agent_type", "general")
+    file_ids = data.get("file_ids", [])
+    annotate(agent_type=agent_type, session_id=session_id)
+
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if agent_type not in AGENT_OUTPUT_MODELS:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown agent type: {agent_type}")
+    model = _request_model(agent_type, data)
+
+    await _wait_for_files(db, file_ids)
+    memory, user_input, ai_response, chat_history, file_context = await run_in_threadpool(
+        _load_chat_context, db, session_id, file_ids, message)
+    cache_key, cached = await _lookup_response(
+        db, data, agent_type, message, file_ids, chat_history, memory, model)
+    # Admitted before the response starts, so a refusal is still a plain 429
+    ticket = await _admit(auth_result["userDetails"]["email"]) if cached is None else None
+
+    def save(result, updated_lang_history, cached):
+        # The request's session is closed once the endpoint returns,
+        # so the turn is saved with a session owned by the stream
+        with SessionLocal() as stream_db:
+            if cache_key and not cached:
+                _store_response(stream_db, cache_key, result)
+            return _save_chat_turn(
+                stream_db, uuid.UUID(session_id), agent_type, message, result,
+                user_input, ai_response, updated_lang_history, memory)
+
+    async def final_event(result, updated_lang_history, cached=False):
+        cleaned_obj = await run_in_threadpool(save, result, updated_lang_history, cached)
+        output = _agent_output(agent_type, result)
+        return _sse("final", {"output": output, "session": cleaned_obj, "cached": cached})
+
+    async def event_stream():
+        yield _sse("start", {"session_id": session_id, "agent_type": agent_type})
+        try:
+            if cached is not None:
+                result, updated_lang_history = cached_turn(message, cached, chat_history)
+                yield await final_event(result, updated_lang_history, cached=True)
+                return
+
+            async for event in astream_graph_turn(
+                message,
+                file_content=file_context,
+                agent_type=agent_type,
+                session_id=session_id,
+                chat_history=chat_history,
+                memory=memory,
+                model=model
+            ):
+                if event["event"] != "result":
+                    yield _sse(event["event"], event["data"])
+                    continue
+
+                yield await final_event(event["data"]["result"], event["data"]["chat_history"])
+        except Exception as e:
+            logger.exception(f"Error in chat_stream: {str(e)}")
+            yield _sse("error", {"detail": f"Error: {str(e)}"})
+        finally:
+            if ticket:
+                ticket.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also frees the slot if the client disconnects before the stream starts
+        background=BackgroundTask(ticket.release) if ticket else None,
+    )
+
+
+@router.post("/chat/batch")
+@with_session_cleanup
+@traced("chat_batch")
+async def chat_batch(request: Request, db: Session = Depends(get_db)):
+    """
+    Same as /chat, but answers one message with several agent types at once
+
+    The session, files and history are loaded once and shared, and the agents
+    run concurrently, so the request takes about as long as the slowest one.
+    The answers are saved in one transaction, in agent_types order, as if
+    each had been its own /chat turn.
+
+    inputs {
+        - session_id: str
+        - message: str
+        - agent_types: list of distinct agent types
+        - file_ids: list (reference to the file ID table)
+        - use_cache: bool (optional, default true; false always runs the agents)
+        - model: str or {name, temperature, max_tokens, timeout} (optional, used by every agent type)
+        - stream: bool (optional, default false; true sends Server-Sent Events as agents finish)
     }
-    cleaned_obj = clean_dict(obj)
 
-    print("Cleaned obj: ", cleaned_obj)
+    outputs {
+        - results: dict of agent type to {output, cached}
+        - errors: dict of agent type to error detail, for agents that failed
+        - session: the /chat output shape with every answer appended
+    }
 
-    llm_session_obj.user_input = cleaned_obj["user_input"]
-    llm_session_obj.ai_response = cleaned_obj["ai_response"]
-    llm_session_obj.chat_history = cleaned_obj["chat_history"]
-    session.add(llm_session_obj)
+    events (stream: true) {
+        - start: {session_id, agent_types}, sent immediately
+        - result: {agent_type, output, cached}, as each agent finishes
+        - error: {agent_type, detail}, for each agent that failed
+        - final: {session} once the answers are saved, session is null if every agent failed
+    }
 
-    session.commit()
-    session.refresh(llm_session_obj)
+    Fails with the first agent's error when none of them succeed.
+    """
+    data = await request.json()
+    session_id = data.get("session_id")
+    message = data.get("message")
+    agent_types = data.get("agent_types") or []
+    file_ids = data.get("file_ids", [])
 
-    return cleaned_obj
+    auth_result = validateBearer(request)
+    if not auth_result["status"]:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if not isinstance(agent_types, list) or not agent_types or len(set(agent_types)) != len(agent_types):
+        raise HTTPException(
+            status_code=400, detail="agent_types must be a non-empty list of distinct agent types")
+    for agent_type in agent_types:
+        if agent_type not in AGENT_OUTPUT_MODELS:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown agent type: {agent_type}")
+    annotate(agent_types=",".join(agent_types), session_id=session_id)
+    models = {agent_type: _request_model(agent_type, data) for agent_type in agent_types}
+
+    await _wait_for_files(db, file_ids)
+    memory, user_input, ai_response, chat_history, file_context = await run_in_threadpool(
+        _load_chat_context, db, session_id, file_ids, message)
+
+    cache_keys, cached = {}, {}
+    for agent_type in agent_types:
+        cache_keys[agent_type], cached[agent_type] = await _lookup_response(
+            db, data, agent_type, message, file_ids, chat_history, memory, models[agent_type])
+    tickets = await _admit_all(auth_result["userDetails"]["email"],
+                               [agent_type for agent_type in agent_types if cached[agent_type] is None])
+    # Each agent extends its own copy of the history and rolling summary
+    memories = {agent_type: replace(memory) for agent_type in agent_types}
+
+    async def run(agent_type):
+        if cached[agent_type] is not None:
+            return cached_turn(message, cached[agent_type], list(chat_history))
+        try:
+            # Not run on the session's graph thread (controller/agentGraph.py):
+            # the agents run concurrently, and the next /chat turn picks up
+            # the history saved here
+            return await arun_agent_file_content(
+                message,
+                file_content=file_context,
+                agent_type=agent_type,
+                session_id=session_id,
+                chat_history=list(chat_history),
+                memory=memories[agent_type],
+                model=models[agent_type]
+            )
+        finally:
+            tickets[agent_type].release()
+
+    async def finished():
+        # Yields (agent_type, (result, updated_lang_history), error) as each agent finishes
+        tasks = {asyncio.ensure_future(run(agent_type)): agent_type for agent_type in agent_types}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is not None:
+                        logger.error(f"Error in chat_batch ({tasks[task]}): {str(error)}", exc_info=error)
+                    yield tasks[task], None if error else task.result(), error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def save(session_db: Session, answers: dict):
+        turns = [(agent_type, *answers[agent_type]) for agent_type in agent_types if agent_type in answers]
+        # Keep whichever summary got furthest
+        merged = max((memories[agent_type] for agent_type, _, _ in turns), key=lambda m: m.summary_seq)
+        cleaned_obj = _save_chat_turns(session_db, uuid.UUID(session_id), message, turns,
+                                       user_input, ai_response, chat_history, merged)
+        for agent_type, result, _ in turns:
+            if cache_keys[agent_type] and cached[agent_type] is None:
+                _store_response(session_db, cache_keys[agent_type], result)
+        return cleaned_obj
+
+    def save_with_own_session(answers: dict):
+        # The request's session is closed once the endpoint returns
+        with SessionLocal() as session_db:
+            return save(session_db, answers)
+
+    def result_data(agent_type, answer):
+        return {"output": _agent_output(agent_type, answer[0]), "cached": cached[agent_type] is not None}
+
+    if not data.get("stream"):
+        answers, errors = {}, {}
+        async for agent_type, answer, error in finished():
+            if error is not None:
+                errors[agent_type] = error
+            else:
+                answers[agent_type] = answer
+        if not answers:
+            raise errors[agent_types[0]]
+
+        cleaned_obj = await run_in_threadpool(save, db, answers)
+        return {
+            "results": {agent_type: result_data(agent_type, answer) for agent_type, answer in answers.items()},
+            "errors": {agent_type: f"Error: {str(error)}" for agent_type, error in errors.items()},
+            "session": cleaned_obj,
+        }
+
+    async def event_stream():
+        yield _sse("start", {"session_id": session_id, "agent_types": agent_types})
+        answers = {}
+        try:
+            async for agent_type, answer, error in finished():
+                if error is not None:
+                    yield _sse("error", {"agent_type": agent_type, "detail": f"Error: {str(error)}"})
+                    continue
+                answers[agent_type] = answer
+                yield _sse("result", {"agent_type": agent_type, **result_data(agent_type, answer)})
+
+            cleaned_obj = None
+            if answers:
+                cleaned_obj = await run_in_threadpool(save_with_own_session, answers)
+            yield _sse("final", {"session": cleaned_obj})
+        except Exception as e:
+            logger.exception(f"Error in chat_batch: {str(e)}")
+            yield _sse("error", {"detail": f"Error: {str(e)}"})
+
+    def release_all():
+        for ticket in tickets.values():
+            ticket.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Frees the slots if the client disconnects before the stream starts
+        background=BackgroundTask(release_all),
+    )
 
 
 @router.get("/get_session_details/{session_id}")
 @with_session_cleanup
-async def get_session_details(request: Request, session_id: str):
+def get_session_details(request: Request, session_id: str, db: Session = Depends(get_db)):
     """
     This route is used to get the session history
     """
@@ -363,15 +1379,21 @@ async def get_session_details(request: Request, session_id: str):
             "message", "Unauthorized"))
 
     userDetails = res["userDetails"]
-    db_user = session.query(User).filter(
+    db_user = db.query(User).filter(
         User.email == userDetails["email"]).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    session_details = session.query(LLMSession).filter(
+    session_details = db.query(LLMSession).filter(
         LLMSession.id == uuid.UUID(session_id)
     ).first()
-    return {"message": "Session details retrieved successfully", "sessionDetails": session_details}
+    if not session_details:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    messages = db.query(SessionMessage).filter(
+        SessionMessage.session_id == session_details.id
+    ).order_by(SessionMessage.seq).all()
+    return {"message": "Session details retrieved successfully", "sessionDetails": _session_dict(session_details, messages)}
 
 """
 
@@ -1,49 +1,53 @@
 import fastapi
 from fastapi import Response, Request, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import os
-from dotenv import load_dotenv
 import jwt
 import bcrypt
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from db import User, session
+from db import User, get_db
 from controller.validateJWT import validateCookie, validateBearer
-import traceback
+from config import get_settings
+import logging
+import inspect
 from functools import wraps
 
-load_dotenv()
 router = fastapi.APIRouter()
-
-DATABASE_URL = os.getenv("DATABASE_URL")
-JWT_SECRET = os.getenv("JWT_SECRET")
+logger = logging.getLogger(__name__)
 
 
 # Define a decorator to handle session cleanup
 def with_session_cleanup(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
+        # Request-scoped session injected by the get_db dependency
+        db = kwargs.get("db")
         try:
-            return await func(*args, **kwargs)
+            if inspect.iscoroutinefunction(func):
+                return await func(*args, **kwargs)
+            # Plain def routes do blocking database work and bcrypt hashing;
+            # run them in a worker thread, as FastAPI would without this wrapper
+            return await run_in_threadpool(func, *args, **kwargs)
         except HTTPException:
             # We don't rollback for HTTP exceptions as they're expected
             raise
         except SQLAlchemyError as e:
             # Explicitly handle SQLAlchemy errors
-            session.rollback()
-            print(f"SQLAlchemy error in {func.__name__}: {str(e)}")
-            print(traceback.format_exc())
+            if db is not None:
+                db.rollback()
+            logger.exception(f"SQLAlchemy error in {func.__name__}: {str(e)}")
             raise HTTPException(
                 status_code=500, detail=f"Database error: {str(e)}")
         except Exception as e:
             # For any other exception, try to rollback
             try:
-                session.rollback()
+                if db is not None:
+                    db.rollback()
             except Exception as rollback_error:
-                print(f"Error during rollback: {str(rollback_error)}")
+                logger.error(f"Error during rollback: {str(rollback_error)}")
 
-            print(f"Error in {func.__name__}: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception(f"Error in {func.__name__}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
     return wrapper
 
@@ -61,7 +65,7 @@ class LoginSchema(BaseModel):
 
 @router.post("/register")
 @with_session_cleanup
-async def register(user: RegisterSchema):
+def register(user: RegisterSchema, db: Session = Depends(get_db)):
     """
     This route is used to register a new user
 
@@ -74,21 +78,21 @@ async def register(user: RegisterSchema):
     - message: str  
     """
     email = user.email
-    if session.query(User).filter(User.email == email).first():
+    if db.query(User).filter(User.email == email).first():
         raise HTTPException(status_code=400, detail="User already exists")
 
     hashed_password = bcrypt.hashpw(user.password.encode(
         'utf-8'), bcrypt.gensalt()).decode('utf-8')
     new_user = User(name=user.name, email=user.email,
                     password=hashed_password)
-    session.add(new_user)
-    session.commit()
+    db.add(new_user)
+    db.commit()
     return {"message": "Register successful"}
 
 
 @router.post("/login")
 @with_session_cleanup
-async def login(user: LoginSchema, response: Response):
+def login(user: LoginSchema, response: Response, db: Session = Depends(get_db)):
     """
     This route is used to login a user
 
@@ -96,7 +100,7 @@ async def login(user: LoginSchema, response: Response):
     - email: str
     - password: str
     """
-    db_user = session.query(User).filter(User.email == user.email).first()
+    db_user = db.query(User).filter(User.email == user.email).first()
     if not db_user:
         raise HTTPException(status_code=401, detail="User not found")
 
@@ -104,7 +108,7 @@ async def login(user: LoginSchema, response: Response):
         raise HTTPException(status_code=401, detail="Invalid Credentials")
 
     token = jwt.encode({"email": db_user.email},
-                       JWT_SECRET, algorithm="HS256")
+                       get_settings().jwt_secret, algorithm="HS256")
 
     response.set_cookie(
         key="access_token",
@@ -131,7 +135,7 @@ async def logout(response: Response):
 
 @router.get("/protected")
 @with_session_cleanup
-async def protected(request: Request):
+def protected(request: Request, db: Session = Depends(get_db)):
     """
     This route is used to get the user details
 
@@ -145,7 +149,7 @@ async def protected(request: Request):
             "message", "Unauthorized"))
 
     userDetails = res["userDetails"]
-    db_user = session.query(User).filter(
+    db_user = db.query(User).filter(
         User.email == userDetails["email"]).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -155,7 +159,7 @@ async def protected(request: Request):
 
 @router.get("/protected-bearer")
 @with_session_cleanup
-async def protected_bearer(request: Request):
+def protected_bearer(request: Request, db: Session = Depends(get_db)):
     """
     This route is used to get the user details
 
@@ -168,7 +172,7 @@ async def protected_bearer(request: Request):
             "message", "Unauthorized"))
 
     userDetails = res["userDetails"]
-    db_user = session.query(User).filter(
+    db_user = db.query(User).filter(
         User.email == userDetails["email"]).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -0,0 +1,19 @@
+"""
+Unit tests for backend logic that runs without a server, database or API keys.
+
+Run from backend/:  python -m pytest -q
+"""
+import os
+import sys
+import types
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND)
+
+# controller/__init__.py pulls in the web app (FastAPI, JWT validation, the
+# agents). The modules tested here do not need it, so the package is
+# registered bare and its submodules are imported directly.
+if "controller" not in sys.modules:
+    _controller = types.ModuleType("controller")
+    _controller.__path__ = [os.path.join(BACKEND, "controller")]
+    sys.modules["controller"] = _controller
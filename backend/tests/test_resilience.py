@@ -0,0 +1,188 @@
+import asyncio
+
+import pytest
+
+from controller import resilience
+from controller.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+NO_RETRY = RetryPolicy(timeout=None, max_retries=0, backoff_base=0.0, backoff_max=0.0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _fail(error):
+    def fn():
+        raise error
+    return fn
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(resilience.UpstreamError):
+            resilience.call(_fail(Unavailable()), NO_RETRY, breaker)
+    assert breaker.state == "open"
+
+
+def test_opens_after_threshold_and_rejects(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    with pytest.raises(CircuitOpenError):
+        resilience.call(lambda: "ok", NO_RETRY, breaker)
+    assert breaker.stats() == {"state": "open", "consecutive_failures": 2, "trips": 1, "rejected": 1}
+
+
+def test_non_retryable_errors_do_not_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    with pytest.raises(BadRequest):
+        resilience.call(_fail(BadRequest()), NO_RETRY, breaker)
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 31
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_success_closes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 31
+    assert resilience.call(lambda: "ok", NO_RETRY, breaker) == "ok"
+    assert breaker.stats()["state"] == "closed"
+    assert breaker.failures == 0
+
+
+def test_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 31
+    with pytest.raises(resilience.UpstreamError):
+        resilience.call(_fail(Unavailable()), NO_RETRY, breaker)
+    assert breaker.state == "open"
+    assert breaker.opened_at == clock[0]
+    with pytest.raises(CircuitOpenError):
+        resilience.call(lambda: "ok", NO_RETRY, breaker)
+
+
+# The async tests run on the real clock (a patched time.monotonic would stop
+# the event loop's too), with the breaker half-open as soon as it opens
+
+def test_cancelled_probe_frees_half_open():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    _open(breaker)
+
+    async def probe():
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(3600)
+
+        task = asyncio.ensure_future(resilience.acall(slow, NO_RETRY, breaker))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(probe())
+    assert breaker.state == "half_open"
+    assert not breaker._probing
+    # The next call is let through as the probe instead of being rejected
+    assert resilience.call(lambda: "ok", NO_RETRY, breaker) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_closed_stream_frees_half_open(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 31
+
+    chunks = resilience.stream(lambda: iter("abc"), NO_RETRY, breaker)
+    assert next(chunks) == "a"
+    chunks.close()
+
+    assert resilience.call(lambda: "ok", NO_RETRY, breaker) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_cancelled_astream_frees_half_open():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    _open(breaker)
+
+    async def chunks():
+        yield "a"
+        await asyncio.sleep(3600)
+
+    async def consume():
+        async for _ in resilience.astream(chunks, NO_RETRY, breaker):
+            pass
+
+    async def run():
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert resilience.call(lambda: "ok", NO_RETRY, breaker) == "ok"
+    assert breaker.state == "closed"
+
+
+class FlakyEmbedder:
+    name = "flaky:2"
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise Unavailable()
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_guarded_embedder_retries_and_keeps_the_name(clock):
+    inner = FlakyEmbedder(failures=1)
+    retry_once = RetryPolicy(timeout=None, max_retries=1, backoff_base=0.0, backoff_max=0.0)
+    embedder = resilience.GuardedEmbedder(
+        inner, retry_once, CircuitBreaker("embeddings:test", failure_threshold=5, reset_timeout=30))
+
+    assert embedder.name == inner.name
+    assert embedder.embed_query("osmosis") == [1.0, 0.0]
+    assert inner.calls == 2
+
+
+def test_guarded_embedder_fails_fast_when_open(clock):
+    breaker = CircuitBreaker("embeddings:test", failure_threshold=1, reset_timeout=30)
+    inner = FlakyEmbedder(failures=10)
+    embedder = resilience.GuardedEmbedder(inner, NO_RETRY, breaker)
+
+    with pytest.raises(resilience.UpstreamError):
+        embedder.embed_documents(["a"])
+    with pytest.raises(CircuitOpenError):
+        embedder.embed_documents(["a"])
+    assert inner.calls == 1
@@ -0,0 +1,168 @@
+import json
+import sqlite3
+import uuid
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("tiktoken")
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.dialects.postgresql import ARRAY  # noqa: E402
+from sqlalchemy.ext.compiler import compiles  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from db import FileChunk, UploadedFile  # noqa: E402
+from controller.memory import token_encoding  # noqa: E402
+from controller.retrieval import HashEmbedder, chunk_text, index_file_chunks, retrieve_chunks  # noqa: E402
+
+
+@compiles(ARRAY, "sqlite")
+def _array_as_json(type_, compiler, **kw):
+    # Embeddings are stored as JSON text in SQLite and parsed back by the
+    # converter registered below
+    return "JSON_ARRAY"
+
+
+sqlite3.register_converter("JSON_ARRAY", json.loads)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def encoding():
+    try:
+        return token_encoding()
+    except Exception as e:  # the encoding is downloaded on first use
+        pytest.skip(f"tiktoken encoding unavailable: {e}")
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool,
+        connect_args={"check_same_thread": False, "detect_types": sqlite3.PARSE_DECLTYPES})
+
+    @event.listens_for(engine, "connect")
+    def _adapt_lists(dbapi_connection, _):
+        sqlite3.register_adapter(list, json.dumps)
+
+    UploadedFile.__table__.create(engine)
+    FileChunk.__table__.create(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def _file(db, content):
+    # SQLite does not enforce the foreign key, so no session row is needed
+    uploaded = UploadedFile(id=uuid.uuid4(), session_id=uuid.uuid4(), content=content,
+                            sha256="0" * 64, size=len(content), fileType="text/plain")
+    db.add(uploaded)
+    db.commit()
+    return uploaded.id
+
+
+def test_chunk_text_windows_overlap(encoding):
+    text = " ".join(f"word{i}" for i in range(300))
+    chunks = chunk_text(text, chunk_tokens=50, overlap_tokens=10)
+
+    assert len(chunks) > 1
+    assert all(len(encoding.encode(chunk)) <= 50 for chunk in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous.split()[-1] in chunk.split()
+    assert chunks[0].startswith("word0")
+    assert chunks[-1].endswith("word299")
+
+
+def test_chunk_text_short_and_empty():
+    assert chunk_text("", chunk_tokens=50, overlap_tokens=10) == []
+    assert chunk_text("one short line", chunk_tokens=50, overlap_tokens=10) == ["one short line"]
+
+
+def test_retrieve_ranks_matching_chunks_first(db):
+    # Wide enough that these few words do not share buckets
+    embedder = HashEmbedder(dimensions=1024)
+    paragraphs = [
+        "photosynthesis converts light energy into chemical energy in chloroplasts",
+        "the french revolution began in 1789 with the storming of the bastille",
+        "mitochondria produce atp through cellular respiration in the cell",
+    ]
+    file_id = _file(db, "")
+    for index, paragraph in enumerate(paragraphs):
+        db.add(FileChunk(file_id=file_id, chunk_index=index, content=paragraph,
+                         embedding=embedder.embed_query(paragraph), embedder=embedder.name))
+    db.commit()
+
+    top = retrieve_chunks(db, [str(file_id)], "when did the french revolution and the bastille happen",
+                          k=1, embedder=embedder)
+    assert [chunk["chunk_index"] for chunk in top] == [1]
+
+    both = retrieve_chunks(db, [str(file_id)], "photosynthesis chloroplasts mitochondria atp",
+                           k=2, embedder=embedder)
+    # Returned in document order, not score order
+    assert [chunk["chunk_index"] for chunk in both] == [0, 2]
+
+
+def test_retrieve_indexes_unindexed_files_once(db):
+    embedder = HashEmbedder()
+    file_id = _file(db, "gravity pulls objects toward the earth. " * 40)
+
+    first = retrieve_chunks(db, [str(file_id)], "gravity", k=3, embedder=embedder)
+    stored = db.query(FileChunk).filter(FileChunk.file_id == file_id).count()
+    assert first and stored == len(chunk_text(db.get(UploadedFile, file_id).content))
+
+    retrieve_chunks(db, [str(file_id)], "gravity", k=3, embedder=embedder)
+    assert db.query(FileChunk).filter(FileChunk.file_id == file_id).count() == stored
+
+
+def test_reindexing_replaces_chunks(db):
+    embedder = HashEmbedder()
+    file_id = _file(db, "")
+    index_file_chunks(db, file_id, "first version of the text", embedder)
+    db.commit()
+    index_file_chunks(db, file_id, "second version", embedder)
+    db.commit()
+
+    contents = [content for (content,) in db.query(FileChunk.content).filter(FileChunk.file_id == file_id)]
+    assert contents == ["second version"]
+
+
+def test_retrieve_without_files():
+    assert retrieve_chunks(None, [], "anything") == []
+
+
+def test_retrieve_reuses_cached_embeddings(db):
+    embedder = HashEmbedder(dimensions=1024)
+    file_id = _file(db, "")
+    for index, paragraph in enumerate(["tides follow the moon", "volcanoes erupt magma"]):
+        db.add(FileChunk(file_id=file_id, chunk_index=index, content=paragraph,
+                         embedding=embedder.embed_query(paragraph), embedder=embedder.name))
+    db.commit()
+
+    statements = []
+
+    @event.listens_for(db.get_bind(), "before_cursor_execute")
+    def _record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    retrieve_chunks(db, [str(file_id)], "moon tides", k=1, embedder=embedder)
+    assert any("file_chunks.embedding" in statement for statement in statements)
+
+    statements.clear()
+    top = retrieve_chunks(db, [str(file_id)], "magma volcanoes", k=1, embedder=embedder)
+    assert [chunk["content"] for chunk in top] == ["volcanoes erupt magma"]
+    # The second turn reads only the selected chunk's text
+    assert not any("file_chunks.embedding" in statement for statement in statements)
+
+
+def test_reindexing_drops_cached_embeddings(db):
+    embedder = HashEmbedder(dimensions=1024)
+    file_id = _file(db, "")
+    index_file_chunks(db, file_id, "glaciers carve valleys", embedder)
+    db.commit()
+    assert retrieve_chunks(db, [str(file_id)], "glaciers", k=1, embedder=embedder)[0]["content"] == \
+        "glaciers carve valleys"
+
+    index_file_chunks(db, file_id, "deserts receive little rain", embedder)
+    db.commit()
+    assert retrieve_chunks(db, [str(file_id)], "deserts", k=1, embedder=embedder)[0]["content"] == \
+        "deserts receive little rain"
@@ -0,0 +1,216 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from controller import searchCache
+from controller.searchCache import SearchCache, SqlSearchStore, cache_key
+from db import SearchCacheEntry
+
+
+RESULT = {"results": [{"url": "https://example.com", "content": "answer"}]}
+
+
+class Search:
+    """A search function counting its calls, optionally held until released."""
+
+    def __init__(self, result=RESULT, hold=False):
+        self.result = result
+        self.calls = 0
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        if isinstance(self.result, BaseException):
+            raise self.result
+        return self.result
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_equivalent_queries_share_a_key():
+    key, query = cache_key("tavily", {"query": '  What is "Photosynthesis"?  '})
+    assert query == "what is photosynthesis"
+    assert key == cache_key("tavily", {"query": "what is photosynthesis", "include_domains": []})[0]
+    assert key != cache_key("tavily", {"query": "what is photosynthesis", "topic": "news"})[0]
+    assert key != cache_key("tavily:advanced", {"query": "what is photosynthesis"})[0]
+
+
+def test_hit_after_miss():
+    cache, search = SearchCache(), Search()
+    assert cache.get_or_search("k", "q", search) == RESULT
+    assert cache.get_or_search("k", "q", search) == RESULT
+    assert search.calls == 1
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_concurrent_callers_coalesce():
+    cache, search = SearchCache(), Search(hold=True)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_search("k", "q", search)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    _wait_for(lambda: cache.stats()["coalesced"] == 4)
+    search.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert search.calls == 1
+    assert results == [RESULT] * 5
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_async_callers_coalesce():
+    cache, calls = SearchCache(), []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def asearch():
+            calls.append(1)
+            await release.wait()
+            return RESULT
+
+        tasks = [asyncio.ensure_future(cache.aget_or_search("k", "q", asearch)) for _ in range(5)]
+        while cache.stats()["coalesced"] < 4:
+            await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(run()) == [RESULT] * 5
+    assert len(calls) == 1
+
+
+def test_failure_reaches_waiters_and_is_not_cached():
+    cache, search = SearchCache(), Search(result=RuntimeError("search down"), hold=True)
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_search("k", "q", search)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    _wait_for(lambda: cache.stats()["coalesced"] == 2)
+    search.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 3
+    assert cache.stats()["entries"] == 0
+    assert cache.get_or_search("k", "q", Search()) == RESULT
+
+
+def test_cancelled_leader_hands_the_search_to_a_waiter():
+    cache, calls = SearchCache(), []
+
+    async def run():
+        leader_started = asyncio.Event()
+
+        async def asearch():
+            calls.append(1)
+            if len(calls) == 1:
+                leader_started.set()
+                await asyncio.sleep(3600)
+            return RESULT
+
+        leader = asyncio.ensure_future(cache.aget_or_search("k", "q", asearch))
+        await leader_started.wait()
+        follower = asyncio.ensure_future(cache.aget_or_search("k", "q", asearch))
+        while cache.stats()["coalesced"] < 1:
+            await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == RESULT
+    assert len(calls) == 2
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_cancelled_leader_leaves_nothing_behind():
+    cache = SearchCache()
+
+    async def run():
+        async def asearch():
+            await asyncio.sleep(3600)
+
+        leader = asyncio.ensure_future(cache.aget_or_search("k", "q", asearch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(run())
+    assert cache.stats()["in_flight"] == 0
+    assert cache.stats()["errors"] == 0
+    assert cache.get_or_search("k", "q", Search()) == RESULT
+
+
+def test_error_results_are_not_cached():
+    cache, search = SearchCache(), Search(result={"error": "rate limited"})
+    assert cache.get_or_search("k", "q", search) == {"error": "rate limited"}
+    cache.get_or_search("k", "q", search)
+    assert search.calls == 2
+    assert cache.stats()["errors"] == 2
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(searchCache.time, "monotonic", lambda: now[0])
+    cache, search = SearchCache(ttl=60), Search()
+
+    cache.get_or_search("k", "q", search)
+    now[0] += 59
+    cache.get_or_search("k", "q", search)
+    assert search.calls == 1
+    now[0] += 2
+    cache.get_or_search("k", "q", search)
+    assert search.calls == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SearchCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.get_or_search(key, key, Search())
+    cache.get_or_search("a", "a", Search())
+    cache.get_or_search("c", "c", Search())
+
+    search = Search()
+    cache.get_or_search("a", "a", search)
+    cache.get_or_search("b", "b", search)
+    assert search.calls == 1
+
+
+@pytest.fixture
+def store():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    SearchCacheEntry.__table__.create(engine)
+    return SqlSearchStore(engine)
+
+
+def test_store_serves_other_caches(store):
+    SearchCache(store=store).get_or_search("k", "q", Search())
+
+    other, search = SearchCache(store=store), Search()
+    assert other.get_or_search("k", "q", search) == RESULT
+    assert search.calls == 0
+    assert other.stats()["store_hits"] == 1
@@ -0,0 +1,74 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("orjson")
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage  # noqa: E402
+
+from controller.agentOutputs import AGENT_OUTPUT_MODELS, FlashcardResponse, StepResponse  # noqa: E402
+from controller.serializer import (  # noqa: E402
+    agent_output_from_dict, dumps, loads, message_from_dict, message_to_dict, to_jsonable)
+
+
+MESSAGES = [
+    SystemMessage(content="You are a tutor."),
+    HumanMessage(content=[{"type": "text", "text": "Explain osmosis"}], id="m-1"),
+    AIMessage(
+        content="",
+        tool_calls=[{"name": "tavily_search", "args": {"query": "osmosis"}, "id": "call-1"}],
+        additional_kwargs={"refusal": None},
+        response_metadata={"model_name": "gpt-4o", "finish_reason": "tool_calls"},
+        usage_metadata={"input_tokens": 12, "output_tokens": 3, "total_tokens": 15},
+    ),
+    ToolMessage(content='{"results": []}', tool_call_id="call-1", name="tavily_search"),
+    AIMessage(content="Water moves across a membrane."),
+]
+
+
+@pytest.mark.parametrize("message", MESSAGES, ids=lambda m: m.type)
+def test_message_round_trip(message):
+    assert message_from_dict(loads(dumps(message_to_dict(message)))) == message
+    assert message_from_dict(to_jsonable(message)) == message
+
+
+def test_result_with_messages_round_trips():
+    result = {"output": "done", "messages": MESSAGES}
+    data = loads(dumps(result))
+    assert data["output"] == "done"
+    assert [message_from_dict(m) for m in data["messages"]] == MESSAGES
+
+
+@pytest.mark.parametrize("output", [
+    StepResponse(planning_process="plan", problem_identification="algebra",
+                 step_solution="x = 2"),
+    FlashcardResponse(planning_process="plan", organization_approach="by topic",
+                      flashcards=[{"front": "H2O", "back": "water"}], study_tips="repeat"),
+], ids=lambda o: type(o).__name__)
+def test_agent_output_round_trip(output):
+    agent_type = next(t for t, model in AGENT_OUTPUT_MODELS.items() if model is type(output))
+    assert agent_output_from_dict(agent_type, loads(dumps(output))) == output
+
+
+def test_agent_output_rejects_a_mismatched_result():
+    with pytest.raises(ValueError):
+        agent_output_from_dict("step", {"answer": "not a step response"})
+
+
+def test_datetimes_and_uuids():
+    session_id = uuid.uuid4()
+    created_at = datetime(2026, 10, 17, 9, 30, 15, 123456, tzinfo=timezone.utc)
+    data = to_jsonable({"id": session_id, "created_at": created_at, "counts": {session_id: 1}})
+
+    assert uuid.UUID(data["id"]) == session_id
+    assert datetime.fromisoformat(data["created_at"]) == created_at
+    # Non-string keys are written as strings rather than failing
+    assert data["counts"] == {str(session_id): 1}
+
+
+def test_other_values():
+    assert to_jsonable({"tags": {"a"}, "blob": b"\x00\x01"}) == {"tags": ["a"], "blob": "AAE="}
+    assert to_jsonable(ValueError("bad")) == "ValueError: bad"
+    assert to_jsonable(None) is None
@@ -38,14 +38,16 @@ export function AppSidebar({
 }) {
   const { logout, bearerToken } = useAuth();
   const [sessionHistory, setSessionHistory] = useState<any[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [refreshTrigger, setRefreshTrigger] = useState(0);
 
-  const fetchSessionHistory = async () => {
+  const fetchSessionHistory = async (cursor: string | null = null) => {
     if (!bearerToken) return;
 
     try {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
       const response = await fetch(
-        `${API_URL}/api/agents/get_session_history`,
+        `${API_URL}/api/agents/get_session_history${query}`,
         {
           headers: {
             Authorization: `Bearer ${bearerToken}`,
@@ -58,7 +60,10 @@ export function AppSidebar({
       }
 
       const data = await response.json();
-      setSessionHistory(data);
+      setSessionHistory((prev) =>
+        cursor ? [...prev, ...data.sessions] : data.sessions
+      );
+      setNextCursor(data.next_cursor);
     } catch (error) {
       console.error("Error fetching session history:", error);
     }
@@ -122,8 +127,7 @@ export function AppSidebar({
           <SidebarGroupContent>
             <SidebarMenu>
               {sessionHistory.map((session) => {
-                const firstUserInput =
-                  session.user_input?.[0]?.message || "Untitled Session";
+                const firstUserInput = session.title || "Untitled Session";
 
                 return (
                   <SidebarMenuItem key={session.id}>
@@ -141,6 +145,16 @@ export function AppSidebar({
                   </SidebarMenuItem>
                 );
               })}
+              {nextCursor && (
+                <SidebarMenuItem>
+                  <SidebarMenuButton
+                    onClick={() => fetchSessionHistory(nextCursor)}
+                    className="px-4 py-2.5 text-sm text-gray-500 dark:text-gray-400 hover:text-black dark:hover:text-white cursor-pointer"
+                  >
+                    Load more
+                  </SidebarMenuButton>
+                </SidebarMenuItem>
+              )}
             </SidebarMenu>
           </SidebarGroupContent>
         </SidebarGroup>